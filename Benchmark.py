@@ -0,0 +1,178 @@
+"""
+Benchmarks of the driver hot paths against the simulated devices.
+
+    python Benchmark.py                 #Runs and compares with benchmark_baseline.json
+    python Benchmark.py --save          #Runs and stores the results as the new baseline
+    python Benchmark.py --quick         #Shorter runs
+
+Every metric has a direction (higher or lower is better). A metric worse than the baseline
+by more than --tolerance is reported as a regression and the exit code is 1.
+"""
+
+from Modules import Kinesis_Backend, Kinesis_Simulator
+from Modules.Kinesis_InertialMotor import TLKinesisInertialMotor
+from Modules.Kinesis_StrainGauge import TLKinesisStrainGauge
+from Modules.Kinesis_Server import DeviceServer, KinesisClient
+
+from contextlib import redirect_stdout
+import argparse, io, itertools, json, os, platform, statistics, sys, time
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+_serials = itertools.count(1)
+
+def _serial(prefix):
+    return f'{prefix}{900000 + next(_serials):06d}'
+
+def _quiet(function, *args, **kwargs):
+    #The drivers print on start-up.
+    with redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def _metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+def _rate(function, duration):
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for x in range(100): function()
+        count += 100
+    return count / (time.perf_counter() - start)
+
+def bench_bring_up(repeat):
+    totals = []
+    for x in range(repeat):
+        serial = _serial('97')
+        motor = _quiet(TLKinesisInertialMotor, serial, pollingTime = 10, SIMULATION = True)
+        totals.append(motor.StartupTime()['Total'])
+        Kinesis_Simulator.bench.remove_device(serial)
+    return {"bring_up_median": _metric(statistics.median(totals), 's', 'lower'),
+            "bring_up_max": _metric(max(totals), 's', 'lower')}
+
+def bench_position_throughput(duration):
+    serial = _serial('97')
+    motor = _quiet(TLKinesisInertialMotor, serial, pollingTime = 100, SIMULATION = True)
+    rate = _rate(motor.GetCurrentPositionAll, duration)
+    Kinesis_Simulator.bench.remove_device(serial)
+    return {"position_all_rate": _metric(rate, 'calls/s', 'higher')}
+
+def bench_move_latency(moves, polling = (10, 25, 50, 100)):
+    result = {}
+    for interval in polling:
+        serial = _serial('97')
+        Kinesis_Simulator.bench.add_device(serial, step_rate = 2000, step_acc = 100000)
+        motor = _quiet(TLKinesisInertialMotor, serial, pollingTime = interval, SIMULATION = True)
+        latencies = []
+        for x in range(moves):
+            start = time.perf_counter()
+            motor.MoveAbsoluteAsync(1, 10 * (x % 2 + 1)).result()
+            latencies.append(time.perf_counter() - start)
+        Kinesis_Simulator.bench.remove_device(serial)
+        result[f"move_latency_{interval}ms"] = _metric(statistics.median(latencies), 's', 'lower')
+    return result
+
+def bench_callback(duration):
+    serial = _serial('97')
+    motor = _quiet(TLKinesisInertialMotor, serial, pollingTime = 1, SIMULATION = True)
+    device = Kinesis_Simulator.bench.get_device(serial)
+    callbacks, elapsed = device.stats['callbacks'], device.stats['callback_time']
+    time.sleep(duration)
+    callbacks = device.stats['callbacks'] - callbacks
+    elapsed = device.stats['callback_time'] - elapsed
+    Kinesis_Simulator.bench.remove_device(serial)
+    return {"callback_cost": _metric(elapsed / callbacks if callbacks else None, 's', 'lower')}
+
+def bench_reading(duration):
+    serial = _serial('59')
+    gauge = _quiet(TLKinesisStrainGauge, serial, pollingTime = 100, SIMULATION = True)
+    _quiet(gauge.SetDisplayMode, 1)
+    rate = _rate(lambda: gauge.GetReadingExt(False), duration)
+    Kinesis_Simulator.bench.remove_device(serial)
+    return {"reading_rate": _metric(rate, 'samples/s', 'higher')}
+
+def bench_server(count):
+    serial = _serial('97')
+    server = DeviceServer(('127.0.0.1', 0))
+    _quiet(server.Open, serial, pollingTime = 100, SIMULATION = True)
+    client = KinesisClient(server.start())
+    motor = client.device(serial)
+    latencies = []
+    for x in range(count):
+        start = time.perf_counter()
+        motor.GetCurrentPositionAll()
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    futures = [motor.submit('GetCurrentPositionAll') for x in range(count)]
+    futures[-1].result()
+    pipelined = count / (time.perf_counter() - start)
+    client.close()
+    server.stop()
+    Kinesis_Simulator.bench.remove_device(serial)
+    return {"server_latency": _metric(statistics.median(latencies), 's', 'lower'),
+            "server_pipelined_rate": _metric(pipelined, 'calls/s', 'higher')}
+
+def run(quick = False):
+    """
+
+    :param quick: Boolean. Shorter runs, noisier results
+    :return: Dict metric name => {"value", "unit", "better"}
+    """
+    Kinesis_Backend.set_backend('simulated')
+    duration = 0.2 if quick else 1.0
+    results = {}
+    results.update(bench_bring_up(5 if quick else 20))
+    results.update(bench_position_throughput(duration))
+    results.update(bench_move_latency(5 if quick else 20))
+    results.update(bench_callback(duration))
+    results.update(bench_reading(duration))
+    results.update(bench_server(500 if quick else 5000))
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+
+    :param results: Dict returned by run
+    :param baseline: Dict returned by run
+    :param tolerance: float. Relative change allowed
+    :return: List of (name, baseline value, value, relative change) of the regressions
+    """
+    regressions = []
+    for name, metric in results.items():
+        reference = baseline.get(name)
+        if reference is None or not reference["value"] or metric["value"] is None: continue
+        change = metric["value"] / reference["value"] - 1
+        worse = change > tolerance if metric["better"] == 'lower' else change < -tolerance
+        if worse: regressions.append((name, reference["value"], metric["value"], change))
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default = BASELINE)
+    parser.add_argument('--save', action = 'store_true', help = 'store the results as the baseline')
+    parser.add_argument('--tolerance', type = float, default = 0.25)
+    parser.add_argument('--quick', action = 'store_true')
+    parser.add_argument('--json', help = 'also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    for name, metric in results.items():
+        print(f'{name:24s} {metric["value"]:14.6g} {metric["unit"]}')
+    document = {"python": platform.python_version(), "platform": platform.platform(), "metrics": results}
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(document, f, indent = 2)
+    if args.save:
+        with open(args.baseline, 'w') as f: json.dump(document, f, indent = 2)
+        print(f'Baseline saved to {args.baseline}.')
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline. Run with --save to create one.')
+        return 0
+    with open(args.baseline) as f: baseline = json.load(f)["metrics"]
+    regressions = compare(results, baseline, args.tolerance)
+    for name, reference, value, change in regressions:
+        print(f'Regression: {name} {reference:.6g} -> {value:.6g} ({change:+.0%})')
+    if not regressions: print('No regression.')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
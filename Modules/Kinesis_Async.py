@@ -0,0 +1,154 @@
+"""
+asyncio front-end of the K-Cube drivers.
+
+The awaitables wrap the futures resolved by the drivers' message callbacks
+(asyncio.wrap_future hands the result to the event loop with call_soon_threadsafe),
+so waiting for a move or a settings acknowledgement does not hold a thread.
+The blocking methods of the driver not redefined here (Reconnect, ReadQuantities,
+StartStreaming...) are coroutines run in the default executor; the other methods are
+those of the wrapped driver.
+
+    >>> motor = await TLKinesisInertialMotorAsync.create('97101411')
+    >>> await asyncio.gather(*[motor.MoveAbsolute(x+1, 0) for x in range(4)])
+"""
+
+from Modules.Kinesis_InertialMotor import TLKinesisInertialMotor
+from Modules.Kinesis_StrainGauge import TLKinesisStrainGauge
+from Modules.Kinesis_PiezoDriver import TLKinesisPiezoDriver
+
+import asyncio, functools
+
+class _AsyncDriver():
+    _BLOCKING = ('Reconnect',) #Driver methods run in the executor
+
+    def __init__(self, driver, TIMEOUT):
+        self.driver = driver
+        self._timeout = TIMEOUT
+
+    def __getattr__(self, name):
+        attribute = getattr(self.driver, name)
+        if name not in self._BLOCKING: return attribute
+
+        async def blocking(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(None, functools.partial(attribute, *args, **kwargs))
+        blocking.__name__, blocking.__doc__ = name, attribute.__doc__
+        return blocking
+
+    async def _wait(self, future, timeout = None):
+        return await asyncio.wait_for(asyncio.wrap_future(future), self._timeout if timeout is None else timeout)
+
+    async def WaitReady(self, timeout = None):
+        """
+        Waits for the first message sent by the device after StartPolling.
+
+        :param timeout: float (in s). Defaults to TIMEOUT
+        :return: Boolean (True if the device is ready)
+        """
+        try:
+            return await self._wait(self.driver.GetReadyFuture(), timeout)
+        except asyncio.TimeoutError:
+            print('Timeout achieved. Device did not answer after polling started.')
+            return False
+
+    @classmethod
+    async def create(cls, serialno, **kwargs):
+        """
+        Opens the device and waits until it is ready without blocking the event loop.
+
+        :param serialno: str
+        :param kwargs: pollingTime, TIMEOUT, SIMULATION, BUILD_DEVICE_LIST
+        :return: driver
+        """
+        loop = asyncio.get_running_loop()
+        self = await loop.run_in_executor(None, functools.partial(cls, serialno, **kwargs)) #Opening blocks
+        await self.WaitReady()
+        return self
+
+
+class TLKinesisInertialMotorAsync(_AsyncDriver):
+
+    def __init__(self, serialno, pollingTime = 100, TIMEOUT = 5, SIMULATION = False, BUILD_DEVICE_LIST = False):
+        super().__init__(TLKinesisInertialMotor(serialno, pollingTime, TIMEOUT, SIMULATION, BUILD_DEVICE_LIST,
+                                                WAIT_READY = False), TIMEOUT)
+
+    async def MoveRelative(self, channel: int, step: int):
+        """
+
+        :param channel: [1 - 4] for KIM101
+        :param step: int
+        :return: Boolean (True once the channel reached its target)
+        """
+        return await asyncio.wrap_future(self.driver.MoveRelativeAsync(channel, step))
+
+    async def MoveAbsolute(self, channel: int, value: int):
+        """
+
+        :param channel: [1 - 4] for KIM101
+        :param value: int
+        :return: Boolean (True once the channel reached value)
+        """
+        return await asyncio.wrap_future(self.driver.MoveAbsoluteAsync(channel, value))
+
+
+class TLKinesisStrainGaugeAsync(_AsyncDriver):
+    _BLOCKING = ('Reconnect', 'ReadQuantities', 'StartStreaming', 'StartStatistics', 'StopStreaming')
+
+    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False, BUILD_DEVICE_LIST = True):
+        super().__init__(TLKinesisStrainGauge(serialno, pollingTime, TIMEOUT, SIMULATION, BUILD_DEVICE_LIST,
+                                              WAIT_READY = False), TIMEOUT)
+        self.__settings = None
+
+    async def SetDisplayMode(self, mode):
+        """
+
+        :param mode: 1 => Position, 2 => Voltage, 3 => Force
+        :return: Boolean (True once the device acknowledged the settings)
+        """
+        self.__settings = self.driver.SetDisplayModeAsync(mode)
+        try:
+            return await self._wait(self.__settings)
+        except asyncio.TimeoutError:
+            print('Timeout achieved. Display mode was not acknowledged.')
+            return False
+
+    async def GetReadingExt(self, clip):
+        """
+        Waits for the display mode being set, if any, and reads.
+
+        :param clip: Boolean
+        :return: (int, c_bool overrange)
+        """
+        if self.__settings is not None and not self.__settings.done():
+            await self.SetDisplayModeDone()
+        return self.driver.GetReadingExt(clip, wait = False)
+
+    async def SetDisplayModeDone(self):
+        """
+
+        :return: Boolean (True if the last display mode was acknowledged)
+        """
+        if self.__settings is None: return True
+        try:
+            return await self._wait(self.__settings)
+        except asyncio.TimeoutError:
+            print('Timeout achieved. Display mode was not acknowledged.')
+            return False
+
+
+class TLKinesisPiezoDriverAsync(_AsyncDriver):
+
+    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False, BUILD_DEVICE_LIST = True):
+        super().__init__(TLKinesisPiezoDriver(serialno, pollingTime, TIMEOUT, SIMULATION, BUILD_DEVICE_LIST,
+                                              WAIT_READY = False), TIMEOUT)
+
+    async def SetPositionControlMode(self, mode):
+        """
+
+        :param mode: 1 => Open loop, 2 => Closed loop, 3 => Open loop smoothed, 4 => Closed loop smoothed
+        :return: Boolean (True once the device acknowledged the settings)
+        """
+        try:
+            return await self._wait(self.driver.SetPositionControlModeAsync(mode))
+        except asyncio.TimeoutError:
+            print('Timeout achieved. Control mode was not acknowledged.')
+            return False
@@ -0,0 +1,161 @@
+"""
+Library backends used by the drivers' _initialize_library.
+
+'native' loads the ThorLabs DLLs shipped in dlls/ (Windows only).
+'simulated' loads the pure python library of Kinesis_Simulator, so every driver
+can be imported, run and timed on any platform.
+'replay' (registered by Kinesis_Replay.replay) plays back a trace captured from a session.
+
+The backend is chosen by set_backend or by the KINESIS_BACKEND environment variable.
+
+function_table returns the process wide FunctionTable of a DLL: the library is loaded and
+each prototype is declared once, the first time it is used, and shared by every device.
+Call wrappers (add_call_wrapper) are applied when a function is bound, so they cost
+nothing once removed.
+"""
+
+from ctypes import cdll, c_void_p
+
+import os
+import threading
+
+try:
+    from ctypes import WINFUNCTYPE
+except ImportError: #Not on Windows. Callbacks can only come from the simulated library.
+    from ctypes import CFUNCTYPE as WINFUNCTYPE
+
+LOGGERFUNC = WINFUNCTYPE(None, c_void_p)
+
+DLL_PATH = os.path.join(os.path.dirname(__file__), "../dlls")
+
+def _load_native(dllname):
+    return cdll.LoadLibrary(os.path.join(DLL_PATH, dllname))
+
+def _load_simulated(dllname):
+    from Modules.Kinesis_Simulator import SimulatedLibrary
+    return SimulatedLibrary(dllname)
+
+_backends = {
+    'native': _load_native,
+    'simulated': _load_simulated
+}
+
+_backend = os.environ.get('KINESIS_BACKEND', 'native' if os.name == 'nt' else 'simulated')
+
+_tables = {}
+_tables_lock = threading.Lock()
+_wrappers = []
+
+def _buildFunction(call, args, result):
+    call.argtypes = args
+    call.restype = result
+    return call
+
+def register_backend(name, loader):
+    """
+
+    :param name: str
+    :param loader: callable receiving the DLL file name and returning the library object
+    :return: None
+    """
+    _backends[name] = loader
+
+def set_backend(name):
+    """
+
+    :param name: str ('native', 'simulated' or any registered backend)
+    :return: None
+    """
+    if name not in _backends:
+        raise ValueError(f'Unknown backend {name}. Available: {list(_backends)}')
+    global _backend
+    _backend = name
+
+def get_backend():
+    """
+
+    :return: str
+    """
+    return _backend
+
+def load_library(dllname):
+    """
+
+    :param dllname: DLL file name, e.g. Thorlabs.MotionControl.KCube.InertialMotor.dll
+    :return: library object exposing the TLI_ and device prefixed functions
+    """
+    return _backends[_backend](dllname)
+
+class FunctionTable():
+    """
+    Lazily bound functions of one DLL. prototypes maps the attribute name to
+    (DLL function name, argtypes, restype).
+    """
+    def __init__(self, dllname, prototypes, backend):
+        self._dllname = dllname
+        self._prototypes = prototypes
+        self._backend = backend
+        self._library = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        try:
+            function, args, result = self._prototypes[name]
+        except KeyError:
+            raise AttributeError(f'{self._dllname} has no prototype for {name}') from None
+        with self._lock:
+            if self._library is None: self._library = _backends[self._backend](self._dllname)
+            call = _buildFunction(getattr(self._library, function), args, result)
+            for wrapper in _wrappers:
+                call = wrapper(self._dllname, function, call, result)
+            setattr(self, name, call)
+        return call
+
+    def unbind(self):
+        """
+        Forgets the bound functions. They are bound again, with the current wrappers, on next use.
+
+        :return: None
+        """
+        with self._lock:
+            for name in self.bound(): delattr(self, name)
+
+    def bound(self):
+        """
+
+        :return: list of the names already bound
+        """
+        return [x for x in self._prototypes if x in self.__dict__]
+
+def function_table(dllname, prototypes):
+    """
+
+    :param dllname: DLL file name
+    :param prototypes: dict name -> (DLL function name, argtypes, restype)
+    :return: FunctionTable shared by every caller using the same backend and DLL
+    """
+    key = (_backend, dllname)
+    table = _tables.get(key)
+    if table is None:
+        with _tables_lock:
+            table = _tables.setdefault(key, FunctionTable(dllname, prototypes, _backend))
+    return table
+
+def add_call_wrapper(wrapper):
+    """
+
+    :param wrapper: callable(dllname, function name, call, restype) returning the callable to use instead of call
+    :return: None
+    """
+    if wrapper not in _wrappers: _wrappers.append(wrapper)
+    for table in list(_tables.values()): table.unbind()
+
+def remove_call_wrapper(wrapper):
+    """
+
+    :param wrapper: a wrapper given to add_call_wrapper
+    :return: None
+    """
+    if wrapper in _wrappers: _wrappers.remove(wrapper)
+    for table in list(_tables.values()): table.unbind()
@@ -0,0 +1,111 @@
+from ctypes import c_char_p, c_void_p, c_short, c_ulong, c_int, create_string_buffer
+
+from Modules.ErrorEnum import FTDI_COM_ERROR
+from Modules.Kinesis_Backend import function_table
+from Modules.Kinesis_InertialMotor import TLKinesisInertialMotor
+from Modules.Kinesis_StrainGauge import TLKinesisStrainGauge
+from Modules.Kinesis_PiezoDriver import TLKinesisPiezoDriver
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+_PROTOTYPES = {
+    'InitializeSimulations': ('TLI_InitializeSimulations', None, c_void_p),
+    'BuildDeviceList': ('TLI_BuildDeviceList', None, c_short),
+    'GetDeviceListSize': ('TLI_GetDeviceListSize', None, c_short),
+    'GetDeviceListExt': ('TLI_GetDeviceListExt', [c_char_p, c_ulong], c_short),
+    'GetDeviceListByTypeExt': ('TLI_GetDeviceListByTypeExt', [c_char_p, c_ulong, c_int], c_short)
+}
+
+#Product prefix of the serial number => driver class
+DEVICE_TYPES = {
+    97: TLKinesisInertialMotor, #KIM101
+    59: TLKinesisStrainGauge, #KSG101
+    29: TLKinesisPiezoDriver #KPZ101
+}
+
+BUFFER_SIZE = 4096
+
+class TLKinesisDeviceManager():
+
+    def _error_check(self, val):
+        if val != 0: print(f'Error {FTDI_COM_ERROR(val)}')
+        return val
+
+    def __init__(self, SIMULATION = False):
+        self.__lib = function_table("Thorlabs.MotionControl.DeviceManager.dll", _PROTOTYPES)
+        self.__startup = {}
+        if SIMULATION: self.InitializeSimulations()
+
+    def InitializeSimulations(self):
+        """
+
+        :return:
+        """
+        return self.__lib.InitializeSimulations()
+
+    def BuildDeviceList(self):
+        """
+
+        :return: Error Code
+        """
+        return self._error_check(self.__lib.BuildDeviceList())
+
+    def GetDeviceListSize(self):
+        """
+
+        :return: int16
+        """
+        return self.__lib.GetDeviceListSize()
+
+    def GetDeviceList(self, typeID = None):
+        """
+
+        :param typeID: int. Product prefix (97, 59 or 29). All devices if None
+        :return: List of serial numbers (str)
+        """
+        buffer = create_string_buffer(BUFFER_SIZE)
+        if typeID is None:
+            self._error_check(self.__lib.GetDeviceListExt(buffer, BUFFER_SIZE))
+        else:
+            self._error_check(self.__lib.GetDeviceListByTypeExt(buffer, BUFFER_SIZE, typeID))
+        return [x for x in buffer.value.decode().split(',') if x]
+
+    def OpenDevices(self, serials = None, types = tuple(DEVICE_TYPES), max_workers = None, **kwargs):
+        """
+        Builds the device list once and opens the devices concurrently.
+
+        :param serials: list of serial numbers (str). Every listed device of the given types if None
+        :param types: product prefixes used when serials is None
+        :param max_workers: int. Number of threads. One per device if None
+        :param kwargs: passed to every driver constructor (pollingTime, TIMEOUT)
+        :return: Dict serial => driver, only with the devices properly opened
+        """
+        start = time.perf_counter()
+        self.BuildDeviceList()
+        if serials is None:
+            serials = [x for typeID in types for x in self.GetDeviceList(typeID)]
+        devices = {}
+        if not serials: return devices
+
+        def open_device(serial):
+            return DEVICE_TYPES[int(serial[:2])](serial, BUILD_DEVICE_LIST = False, **kwargs)
+
+        with ThreadPoolExecutor(max_workers = max_workers or len(serials)) as pool:
+            futures = {serial: pool.submit(open_device, serial) for serial in serials}
+            for serial, future in futures.items():
+                try:
+                    devices[serial] = future.result()
+                except Exception as e:
+                    print(f'Error opening {serial}: {e}')
+
+        self.__startup = {serial: device.StartupTime() for serial, device in devices.items()}
+        self.__startup['Total'] = time.perf_counter() - start
+        return devices
+
+    def StartupTime(self):
+        """
+
+        :return: Dict with the StartupTime of every device opened by the last OpenDevices and the total (in s)
+        """
+        return dict(self.__startup)
@@ -1,16 +1,20 @@
-from ctypes import cdll, POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
-    c_ulong, c_bool, WINFUNCTYPE, Structure
+from ctypes import POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
+    c_ulong, c_bool, Structure, sizeof
 
 from Modules.ErrorEnum import FTDI_COM_ERROR
-
-import os, time
+from Modules.MessageEnum import MESSAGE_TYPE, GENERIC_MOTOR_MSG
+from Modules.Kinesis_Backend import LOGGERFUNC, function_table
+from Modules.Kinesis_MessagePump import MessagePump
+from Modules.Kinesis_Polling import AdaptivePolling
+from Modules.Kinesis_Jog import JogQueue
+from Modules.Kinesis_Watchdog import ConnectionWatchdog, wait_message
+from Modules.Kinesis_Settings import SettingsCache, hardware_cache, hardware_key, save_profile, load_profile
+from Modules import Kinesis_Instrumentation
+
+from concurrent.futures import Future, wait
+import time
 import threading
 
-def _buildFunction(call, args, result):
-    call.argtypes = args
-    call.restype = result
-    return call
-
 def c_str_array(strings):
     arr = (c_char_p * len(strings))()
     arr[:] = strings
@@ -27,7 +31,36 @@ class TLI_HardwareInformation(Structure):
                 ("modificationState", c_ushort),
                 ("numChannels", c_short)]
 
-LOGGERFUNC = WINFUNCTYPE(None, c_void_p)
+_MOTOR = MESSAGE_TYPE.GenericMotor.value
+_MOVED = GENERIC_MOTOR_MSG.Moved.value
+_STOPPED = GENERIC_MOTOR_MSG.Stopped.value
+_ALREADY_OPEN = FTDI_COM_ERROR.TL_ALREADY_OPEN.value
+
+_PROTOTYPES = {
+    'InitializeSimulations': ('TLI_InitializeSimulations', None, c_void_p),
+    'BuildDeviceList': ('TLI_BuildDeviceList', None, c_short),
+    'GetDeviceListSize': ('TLI_GetDeviceListSize', None, c_short),
+    'CheckConnection': ('KIM_CheckConnection', [c_char_p], c_bool),
+    'Open': ('KIM_Open', [c_char_p], c_short),
+    'Enable': ('KIM_Enable', [c_char_p], c_short),
+    'EnableChannel': ('KIM_EnableChannel', [c_char_p, c_ushort], c_short),
+    'MoveAbsolute': ('KIM_MoveAbsolute', [c_char_p, c_ushort, c_uint], c_short),
+    'MoveRelative': ('KIM_MoveRelative', [c_char_p, c_ushort, c_uint], c_short),
+    'RequestStatusBits': ('KIM_RequestStatusBits', [c_char_p], c_short),
+    'GetStatusBits': ('KIM_GetStatusBits', [c_char_p, c_ushort], c_ulong),
+    'RequestCurrentPosition': ('KIM_RequestCurrentPosition', [c_char_p, c_ushort], c_short),
+    'GetCurrentPosition': ('KIM_GetCurrentPosition', [c_char_p, c_ushort], c_int),
+    'MessageQueueSize': ('KIM_MessageQueueSize', [c_char_p], c_int),
+    'GetFirmwareVersion': ('KIM_GetFirmwareVersion', [c_char_p], c_ulong),
+    'PollingDuration': ('KIM_PollingDuration', [c_char_p], c_long),
+    'StartPolling': ('KIM_StartPolling', [c_char_p, c_int], c_bool),
+    'RegisterMessageCallback': ('KIM_RegisterMessageCallback', [c_char_p, LOGGERFUNC], c_void_p),
+    'GetNextMessage': ('KIM_GetNextMessage', [c_char_p, POINTER(c_ulong), POINTER(c_ulong), POINTER(c_ulong)], c_bool),
+    'GetHardwareInfoBlock': ('KIM_GetHardwareInfoBlock', [c_char_p, POINTER(TLI_HardwareInformation)], c_short),
+    'GetDriveOPParameters': ('KIM_GetDriveOPParameters',
+                             [c_char_p, c_ushort, POINTER(c_short), POINTER(c_int), POINTER(c_int)], c_short),
+    'SetDriveOPParameters': ('KIM_SetDriveOPParameters', [c_char_p, c_ushort, c_short, c_int, c_int], c_short)
+}
 
 class TLKinesisInertialMotor():
 
@@ -36,95 +69,166 @@ class TLKinesisInertialMotor():
         return val
 
     def _initialize_library(self):
+        self.__lib = function_table("Thorlabs.MotionControl.KCube.InertialMotor.dll", _PROTOTYPES)
 
-        libname = os.path.dirname(__file__)
-        libname = os.path.join(libname, "../dlls/Thorlabs.MotionControl.KCube.InertialMotor.dll")
-        _library = cdll.LoadLibrary(libname)
-
-        self.__InitializeSimulations = _buildFunction(_library.TLI_InitializeSimulations, None, c_void_p)
-        self.__BuildDeviceList = _buildFunction(_library.TLI_BuildDeviceList, None, c_short)
-        self.__GetDeviceListSize = _buildFunction(_library.TLI_GetDeviceListSize, None, c_short)
-        self.__CheckConnection = _buildFunction(_library.KIM_CheckConnection, [c_char_p], c_bool)
-        self.__Open = _buildFunction(_library.KIM_Open, [c_char_p], c_short)
-        self.__Enable = _buildFunction(_library.KIM_Enable, [c_char_p], c_short)
-        self.__EnableChannel = _buildFunction(_library.KIM_EnableChannel, [c_char_p, c_ushort], c_short)
-        self.__MoveAbsolute = _buildFunction(_library.KIM_MoveAbsolute, [c_char_p, c_ushort, c_uint], c_short)
-        self.__MoveRelative = _buildFunction(_library.KIM_MoveRelative, [c_char_p, c_ushort, c_uint], c_short)
-        self.__RequestStatusBits = _buildFunction(_library.KIM_RequestStatusBits, [c_char_p], c_short)
-        self.__GetStatusBits = _buildFunction(_library.KIM_GetStatusBits, [c_char_p, c_ushort], c_ulong)
-        self.__RequestCurrentPosition = _buildFunction(_library.KIM_RequestCurrentPosition, [c_char_p, c_ushort],
-                                                       c_short)
-        self.__GetCurrentPosition = _buildFunction(_library.KIM_GetCurrentPosition, [c_char_p, c_ushort], c_int)
-        self.__MessageQueueSize = _buildFunction(_library.KIM_MessageQueueSize, [c_char_p], c_int)
-        self.__GetFirmwareVersion = _buildFunction(_library.KIM_GetFirmwareVersion, [c_char_p], c_ulong)
-        self.__PollingDuration = _buildFunction(_library.KIM_PollingDuration, [c_char_p], c_long)
-        self.__StartPolling = _buildFunction(_library.KIM_StartPolling, [c_char_p, c_int], c_bool)
-        self.__RegisterMessageCallback = _buildFunction(_library.KIM_RegisterMessageCallback, [c_char_p, LOGGERFUNC], c_void_p)
-        self.__GetNextMessage = _buildFunction(_library.KIM_GetNextMessage, [c_char_p, POINTER(c_ulong), POINTER(c_ulong),
-                                                                             POINTER(c_ulong)], c_bool)
-        self.__GetHardwareInfoBlock = _buildFunction(_library.KIM_GetHardwareInfoBlock, [c_char_p,
-                                                                                        POINTER(TLI_HardwareInformation)], c_short)
-        self.__GetDriveOPParameters = _buildFunction(_library.KIM_GetDriveOPParameters,
-                                                     [c_char_p, c_ushort, POINTER(c_short), POINTER(c_int), POINTER(c_int)], c_short)
-        self.__SetDriveOPParameters = _buildFunction(_library.KIM_SetDriveOPParameters,
-                                                     [c_char_p, c_ushort, c_short, c_int, c_int], c_short)
-
-    def __init__(self, serialno, pollingTime = 100, TIMEOUT = 5, SIMULATION = False):
+    def __init__(self, serialno, pollingTime = 100, TIMEOUT = 5, SIMULATION = False, BUILD_DEVICE_LIST = False,
+                 WAIT_READY = True):
+        self.__start = start = time.perf_counter()
         self._initialize_library()
         self.__serial = serialno.encode()
+        self.__hardwareKey = hardware_key(serialno, SIMULATION) #Simulated devices are not saved to disk
         self.__fn = LOGGERFUNC(self._callback)
-        self.__eventHandler = threading.Event()
+        self.__channelEvents = [threading.Event() for x in range(4)] #Cleared while the channel moves
+        for event in self.__channelEvents: event.set()
+        self.__ready = Future()
+        self.__ready.set_running_or_notify_cancel()
+        self.__isReady = False
         self.__timeout = TIMEOUT
-        if SIMULATION: self.InitializeSimulations()
-        self.OpenConnection()
-        self.StartPolling(pollingTime)
-        time.sleep(0.5)
-        self.__pos = self.GetCurrentPositionAll()
-        self.RegisterMessageCallback()
+        self.__startup = {}
+        self.__moves = {} #channel => (target, Future, deadline, replaced a move in flight)
+        self.__movesLock = threading.Lock()
+        self.__syncMoves = 0 #Blocking moves in flight
+        self.__polling = None
+        self.__pollingTime = pollingTime #Last interval sent
+        self.__pos = [0] * 4 #Targets. Placeholders until _device_ready reads the positions
+        self.__position = [0] * 4
+        self.__cache = SettingsCache() #Drive parameters, restored by Reconnect
+        self.__watchdog = None
+        self.__jog = JogQueue(self)
 
         #Message system
         self.__msg_type = c_ulong(0)
         self.__msg_id = c_ulong(0)
         self.__msg_data = c_ulong(0)
+        self.__pump = MessagePump(self._next_message, self._message)
 
-
-        print(f'Initial position is {self.__pos}.')
+        if SIMULATION: self.InitializeSimulations()
+        if BUILD_DEVICE_LIST: self.BuildDeviceList()
+        self.__startup['Library'] = time.perf_counter() - start
+        self.OpenConnection()
+        self.__startup['Open'] = time.perf_counter() - start - self.__startup['Library']
+        self.RegisterMessageCallback()
+        self.StartPolling(pollingTime)
+        if WAIT_READY:
+            self.WaitReady()
+            self._device_ready()
+            print(f'Initial position is {self.__pos}.')
+
+    def _device_ready(self):
+        with self.__movesLock:
+            if self.__isReady: return
+            position = self.GetCurrentPositionAll()
+            self.__position = list(position) #Position table kept up to date by the messages
+            #Moves sent before the device was ready (WAIT_READY = False) keep their targets
+            self.__pos = [self.__pos[x] if not self.__channelEvents[x].is_set() else position[x] for x in range(4)]
+            total = time.perf_counter() - self.__start
+            self.__startup['Ready'] = total - self.__startup['Open'] - self.__startup['Library']
+            self.__startup['Total'] = total
+            self.__isReady = True
+        self.__ready.set_result(True)
 
     def _callback(self, p):
-        res = self.GetNextMessage()
-        if self.__pos == self.GetCurrentPositionAll():
-            self.__eventHandler.set()
+        self.__pump.drain()
+        if self.__moves: self._check_timeouts()
+
+    def _next_message(self, msg_type, msg_id, msg_data):
+        return self.__lib.GetNextMessage(self.__serial, msg_type, msg_id, msg_data)
+
+    def _message(self, msg_type, msg_id, data, timestamp):
+        if not self.__isReady: self._device_ready()
+        if msg_type == _MOTOR and (msg_id == _MOVED or msg_id == _STOPPED) and 1 <= data <= 4:
+            self._move_completed(data, msg_id == _MOVED)
+
+    def _move_completed(self, channel, moved):
+        position = self.GetCurrentPosition(channel)
+        with self.__movesLock:
+            self.__position[channel - 1] = position
+            move = self.__moves.get(channel)
+            if moved and move is not None and move[3] and position != move[0]:
+                return #Late Moved of the move this one replaced: the channel is still going to move[0]
+            self.__moves.pop(channel, None)
+            if not moved: self.__pos[channel - 1] = position #Stopped before reaching the target
+        self.__channelEvents[channel - 1].set()
+        if move is not None: move[1].set_result(moved)
+
+    def _check_timeouts(self):
+        now = time.perf_counter()
+        with self.__movesLock:
+            expired = [channel for channel, move in self.__moves.items() if now > move[2]]
+            moves = [self.__moves.pop(channel) for channel in expired]
+        for channel, move in zip(expired, moves):
+            Kinesis_Instrumentation.timeout('TLKinesisInertialMotor.MoveAsync')
+            print(f'Timeout achieved on channel {channel}. Updating position to the current position.')
+            self.__position[channel - 1] = self.__pos[channel - 1] = self.GetCurrentPosition(channel)
+            move[1].set_result(False)
+
+    def _sync_move(self, count):
+        with self.__movesLock:
+            self.__syncMoves += count
+        if count > 0 and self.__polling is not None: self.__polling.kick()
+
+    def _busy(self):
+        return bool(self.__moves) or self.__syncMoves > 0
+
+    def WaitReady(self, timeout = None):
+        """
+        Waits for the first message sent by the device after StartPolling.
+
+        :param timeout: float (in s). Defaults to TIMEOUT
+        :return: Boolean (True if the device is ready)
+        """
+        done, pending = wait([self.__ready], self.__timeout if timeout is None else timeout)
+        if pending:
+            Kinesis_Instrumentation.timeout('TLKinesisInertialMotor.WaitReady')
+            print('Timeout achieved. Device did not answer after polling started.')
+            return False
+        return True
+
+    def GetReadyFuture(self):
+        """
+
+        :return: Future resolved by the first message sent by the device after StartPolling
+        """
+        return self.__ready
+
+    def StartupTime(self):
+        """
+
+        :return: Dict (in s) with the time spent in each step of the constructor
+        """
+        return dict(self.__startup)
 
     def updatePosition(self):
         self.__pos = self.GetCurrentPositionAll()
+        self.__position = list(self.__pos)
 
     def InitializeSimulations(self):
         """
 
         :return:
         """
-        return self.__InitializeSimulations()
+        return self.__lib.InitializeSimulations()
 
     def BuildDeviceList(self):
         """
 
         :return: Error Code
         """
-        return self._error_check(self.__BuildDeviceList())
+        return self._error_check(self.__lib.BuildDeviceList())
 
     def GetDeviceListSize(self):
         """
 
         :return: int16
         """
-        return self.__GetDeviceListSize()
+        return self.__lib.GetDeviceListSize()
 
     def CheckConnection(self):
         """
 
         :return: Boolean
         """
-        return self.__CheckConnection(self.__serial)
+        return self.__lib.CheckConnection(self.__serial)
 
     def OpenConnection(self):
         """
@@ -132,16 +236,24 @@ class TLKinesisInertialMotor():
         :return:
         Error Code
         """
-        return self._error_check(self.__Open(self.__serial))
+        return self._error_check(self.__lib.Open(self.__serial))
 
     def UpdatePosition(self):
         """
 
         :return: None
         """
-        self.__pos = self.GetCurrentPositionAll()
+        self.updatePosition()
         return
 
+    def GetCachedPositionAll(self):
+        """
+        Positions known from the move completed messages. Does not call the DLL.
+
+        :return: List of int32
+        """
+        return list(self.__position)
+
     def MoveRelative(self, channel: int, step: int):
         """
 
@@ -149,13 +261,17 @@ class TLKinesisInertialMotor():
         :param step: int
         :return: Error Code
         """
+        if not self.__isReady and not self.WaitReady(): return False #Positions not read yet
         if self.__pos[channel - 1] != self.__pos[channel - 1] + step:
-            self.__eventHandler.clear()
+            self.__channelEvents[channel - 1].clear()
+            self._sync_move(1)
             self.__pos[channel - 1] += step
-            self._error_check(self.__MoveRelative(self.__serial, channel, step))
-            if not self.__eventHandler.wait(self.__timeout):
+            self._error_check(self.__lib.MoveRelative(self.__serial, channel, step))
+            if not self.__channelEvents[channel - 1].wait(self.__timeout):
+                Kinesis_Instrumentation.timeout('TLKinesisInertialMotor.MoveRelative')
                 print('Timeout achieved. Updating position to the current position.')
                 self.updatePosition()
+            self._sync_move(-1)
             return True
         return False
 
@@ -166,22 +282,89 @@ class TLKinesisInertialMotor():
         :param value: int
         :return: Error Check
         """
+        if not self.__isReady and not self.WaitReady(): return False #Positions not read yet
         if self.__pos[channel - 1] != value:
-            self.__eventHandler.clear()
+            self.__channelEvents[channel - 1].clear()
+            self._sync_move(1)
             self.__pos[channel - 1] = value
-            self._error_check(self.__MoveAbsolute(self.__serial, channel, value))
-            if not self.__eventHandler.wait(self.__timeout):
+            self._error_check(self.__lib.MoveAbsolute(self.__serial, channel, value))
+            if not self.__channelEvents[channel - 1].wait(self.__timeout):
+                Kinesis_Instrumentation.timeout('TLKinesisInertialMotor.MoveAbsolute')
                 print('Timeout achieved. Updating position to the current position.')
                 self.updatePosition()
+            self._sync_move(-1)
             return True
         return False
 
+    def MoveRelativeAsync(self, channel: int, step: int):
+        """
+        Non blocking MoveRelative.
+
+        :param channel: [1 - 4] for KIM101
+        :param step: int
+        :return: Future. Result is True once the channel reached its target, False if
+        there was nothing to move, the move timed out or was replaced by another one. Sent once
+        the device is ready (WAIT_READY = False), when the target is known
+        """
+        if not self.__isReady:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self.__ready.add_done_callback(lambda ready: self.MoveRelativeAsync(channel, step).add_done_callback(
+                lambda move: future.set_result(move.result())))
+            return future
+        return self.MoveAbsoluteAsync(channel, self.__pos[channel - 1] + step)
+
+    def MoveAbsoluteAsync(self, channel: int, value: int):
+        """
+        Non blocking MoveAbsolute.
+
+        :param channel: [1 - 4] for KIM101
+        :param value: int
+        :return: Future. Result is True once the channel reached value, False if there
+        was nothing to move, the move timed out or was replaced by another one
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.__movesLock:
+            previous = self.__moves.pop(channel, None)
+            if self.__isReady and self.__pos[channel - 1] == value and previous is None: #Already there
+                future.set_result(False)
+                return future
+            self.__channelEvents[channel - 1].clear()
+            self.__pos[channel - 1] = value
+            self.__moves[channel] = (value, future, time.perf_counter() + self.__timeout, previous is not None)
+        if self.__polling is not None: self.__polling.kick()
+        if previous is not None: previous[1].set_result(False)
+        if self._error_check(self.__lib.MoveAbsolute(self.__serial, channel, value)):
+            with self.__movesLock:
+                if self.__moves.get(channel, (None, None))[1] is future: del self.__moves[channel]
+            future.set_result(False)
+        return future
+
+    def Jog(self, channel: int, step: int):
+        """
+        Non blocking MoveRelative for bursts of small steps: the steps sent while the channel
+        moves are merged into one move sent when it stops.
+
+        :param channel: [1 - 4] for KIM101
+        :param step: int
+        :return: Future. Result is True once the move including this step completed
+        """
+        return self.__jog.Jog(channel, step)
+
+    def GetJogQueue(self):
+        """
+
+        :return: JogQueue used by Jog (Flush, Pending, stats)
+        """
+        return self.__jog
+
     def RequestStatusBits(self):
         """
 
         :return: Error Code
         """
-        return self._error_check(self.__RequestStatusBits(self.__serial))
+        return self._error_check(self.__lib.RequestStatusBits(self.__serial))
 
     def GetStatusBits(self, channel: int):
         """
@@ -189,7 +372,7 @@ class TLKinesisInertialMotor():
         :param channel: [1 - 4] for KIM101
         :return: DWORD (c_ulong)
         """
-        return self.__GetStatusBits(self.__serial, channel)
+        return self.__lib.GetStatusBits(self.__serial, channel)
 
     def RequestCurrentPosition(self, channel: int):
         """
@@ -197,7 +380,7 @@ class TLKinesisInertialMotor():
         :param channel: [1 - 4] for KIM101
         :return: Error Code
         """
-        return self._error_check(self.__RequestCurrentPosition(self.__serial, channel))
+        return self._error_check(self.__lib.RequestCurrentPosition(self.__serial, channel))
 
     def GetCurrentPosition(self, channel: int):
         """
@@ -205,31 +388,31 @@ class TLKinesisInertialMotor():
         :param channel: [1 - 4] for KIM101
         :return: int32
         """
-        return self.__GetCurrentPosition(self.__serial, channel)
+        return self.__lib.GetCurrentPosition(self.__serial, channel)
 
     def GetCurrentPositionAll(self):
-        return [self.__GetCurrentPosition(self.__serial, x+1) for x in range(4)]
+        return [self.__lib.GetCurrentPosition(self.__serial, x+1) for x in range(4)]
 
     def MessageQueueSize(self):
         """
 
         :return: int
         """
-        return self.__MessageQueueSize(self.__serial)
+        return self.__lib.MessageQueueSize(self.__serial)
 
     def GetFirmwareVersion(self):
         """
 
         :return: DWORD (c_ulong)
         """
-        return self.__GetFirmwareVersion(self.__serial)
+        return self.__lib.GetFirmwareVersion(self.__serial)
 
     def PollingDuration(self):
         """
 
         :return: int64 (in ms)
         """
-        return self.__PollingDuration(self.__serial)
+        return self.__lib.PollingDuration(self.__serial)
 
     def StartPolling(self, time: int):
         """
@@ -237,26 +420,112 @@ class TLKinesisInertialMotor():
         :param time: int (in ms)
         :return: Boolean (True if successful)
         """
-        return self.__StartPolling(self.__serial, time)
+        self.__pollingTime = time
+        return self.__lib.StartPolling(self.__serial, time)
+
+    def SetAdaptivePolling(self, fast = 10, slow = 200, hold = 1.0):
+        """
+        Polls every fast ms while moves are in flight and every slow ms once idle for hold s.
+
+        :param fast: int (in ms)
+        :param slow: int (in ms)
+        :param hold: float (in s)
+        :return: AdaptivePolling
+        """
+        self.StopAdaptivePolling()
+        self.__polling = AdaptivePolling(self.StartPolling, self._busy, fast, slow, hold)
+        self.__polling.start()
+        return self.__polling
+
+    def StopAdaptivePolling(self, time = None):
+        """
+
+        :param time: int (in ms). Constant polling interval afterwards, slow interval if None
+        :return: None
+        """
+        polling, self.__polling = self.__polling, None
+        if polling is not None: polling.stop(time)
+
+    def GetMessageRate(self, window = 1.0):
+        """
+
+        :param window: float (in s)
+        :return: float. Messages per second received from the device during the last window
+        """
+        return self.__pump.rate(window)
+
+    def Reconnect(self, timeout = None):
+        """
+        Opens the device again after it was lost and restores the message callback, the polling
+        and the settings (drive parameters). The moves in flight are over: their futures get False.
+
+        :param timeout: float (in s). Wait for the first message, defaults to TIMEOUT
+        :return: Boolean (True once the device answers again)
+        """
+        count = self.__pump.count
+        self.__lib.BuildDeviceList()
+        if self.__lib.Open(self.__serial) not in (0, _ALREADY_OPEN): return False
+        self.RegisterMessageCallback()
+        self.StartPolling(self.__pollingTime)
+        self.__cache.invalidate()
+        self.__cache.flush(self._send_setting)
+        if not wait_message(self.__pump, count, self.__timeout if timeout is None else timeout): return False
+        self.updatePosition()
+        with self.__movesLock: #The device forgot the moves in flight
+            moves, self.__moves = self.__moves, {}
+        for event in self.__channelEvents: event.set()
+        for move in moves.values(): move[1].set_result(False)
+        return True
+
+    def StartWatchdog(self, interval = 0.25, silence = 2.0, on_incident = None):
+        """
+        Reconnects the device automatically when it is lost.
+
+        :param interval: float (in s). Time between checks
+        :param silence: float (in s). Time without message meaning the device is lost
+        :param on_incident: callable(Dict) called after each reconnection
+        :return: ConnectionWatchdog
+        """
+        self.StopWatchdog()
+        self.__watchdog = ConnectionWatchdog(self, interval, silence, on_incident = on_incident)
+        self.__watchdog.start()
+        return self.__watchdog
+
+    def StopWatchdog(self):
+        watchdog, self.__watchdog = self.__watchdog, None
+        if watchdog is not None: watchdog.stop()
 
     def RegisterMessageCallback(self):
-        self.__RegisterMessageCallback(self.__serial, self.__fn)
+        self.__lib.RegisterMessageCallback(self.__serial, self.__fn)
 
     def GetNextMessage(self):
         """
 
         :return: Boolean (True if successful)
         """
-        res = self.__GetNextMessage(self.__serial, self.__msg_type, self.__msg_id, self.__msg_data)
+        res = self.__lib.GetNextMessage(self.__serial, self.__msg_type, self.__msg_id, self.__msg_data)
         return (self.__msg_type.value, self.__msg_id.value, self.__msg_data.value, res)
 
-    def GetHardwareInfoBlock(self):
+    def GetMessagePump(self):
+        """
+        Ring buffer of the last messages, with subscribe/unsubscribe, read and history.
+
+        :return: MessagePump
+        """
+        return self.__pump
+
+    def GetHardwareInfoBlock(self, refresh = False):
         """
 
+        :param refresh: Boolean. Queries the device instead of the hardware information cache
         :return: Dict
         """
         value = TLI_HardwareInformation()
-        self._error_check(self.__GetHardwareInfoBlock(self.__serial, value))
+        cached = None if refresh else hardware_cache.get(self.__hardwareKey, 'HardwareInfoBlock')
+        if cached is not None and len(cached) == 2 * sizeof(value):
+            value = TLI_HardwareInformation.from_buffer_copy(bytes.fromhex(cached))
+        elif not self._error_check(self.__lib.GetHardwareInfoBlock(self.__serial, value)):
+            hardware_cache.put(self.__hardwareKey, 'HardwareInfoBlock', bytes(value).hex())
         dict = {
             "Serial Number": value.serialNumber,
             "Model Number": value.modelNumber,
@@ -270,31 +539,88 @@ class TLKinesisInertialMotor():
         }
         return dict
 
-    def GetDriveOPParameters(self, channel: int):
+    def GetDriveOPParameters(self, channel: int, refresh = False):
         """
 
         :param channel: int
+        :param refresh: Boolean. Queries the device instead of the settings cache
         :return: Dict
         """
-        voltage = c_short(0x00)
-        sr = c_int(0x00)
-        sa = c_int(0x00)
-        self._error_check(self.__GetDriveOPParameters(self.__serial, channel, voltage, sr, sa))
+        key = f'DriveOPParameters/{channel}'
+        if refresh or not self.__cache.known(key):
+            voltage = c_short(0x00)
+            sr = c_int(0x00)
+            sa = c_int(0x00)
+            if self._error_check(self.__lib.GetDriveOPParameters(self.__serial, channel, voltage, sr, sa)):
+                return {"Voltage": voltage.value, "Step Rate": sr.value, "Step Acceleration": sa.value}
+            self.__cache.read(key, [voltage.value, sr.value, sa.value])
+        voltage, sr, sa = self.__cache.get(key)
         dict = {
-            "Voltage": voltage.value,
-            "Step Rate": sr.value,
-            "Step Acceleration": sa.value
+            "Voltage": voltage,
+            "Step Rate": sr,
+            "Step Acceleration": sa
         }
         return dict
 
-    def SetDriveOPParameters(self, channel: int, voltage: int, step_rate: int, step_acc: int):
+    def SetDriveOPParameters(self, channel: int, voltage: int, step_rate: int, step_acc: int, force = False):
         """
 
         :param channel: int
         :param voltage: int
         :param step_rate: int
         :param step_acc: int
+        :param force: Boolean. Sends the parameters even if the device has them already
         :return: None
         """
-        self._error_check(self.__SetDriveOPParameters(self.__serial, channel, voltage, step_rate, step_acc))
-        return
\ No newline at end of file
+        key, value = f'DriveOPParameters/{channel}', [voltage, step_rate, step_acc]
+        if not self.__cache.request(key, value, force): return
+        error = self._error_check(self.__lib.SetDriveOPParameters(self.__serial, channel, voltage, step_rate, step_acc))
+        self.__cache.written(key, value, not error)
+        return
+
+    def _send_setting(self, key, value):
+        name, _, channel = key.partition('/')
+        if name != 'DriveOPParameters': raise ValueError(f'Unknown setting {key}.')
+        self.SetDriveOPParameters(int(channel), *value, force = True)
+
+    def GetSettings(self, read = False):
+        """
+
+        :param read: Boolean. Reads the drive parameters of the four channels from the device first
+        :return: Dict (setting => value), for ApplySettings or SaveProfile
+        """
+        if read:
+            for channel in range(1, 5): self.GetDriveOPParameters(channel, refresh = True)
+        return self.__cache.snapshot()
+
+    def ApplySettings(self, settings, force = False):
+        """
+        Sends the settings the device does not have already.
+
+        :param settings: Dict (GetSettings)
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.__cache.apply(settings, self._send_setting, force)
+
+    def SaveProfile(self, name, path = None):
+        """
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :return: Dict. Settings saved
+        """
+        settings = self.GetSettings()
+        save_profile(name, settings, path)
+        return settings
+
+    def LoadProfile(self, name, path = None, force = False):
+        """
+        Applies a profile saved with SaveProfile, sending only the settings that differ.
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.ApplySettings(load_profile(name, path), force)
@@ -0,0 +1,239 @@
+"""
+Opt-in timing of every DLL call.
+
+enable() installs a call wrapper in Kinesis_Backend: from then on every bound TLI_, KIM_,
+SG_ and PCC_ function records its latency in a log-linear (HDR style) histogram, its
+number of calls and the error codes it returned. The drivers also report the timeouts of
+their waits. disable() removes the wrapper, so the drivers call the ctypes functions
+directly again.
+
+    >>> Kinesis_Instrumentation.enable()
+    >>> ... #Use the drivers
+    >>> print(Kinesis_Instrumentation.to_prometheus())
+"""
+
+from ctypes import c_short
+
+from Modules.ErrorEnum import FTDI_COM_ERROR
+from Modules import Kinesis_Backend
+
+import json, threading, time
+
+SUB_BUCKET_BITS = 7 #128 sub buckets per power of two: below 1.6 % error
+
+_NOT_ERROR_CODES = ('TLI_GetDeviceListSize',) #c_short results that are not error codes
+
+PROMETHEUS_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2,
+                      2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram():
+    """
+    Log-linear histogram of integer values (ns): exact below 2**SUB_BUCKET_BITS, then
+    2**(SUB_BUCKET_BITS - 1) buckets per power of two.
+    """
+    def __init__(self):
+        self.counts = [0] * (1 << SUB_BUCKET_BITS)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def index(value):
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0: return value
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def value(index):
+        #Lowest value of the bucket.
+        half = 1 << (SUB_BUCKET_BITS - 1)
+        if index < 2 * half: return index
+        shift = index // half - 1
+        return (index - shift * half) << shift
+
+    def record(self, value):
+        index = self.index(value)
+        if index >= len(self.counts): self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+        if self.min is None or value < self.min: self.min = value
+
+    def percentile(self, q):
+        """
+
+        :param q: float in [0, 100]
+        :return: int. Value (ns) at the percentile, None if empty
+        """
+        if not self.count: return None
+        rank = max(1, int(round(q / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank: return min(self.value(index + 1) - 1, self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """
+
+        :param bounds: increasing upper bounds (ns)
+        :return: list of counts of values <= each bound (bucket resolution)
+        """
+        result, seen, index = [], 0, 0
+        for bound in bounds:
+            while index < len(self.counts) and self.value(index + 1) - 1 <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def to_dict(self):
+        return {"count": self.count, "sum_ns": self.total, "min_ns": self.min, "max_ns": self.max,
+                "mean_ns": self.total / self.count if self.count else None,
+                "p50_ns": self.percentile(50), "p90_ns": self.percentile(90), "p99_ns": self.percentile(99),
+                "p999_ns": self.percentile(99.9)}
+
+
+class FunctionStats():
+
+    def __init__(self, library, function):
+        self.library = library
+        self.function = function
+        self.histogram = Histogram()
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, error):
+        with self.lock:
+            self.histogram.record(elapsed)
+            if error: self.errors[error] = self.errors.get(error, 0) + 1
+
+    def to_dict(self):
+        with self.lock:
+            return {"library": self.library, "function": self.function, "calls": self.histogram.count,
+                    "errors": dict(self.errors), "latency": self.histogram.to_dict()}
+
+
+_enabled = False
+_functions = {}
+_timeouts = {}
+_lock = threading.Lock()
+
+def _library_name(dllname):
+    return dllname.replace("Thorlabs.MotionControl.", "").replace(".dll", "")
+
+def _error_name(code):
+    try:
+        return FTDI_COM_ERROR(code).name
+    except ValueError:
+        return str(code)
+
+def _wrapper(dllname, function, call, restype):
+    key = (_library_name(dllname), function)
+    with _lock:
+        stats = _functions.get(key)
+        if stats is None: stats = _functions[key] = FunctionStats(*key)
+    error_codes = restype is c_short and function not in _NOT_ERROR_CODES
+    clock = time.perf_counter_ns
+
+    def timed(*args):
+        start = clock()
+        result = call(*args)
+        stats.record(clock() - start, _error_name(result) if error_codes and result else None)
+        return result
+    timed.__name__ = function
+    return timed
+
+def enable():
+    """
+    Starts timing every DLL call. Functions already bound are bound again.
+
+    :return: None
+    """
+    global _enabled
+    _enabled = True
+    Kinesis_Backend.add_call_wrapper(_wrapper)
+
+def disable():
+    """
+
+    :return: None
+    """
+    global _enabled
+    _enabled = False
+    Kinesis_Backend.remove_call_wrapper(_wrapper)
+
+def enabled():
+    return _enabled
+
+def reset():
+    """
+    Clears the recorded values.
+
+    :return: None
+    """
+    with _lock:
+        for stats in _functions.values():
+            with stats.lock:
+                stats.histogram = Histogram()
+                stats.errors = {}
+        _timeouts.clear()
+
+def timeout(name):
+    """
+    Called by the drivers when a wait times out.
+
+    :param name: str, e.g. 'TLKinesisInertialMotor.MoveAbsolute'
+    :return: None
+    """
+    if not _enabled: return
+    with _lock:
+        _timeouts[name] = _timeouts.get(name, 0) + 1
+
+def snapshot():
+    """
+
+    :return: Dict with the statistics of every function called and the timeouts
+    """
+    with _lock:
+        functions = list(_functions.values())
+        timeouts = dict(_timeouts)
+    return {"functions": [x.to_dict() for x in functions if x.histogram.count], "timeouts": timeouts}
+
+def to_json(indent = None):
+    """
+
+    :return: str
+    """
+    return json.dumps(snapshot(), indent = indent)
+
+def to_prometheus():
+    """
+
+    :return: str in the Prometheus text exposition format
+    """
+    with _lock:
+        functions = [x for x in _functions.values() if x.histogram.count]
+        timeouts = dict(_timeouts)
+    lines = ["# HELP kinesis_call_seconds Latency of the Kinesis DLL calls.",
+             "# TYPE kinesis_call_seconds histogram"]
+    errors = []
+    for stats in functions:
+        with stats.lock:
+            labels = f'library="{stats.library}",function="{stats.function}"'
+            counts = stats.histogram.cumulative([int(x * 1e9) for x in PROMETHEUS_BUCKETS])
+            for bound, count in zip(PROMETHEUS_BUCKETS, counts):
+                lines.append(f'kinesis_call_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'kinesis_call_seconds_bucket{{{labels},le="+Inf"}} {stats.histogram.count}')
+            lines.append(f'kinesis_call_seconds_sum{{{labels}}} {stats.histogram.total / 1e9:.9f}')
+            lines.append(f'kinesis_call_seconds_count{{{labels}}} {stats.histogram.count}')
+            errors += [f'kinesis_call_errors_total{{{labels},code="{code}"}} {count}'
+                       for code, count in stats.errors.items()]
+    lines += ["# HELP kinesis_call_errors_total Error codes returned by the Kinesis DLL calls.",
+              "# TYPE kinesis_call_errors_total counter"] + errors
+    lines += ["# HELP kinesis_timeouts_total Waits of the drivers that timed out.",
+              "# TYPE kinesis_timeouts_total counter"]
+    lines += [f'kinesis_timeouts_total{{wait="{name}"}} {count}' for name, count in timeouts.items()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+"""
+Coalescing of relative moves of the KIM101, for joysticks and feedback loops.
+
+Jog never blocks. While a move of the channel is in flight the steps are summed (opposite
+steps cancel out); when the move completes the net step is sent as a single move. A burst
+of n small steps therefore costs at most two commands to the device.
+
+    >>> jog = JogQueue(my_motor)
+    >>> for x in range(100): jog.Jog(1, 5) #Returns at once
+    >>> jog.Flush()
+"""
+
+from concurrent.futures import Future, wait
+import threading
+
+class JogQueue():
+
+    def __init__(self, motor, channels = (1, 2, 3, 4)):
+        """
+
+        :param motor: TLKinesisInertialMotor
+        :param channels: channels handled
+        """
+        self.motor = motor
+        self.stats = {"Jogs": 0, "Commands": 0, "Cancelled": 0}
+        self.__pending = {channel: 0 for channel in channels} #Net step not sent yet
+        self.__waiting = {channel: [] for channel in channels} #Futures of the pending steps
+        self.__moving = {channel: None for channel in channels} #Future of the move in flight
+        self.__lock = threading.Lock()
+
+    def Jog(self, channel, step):
+        """
+
+        :param channel: [1 - 4]
+        :param step: int
+        :return: Future. Result is True once the move including this step completed
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.__lock:
+            self.stats["Jogs"] += 1
+            self.__pending[channel] += step
+            self.__waiting[channel].append(future)
+            if self.__moving[channel] is not None: return future
+            batch = self._take(channel) #Claims the channel before another thread sees it idle
+        self._send(channel, *batch)
+        return future
+
+    def _take(self, channel):
+        #Called with the lock held. Takes the pending steps; the channel stays claimed if there is a move.
+        step, self.__pending[channel] = self.__pending[channel], 0
+        waiting, self.__waiting[channel] = self.__waiting[channel], []
+        if step:
+            self.stats["Commands"] += 1
+            moving = self.__moving[channel] = Future() #Done when the move and its followers are sent
+            moving.set_running_or_notify_cancel()
+        else:
+            self.stats["Cancelled"] += len(waiting)
+            moving = self.__moving[channel] = None
+        return step, waiting, moving
+
+    def _send(self, channel, step, waiting, moving):
+        if not step:
+            for future in waiting: future.set_result(True)
+            return
+        move = self.motor.MoveRelativeAsync(channel, step)
+        move.add_done_callback(lambda move: self._done(channel, move, waiting, moving))
+
+    def _done(self, channel, move, waiting, moving):
+        for future in waiting: future.set_result(move.result())
+        with self.__lock:
+            batch = self._take(channel)
+        self._send(channel, *batch)
+        moving.set_result(move.result())
+
+    def Pending(self, channel):
+        """
+
+        :param channel: [1 - 4]
+        :return: int. Net step waiting for the move in flight
+        """
+        return self.__pending[channel]
+
+    def Flush(self, timeout = None):
+        """
+        Waits until every channel is idle.
+
+        :param timeout: float (in s)
+        :return: Boolean (True if idle)
+        """
+        while True:
+            with self.__lock:
+                futures = [future for waiting in self.__waiting.values() for future in waiting]
+                futures += [move for move in self.__moving.values() if move is not None]
+            if not futures: return True
+            done, pending = wait(futures, timeout)
+            if pending: return False
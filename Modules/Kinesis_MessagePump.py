@@ -0,0 +1,145 @@
+"""
+Message pump of the K-Cube drivers.
+
+On every callback the pump empties the DLL message queue (GetNextMessage until it
+returns False) straight into a preallocated ring of KinesisMessage structures, then
+hands each new message to the driver and to the subscribers. The ring keeps the last
+`size` messages and can be read without copying.
+"""
+
+from ctypes import c_ulong, c_double, Structure
+
+import threading, time
+
+MESSAGE_RING_SIZE = 4096
+
+class KinesisMessage(Structure):
+    _fields_ = [("type", c_ulong),
+                ("id", c_ulong),
+                ("data", c_ulong),
+                ("timestamp", c_double)] #perf_counter time the message was drained
+
+
+class MessagePump():
+
+    def __init__(self, get_next, handler = None, size = MESSAGE_RING_SIZE):
+        """
+
+        :param get_next: callable(msg_type, msg_id, msg_data) filling the three c_ulong, as GetNextMessage
+        :param handler: callable(msg_type, msg_id, data, timestamp) called first for every message
+        :param size: int. Number of messages kept
+        """
+        self.size = size
+        self.buffer = (KinesisMessage * size)()
+        self.count = 0 #Messages received since creation. Next slot is count % size
+        self.wakeups = 0
+        self.max_batch = 0
+
+        self.__get_next = get_next
+        self.__handler = handler
+        self.__subscribers = []
+        self.__lock = threading.Lock()
+        #c_ulong views on each slot, so GetNextMessage writes in the ring directly. Built on first
+        #use of the slot: building all of them costs about 30 ms per device at startup.
+        self.__views = [None] * size
+
+    def drain(self):
+        """
+        Pulls every pending message and dispatches it.
+
+        :return: int. Number of messages pulled
+        """
+        if not self.__lock.acquire(blocking = False): return 0 #Already draining in another thread
+        try:
+            start = self.count
+            size = self.size
+            while True:
+                index = self.count % size
+                views = self.__views[index]
+                if views is None: views = self.__views[index] = self._views(index)
+                if not self.__get_next(*views): break
+                self.buffer[index].timestamp = time.perf_counter()
+                self.count += 1
+            batch = self.count - start
+            self.wakeups += 1
+            if batch > self.max_batch: self.max_batch = batch
+            if batch > size: start = self.count - size #Overwritten during this very drain
+            for x in range(start, self.count):
+                msg = self.buffer[x % size]
+                values = (msg.type, msg.id, msg.data, msg.timestamp)
+                if self.__handler is not None: self.__handler(*values)
+                for callback, msg_type, msg_id in self.__subscribers:
+                    if (msg_type is None or msg_type == values[0]) and (msg_id is None or msg_id == values[1]):
+                        callback(*values)
+            return batch
+        finally:
+            self.__lock.release()
+
+    def _views(self, index):
+        return tuple(c_ulong.from_buffer(self.buffer[index], getattr(KinesisMessage, field).offset)
+                     for field in ("type", "id", "data"))
+
+    def subscribe(self, callback, msg_type = None, msg_id = None):
+        """
+
+        :param callback: callable(msg_type, msg_id, data, timestamp), called from the DLL thread
+        :param msg_type: int. Only this type if given
+        :param msg_id: int. Only this id if given
+        :return: None
+        """
+        self.__subscribers = self.__subscribers + [(callback, msg_type, msg_id)]
+
+    def unsubscribe(self, callback):
+        self.__subscribers = [x for x in self.__subscribers if x[0] != callback]
+
+    def read(self, cursor):
+        """
+        Messages received since cursor (a previous value of count).
+
+        :param cursor: int
+        :return: (first, last, lost). Indexes first to last - 1 are in the ring (slot index % size);
+        lost is the number of messages overwritten before being read
+        """
+        last = self.count
+        first = max(cursor, last - self.size)
+        return first, last, first - cursor
+
+    def history(self, n = None):
+        """
+
+        :param n: int. Number of messages, all kept if None
+        :return: List of KinesisMessage, oldest first. Structures share the ring memory
+        """
+        first, last, lost = self.read(0 if n is None else max(self.count - n, 0))
+        return [self.buffer[x % self.size] for x in range(first, last)]
+
+    def rate(self, window = 1.0):
+        """
+        Messages per second received during the last window seconds (the ring timestamps).
+
+        :param window: float (in s)
+        :return: float
+        """
+        first, last, lost = self.read(0)
+        since = time.perf_counter() - window
+        low, high = first, last
+        while low < high: #First message drained after since
+            middle = (low + high) // 2
+            if self.buffer[middle % self.size].timestamp < since: low = middle + 1
+            else: high = middle
+        return (last - low) / window
+
+    def view(self):
+        """
+
+        :return: memoryview on the whole ring (slot order, not time order)
+        """
+        return memoryview(self.buffer)
+
+    def stats(self):
+        """
+
+        :return: Dict
+        """
+        return {"Messages": self.count, "Wake-ups": self.wakeups, "Max batch": self.max_batch,
+                "Ring size": self.size}
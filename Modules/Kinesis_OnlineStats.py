@@ -0,0 +1,222 @@
+"""
+Constant memory statistics of the strain gauge readings, updated by NumPy chunks.
+
+    Welford: count, mean, variance, min and max since the start (chunks merged with the
+    parallel form of Welford's algorithm, no precision loss over multi-day runs)
+    WindowStats: the same over the last `window` samples
+    Decimator: block averages or CIC (cascaded integrator-comb) decimation by `factor`
+
+ReadingStatistics feeds the three from the blocks of a StrainGaugeStream in a background
+thread and keeps the decimated trace in a bounded ring:
+
+    >>> stats = my_gauge.StartStatistics(rate=1000, window=10000, factor=100)
+    >>> stats.summary()
+    >>> stats.trace() #Decimated (timestamp, reading)
+"""
+
+import numpy
+import threading
+
+class Welford():
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 #Sum of squared differences to the mean
+        self.min = numpy.inf
+        self.max = -numpy.inf
+
+    def update(self, values):
+        """
+
+        :param values: array of samples
+        :return: None
+        """
+        values = numpy.asarray(values, dtype = float)
+        n = len(values)
+        if not n: return
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def variance(self, ddof = 1):
+        return self.m2 / (self.count - ddof) if self.count > ddof else numpy.nan
+
+    def std(self, ddof = 1):
+        return numpy.sqrt(self.variance(ddof))
+
+    def to_dict(self):
+        if not self.count: return {"Count": 0, "Mean": numpy.nan, "Std": numpy.nan, "Min": numpy.nan, "Max": numpy.nan}
+        return {"Count": self.count, "Mean": float(self.mean), "Std": float(self.std()), "Min": float(self.min),
+                "Max": float(self.max)}
+
+
+class WindowStats():
+
+    def __init__(self, window):
+        """
+
+        :param window: int. Number of latest samples
+        """
+        self.window = window
+        self.__buffer = numpy.zeros(window)
+        self.__count = 0
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype = float)[-self.window:]
+        n = len(values)
+        index = self.__count % self.window
+        first = min(n, self.window - index)
+        self.__buffer[index:index + first] = values[:first]
+        self.__buffer[:n - first] = values[first:]
+        self.__count += n
+
+    def values(self):
+        """
+
+        :return: array of the samples of the window, oldest first
+        """
+        if self.__count < self.window: return self.__buffer[:self.__count].copy()
+        return numpy.roll(self.__buffer, -(self.__count % self.window))
+
+    def to_dict(self):
+        values = self.__buffer[:min(self.__count, self.window)]
+        if not len(values): return {"Count": 0, "Mean": numpy.nan, "Std": numpy.nan, "Min": numpy.nan, "Max": numpy.nan}
+        return {"Count": len(values), "Mean": float(values.mean()),
+                "Std": float(values.std(ddof = 1)) if len(values) > 1 else numpy.nan,
+                "Min": float(values.min()), "Max": float(values.max())}
+
+
+class Decimator():
+
+    def __init__(self, factor, mode = 'mean', order = 3):
+        """
+
+        :param factor: int. One output every factor samples
+        :param mode: 'mean' (block average) or 'cic'
+        :param order: int. Number of CIC stages
+        """
+        assert factor >= 1 and mode in ('mean', 'cic')
+        self.factor = factor
+        self.mode = mode
+        self.order = order
+        self.__rest = numpy.zeros(0) #Samples of the incomplete block (mean)
+        self.__phase = 0 #Samples since the last output (cic)
+        self.__integrators = numpy.zeros(order, dtype = numpy.int64)
+        self.__combs = numpy.zeros(order, dtype = numpy.int64)
+
+    def update(self, values):
+        """
+
+        :param values: array of samples (integers for 'cic')
+        :return: array of the decimated samples completed by these values
+        """
+        if self.mode == 'mean':
+            values = numpy.concatenate([self.__rest, numpy.asarray(values, dtype = float)])
+            blocks = len(values) // self.factor
+            self.__rest = values[blocks * self.factor:]
+            return values[:blocks * self.factor].reshape(blocks, self.factor).mean(axis = 1)
+        #Integrators at the input rate (wrapping int64 arithmetic, exact for CIC), combs at the output rate.
+        x = numpy.asarray(values, dtype = numpy.int64)
+        for stage in range(self.order):
+            x = numpy.cumsum(x, dtype = numpy.int64) + self.__integrators[stage]
+            if len(x): self.__integrators[stage] = x[-1]
+        first = self.factor - 1 - self.__phase
+        x = x[first::self.factor] if first < len(x) else x[:0]
+        self.__phase = (self.__phase + len(values)) % self.factor
+        for stage in range(self.order):
+            previous = numpy.concatenate([[self.__combs[stage]], x[:-1]])
+            if len(x): self.__combs[stage] = x[-1]
+            x = x - previous
+        return x / float(self.factor ** self.order)
+
+
+class ReadingStatistics():
+
+    def __init__(self, stream, window = 10000, factor = 100, mode = 'mean', block = None, trace = 100000,
+                 sink = None):
+        """
+
+        :param stream: StrainGaugeStream, started
+        :param window: int. Samples of the windowed statistics
+        :param factor: int. Decimation factor of the trace
+        :param mode: 'mean' or 'cic'
+        :param block: int. Samples per chunk, factor rounded up to 10 ms of samples if None
+        :param trace: int. Decimated samples kept
+        :param sink: callable(timestamps, readings) called with every decimated chunk
+        """
+        self.stream = stream
+        self.total = Welford()
+        self.window = WindowStats(window)
+        self.factor = factor
+        self.__readings = Decimator(factor, mode)
+        self.__timestamps = Decimator(factor, 'mean')
+        if block is None:
+            block = max(int(stream.rate / 100) if stream.rate else 100, 1)
+            block = -(-block // factor) * factor
+        self.block = min(block, stream.size)
+        self.overrange = 0
+        self.sink = sink
+        self.__trace = numpy.zeros(2 * trace, dtype = [('timestamp', 'f8'), ('reading', 'f8')])
+        self.__traceSize = trace
+        self.__traceCount = 0
+        self.__lock = threading.Lock()
+        self.__thread = threading.Thread(target = self._run, name = 'Strain gauge statistics', daemon = True)
+        self.__thread.start()
+
+    def _run(self):
+        for samples in self.stream.blocks(self.block):
+            self.update(samples)
+
+    def update(self, samples):
+        """
+
+        :param samples: structured array (STREAM_DTYPE)
+        :return: None
+        """
+        readings = samples['reading']
+        timestamps = self.__timestamps.update(samples['timestamp'])
+        decimated = self.__readings.update(readings)
+        with self.__lock:
+            self.total.update(readings)
+            self.window.update(readings)
+            self.overrange += int(numpy.count_nonzero(samples['overrange']))
+            size = self.__traceSize
+            for timestamp, reading in zip(timestamps, decimated): #A few values per chunk
+                index = self.__traceCount % size
+                self.__trace[index] = self.__trace[index + size] = (timestamp, reading)
+                self.__traceCount += 1
+        if self.sink is not None and len(decimated): self.sink(timestamps, decimated)
+
+    def join(self, timeout = None):
+        """
+        Waits until the stream stopped and its last block was processed.
+        """
+        self.__thread.join(timeout)
+
+    def summary(self):
+        """
+
+        :return: Dict with the statistics since the start ('Total') and over the window ('Window')
+        """
+        with self.__lock:
+            return {"Total": self.total.to_dict(), "Window": self.window.to_dict(), "Overrange": self.overrange,
+                    "Decimated": self.__traceCount}
+
+    def trace(self, n = None):
+        """
+
+        :param n: int. Latest decimated samples, all kept if None
+        :return: structured array copy (timestamp, reading), oldest first
+        """
+        with self.__lock:
+            count, size = self.__traceCount, self.__traceSize
+            n = min(count, size) if n is None else min(n, count, size)
+            index = count % size + size
+            return self.__trace[index - n:index].copy()
@@ -1,16 +1,19 @@
-from ctypes import cdll, POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
-    c_ulong, c_bool, WINFUNCTYPE, Structure
+from ctypes import POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
+    c_ulong, c_bool, Structure, sizeof
 
 from Modules.ErrorEnum import FTDI_COM_ERROR
-
-import os, time
+from Modules.Kinesis_Backend import LOGGERFUNC, function_table
+from Modules.Kinesis_MessagePump import MessagePump
+from Modules.Kinesis_Polling import AdaptivePolling
+from Modules.Kinesis_Watchdog import ConnectionWatchdog, wait_message
+from Modules.Kinesis_Settings import SettingsCache, hardware_cache, hardware_key, save_profile, load_profile
+from Modules.Kinesis_SetpointStreamer import SetpointStreamer
+from Modules import Kinesis_Instrumentation
+
+from concurrent.futures import Future, wait
+import time
 import threading
 
-def _buildFunction(call, args, result):
-    call.argtypes = args
-    call.restype = result
-    return call
-
 def c_str_array(strings):
     arr = (c_char_p * len(strings))()
     arr[:] = strings
@@ -27,6 +30,21 @@ class TLI_HardwareInformation(Structure):
                 ("modificationState", c_ushort),
                 ("numChannels", c_short)]
 
+class PZ_LUTWaveParameters(Structure):
+    _fields_ = [("mode", c_short), #1 => Continuous, 2 => Fixed number of cycles (+ trigger flags)
+                ("cycleLength", c_short), #Number of samples of the table played
+                ("numCycles", c_uint),
+                ("LUTValueDelay", c_uint), #Time on each sample (in ms)
+                ("preCycleDelay", c_uint),
+                ("postCycleDelay", c_uint),
+                ("outTriggerStart", c_short),
+                ("outTriggerDuration", c_uint),
+                ("numOutTriggerRepeat", c_short)]
+
+LUT_SIZE = 7000 #Samples of the KPZ101 look-up table
+LUT_CONTINUOUS = 1
+LUT_FIXED = 2
+MAX_SETPOINT = 32767 #Full scale of the output voltage (percentage of the maximum voltage) and position
 
 
 class MessageQueue():
@@ -39,7 +57,40 @@ class MessageQueue():
         return [self.msg_type.value, self.msg_id.value, self.msg_data.value]
 
 
-LOGGERFUNC = WINFUNCTYPE(None, c_void_p)
+_ALREADY_OPEN = FTDI_COM_ERROR.TL_ALREADY_OPEN.value
+
+_PROTOTYPES = {
+    'InitializeSimulations': ('TLI_InitializeSimulations', None, c_void_p),
+    'BuildDeviceList': ('TLI_BuildDeviceList', None, c_short),
+    'GetDeviceListSize': ('TLI_GetDeviceListSize', None, c_short),
+    'CheckConnection': ('PCC_CheckConnection', [c_char_p], c_bool),
+    'Open': ('PCC_Open', [c_char_p], c_short),
+    'Close': ('PCC_Close', [c_char_p], None),
+    'Enable': ('PCC_Enable', [c_char_p], c_short),
+    'GetStatusBits': ('PCC_GetStatusBits', [c_char_p, c_ushort], c_ulong),
+    'MessageQueueSize': ('PCC_MessageQueueSize', [c_char_p], c_int),
+    'GetFirmwareVersion': ('PCC_GetFirmwareVersion', [c_char_p], c_ulong),
+    'PollingDuration': ('PCC_PollingDuration', [c_char_p], c_long),
+    'StartPolling': ('PCC_StartPolling', [c_char_p, c_int], c_bool),
+    'StopPolling': ('PCC_StopPolling', [c_char_p], None),
+    'RegisterMessageCallback': ('PCC_RegisterMessageCallback', [c_char_p, LOGGERFUNC], None),
+    'GetNextMessage': ('PCC_GetNextMessage', [c_char_p, POINTER(c_ulong), POINTER(c_ulong), POINTER(c_ulong)], c_bool),
+    'GetHardwareInfoBlock': ('PCC_GetHardwareInfoBlock', [c_char_p, POINTER(TLI_HardwareInformation)], c_short),
+    'SetZero': ('PCC_SetZero', [c_char_p], c_short),
+    'SetPositionControlMode': ('PCC_SetPositionControlMode', [c_char_p, c_int], c_short),
+    'GetPositionControlMode': ('PCC_GetPositionControlMode', [c_char_p], c_int),
+    'GetMaxOutputVoltage': ('PCC_GetMaxOutputVoltage', [c_char_p], c_short),
+    'SetMaxOutputVoltage': ('PCC_SetMaxOutputVoltage', [c_char_p, c_short], c_short),
+    'GetOutputVoltage': ('PCC_GetOutputVoltage', [c_char_p], c_short),
+    'SetOutputVoltage': ('PCC_SetOutputVoltage', [c_char_p, c_short], c_short),
+    'GetPosition': ('PCC_GetPosition', [c_char_p], c_ushort),
+    'SetPosition': ('PCC_SetPosition', [c_char_p, c_ushort], c_short),
+    'GetLUTwaveParams': ('PCC_GetLUTwaveParams', [c_char_p, POINTER(PZ_LUTWaveParameters)], c_short),
+    'SetLUTwaveParams': ('PCC_SetLUTwaveParams', [c_char_p, POINTER(PZ_LUTWaveParameters)], c_short),
+    'SetLUTwaveSample': ('PCC_SetLUTwaveSample', [c_char_p, c_short, c_ushort], c_short),
+    'StartLUTwave': ('PCC_StartLUTwave', [c_char_p], c_short),
+    'StopLUTwave': ('PCC_StopLUTwave', [c_char_p], c_short)
+}
 
 class TLKinesisPiezoDriver():
 
@@ -48,82 +99,133 @@ class TLKinesisPiezoDriver():
         return val
 
     def _initialize_library(self):
+        self.__lib = function_table("Thorlabs.MotionControl.KCube.Piezo.dll", _PROTOTYPES)
 
-        libname = os.path.dirname(__file__)
-        libname = os.path.join(libname, "../dlls/Thorlabs.MotionControl.KCube.Piezo.dll")
-        _library = cdll.LoadLibrary(libname)
-
-        self.__InitializeSimulations = _buildFunction(_library.TLI_InitializeSimulations, None, c_void_p)
-        self.__BuildDeviceList = _buildFunction(_library.TLI_BuildDeviceList, None, c_short)
-        self.__GetDeviceListSize = _buildFunction(_library.TLI_GetDeviceListSize, None, c_short)
-        self.__CheckConnection = _buildFunction(_library.PCC_CheckConnection, [c_char_p], c_bool)
-        self.__Open = _buildFunction(_library.PCC_Open, [c_char_p], c_short)
-        self.__Close = _buildFunction(_library.PCC_Close, [c_char_p], None)
-        self.__Enable = _buildFunction(_library.PCC_Enable, [c_char_p], c_short)
-        self.__GetStatusBits = _buildFunction(_library.PCC_GetStatusBits, [c_char_p, c_ushort], c_ulong)
-        self.__MessageQueueSize = _buildFunction(_library.PCC_MessageQueueSize, [c_char_p], c_int)
-        self.__GetFirmwareVersion = _buildFunction(_library.PCC_GetFirmwareVersion, [c_char_p], c_ulong)
-        self.__PollingDuration = _buildFunction(_library.PCC_PollingDuration, [c_char_p], c_long)
-        self.__StartPolling = _buildFunction(_library.PCC_StartPolling, [c_char_p, c_int], c_bool)
-        self.__StopPolling = _buildFunction(_library.PCC_StopPolling, [c_char_p], None)
-        self.__RegisterMessageCallback = _buildFunction(_library.PCC_RegisterMessageCallback, [c_char_p, LOGGERFUNC], None)
-        self.__GetNextMessage = _buildFunction(_library.PCC_GetNextMessage, [c_char_p, POINTER(c_ulong), POINTER(c_ulong),
-                                                                             POINTER(c_ulong)], c_bool)
-        self.__GetHardwareInfoBlock = _buildFunction(_library.PCC_GetHardwareInfoBlock, [c_char_p,
-                                                                                        POINTER(TLI_HardwareInformation)], c_short)
-
-        self.__SetZero = _buildFunction(_library.PCC_SetZero, [c_char_p], c_short)
-        self.__SetPositionControlMode = _buildFunction(_library.PCC_SetPositionControlMode, [c_char_p], c_int)
-
-
-    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False):
+    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False, BUILD_DEVICE_LIST = True,
+                 WAIT_READY = True):
+        self.__start = start = time.perf_counter()
         self._initialize_library()
         self.__serial = serialno.encode()
+        self.__hardwareKey = hardware_key(serialno, SIMULATION) #Simulated devices are not saved to disk
         self.__fn = LOGGERFUNC(self._callback)
         self.__eventHandler = threading.Event()
+        self.__ready = Future()
+        self.__ready.set_running_or_notify_cancel()
+        self.__isReady = False
+        self.__settings = [] #Futures waiting for the settings to be done
+        self.__settingsLock = threading.Lock()
+        self.__polling = None
+        self.__pollingTime = pollingTime #Last interval sent
+        self.__watchdog = None
+        self.__cache = SettingsCache() #Control mode and maximum output voltage, restored by Reconnect
         self.__timeout = TIMEOUT
+        self.__startup = {}
+        self.__messageQueue = MessageQueue()
+        self.__pump = MessagePump(self._next_message, self._message)
         if SIMULATION: self.InitializeSimulations()
-        self.BuildDeviceList()
+        if BUILD_DEVICE_LIST: self.BuildDeviceList()
+        self.__startup['Library'] = time.perf_counter() - start
         self.OpenConnection()
-        self.StartPolling(pollingTime)
-        time.sleep(0.5)
-        self.__messageQueue = MessageQueue()
+        self.__startup['Open'] = time.perf_counter() - start - self.__startup['Library']
         self.RegisterMessageCallback()
+        self.StartPolling(pollingTime)
+        if WAIT_READY:
+            self.WaitReady()
+            self._device_ready()
+
+    def _device_ready(self):
+        with self.__settingsLock:
+            if self.__isReady: return
+            total = time.perf_counter() - self.__start
+            self.__startup['Ready'] = total - self.__startup['Open'] - self.__startup['Library']
+            self.__startup['Total'] = total
+            self.__isReady = True
+        self.__ready.set_result(True)
 
     def _callback(self, p):
-        res = self.GetNextMessage()
-        #print(res, self.__messageQueue.get_status())
-        if self.__messageQueue.get_status() == [0, 2, 0]: #Settings properly done
+        self.__pump.drain()
+
+    def _next_message(self, msg_type, msg_id, msg_data):
+        return self.__lib.GetNextMessage(self.__serial, msg_type, msg_id, msg_data)
+
+    def _message(self, msg_type, msg_id, data, timestamp):
+        if not self.__isReady: self._device_ready()
+        if msg_type == 0 and msg_id == 2 and data == 0: #Settings properly done
             print('OK')
             self.__eventHandler.set()
+            if self.__settings: self._settings_done()
+
+    def _settings_done(self):
+        with self.__settingsLock:
+            futures, self.__settings = self.__settings, []
+        for future in futures:
+            future.set_result(True)
+
+    def _settings_future(self):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.__settingsLock:
+            self.__settings.append(future)
+        return future
+
+    def _busy(self):
+        return bool(self.__settings)
+
+    def WaitReady(self, timeout = None):
+        """
+        Waits for the first message sent by the device after StartPolling.
+
+        :param timeout: float (in s). Defaults to TIMEOUT
+        :return: Boolean (True if the device is ready)
+        """
+        done, pending = wait([self.__ready], self.__timeout if timeout is None else timeout)
+        if pending:
+            Kinesis_Instrumentation.timeout('TLKinesisPiezoDriver.WaitReady')
+            print('Timeout achieved. Device did not answer after polling started.')
+            return False
+        return True
+
+    def GetReadyFuture(self):
+        """
+
+        :return: Future resolved by the first message sent by the device after StartPolling
+        """
+        return self.__ready
+
+    def StartupTime(self):
+        """
+
+        :return: Dict (in s) with the time spent in each step of the constructor
+        """
+        return dict(self.__startup)
 
     def InitializeSimulations(self):
         """
 
         :return:
         """
-        return self.__InitializeSimulations()
+        return self.__lib.InitializeSimulations()
 
     def BuildDeviceList(self):
         """
 
         :return: Error Code
         """
-        return self._error_check(self.__BuildDeviceList())
+        return self._error_check(self.__lib.BuildDeviceList())
 
     def GetDeviceListSize(self):
         """
 
         :return: int16
         """
-        return self.__GetDeviceListSize()
+        return self.__lib.GetDeviceListSize()
 
     def CheckConnection(self):
         """
 
         :return: Boolean
         """
-        return self.__CheckConnection(self.__serial)
+        return self.__lib.CheckConnection(self.__serial)
 
     def OpenConnection(self):
         """
@@ -131,7 +233,7 @@ class TLKinesisPiezoDriver():
         :return:
         Error Code
         """
-        return self._error_check(self.__Open(self.__serial))
+        return self._error_check(self.__lib.Open(self.__serial))
 
     def GetStatusBits(self, channel: int):
         """
@@ -139,28 +241,28 @@ class TLKinesisPiezoDriver():
         :param channel: [1 - 4] for KIM101
         :return: DWORD (c_ulong)
         """
-        return self.__GetStatusBits(self.__serial, channel)
+        return self.__lib.GetStatusBits(self.__serial, channel)
 
     def MessageQueueSize(self):
         """
 
         :return: int
         """
-        return self.__MessageQueueSize(self.__serial)
+        return self.__lib.MessageQueueSize(self.__serial)
 
     def GetFirmwareVersion(self):
         """
 
         :return: DWORD (c_ulong)
         """
-        return self.__GetFirmwareVersion(self.__serial)
+        return self.__lib.GetFirmwareVersion(self.__serial)
 
     def PollingDuration(self):
         """
 
         :return: int64 (in ms)
         """
-        return self.__PollingDuration(self.__serial)
+        return self.__lib.PollingDuration(self.__serial)
 
     def StartPolling(self, time: int):
         """
@@ -168,27 +270,107 @@ class TLKinesisPiezoDriver():
         :param time: int (in ms)
         :return: Boolean (True if successful)
         """
-        return self.__StartPolling(self.__serial, time)
+        self.__pollingTime = time
+        return self.__lib.StartPolling(self.__serial, time)
+
+    def SetAdaptivePolling(self, fast = 10, slow = 200, hold = 1.0):
+        """
+        Polls every fast ms while settings are pending and every slow ms once idle for hold s.
+
+        :param fast: int (in ms)
+        :param slow: int (in ms)
+        :param hold: float (in s)
+        :return: AdaptivePolling
+        """
+        self.StopAdaptivePolling()
+        self.__polling = AdaptivePolling(self.StartPolling, self._busy, fast, slow, hold)
+        self.__polling.start()
+        return self.__polling
+
+    def StopAdaptivePolling(self, time = None):
+        """
+
+        :param time: int (in ms). Constant polling interval afterwards, slow interval if None
+        :return: None
+        """
+        polling, self.__polling = self.__polling, None
+        if polling is not None: polling.stop(time)
+
+    def GetMessageRate(self, window = 1.0):
+        """
+
+        :param window: float (in s)
+        :return: float. Messages per second received from the device during the last window
+        """
+        return self.__pump.rate(window)
+
+    def Reconnect(self, timeout = None):
+        """
+        Opens the device again after it was lost and restores the message callback, the polling
+        and the settings (position control mode, maximum output voltage).
+
+        :param timeout: float (in s). Wait for the first message, defaults to TIMEOUT
+        :return: Boolean (True once the device answers again)
+        """
+        count = self.__pump.count
+        self.__lib.BuildDeviceList()
+        if self.__lib.Open(self.__serial) not in (0, _ALREADY_OPEN): return False
+        self.RegisterMessageCallback()
+        self.StartPolling(self.__pollingTime)
+        self.__cache.invalidate()
+        self.__cache.flush(self._send_setting)
+        return wait_message(self.__pump, count, self.__timeout if timeout is None else timeout)
+
+    def StartWatchdog(self, interval = 0.25, silence = 2.0, on_incident = None):
+        """
+        Reconnects the device automatically when it is lost.
+
+        :param interval: float (in s). Time between checks
+        :param silence: float (in s). Time without message meaning the device is lost
+        :param on_incident: callable(Dict) called after each reconnection
+        :return: ConnectionWatchdog
+        """
+        self.StopWatchdog()
+        self.__watchdog = ConnectionWatchdog(self, interval, silence, on_incident = on_incident)
+        self.__watchdog.start()
+        return self.__watchdog
+
+    def StopWatchdog(self):
+        watchdog, self.__watchdog = self.__watchdog, None
+        if watchdog is not None: watchdog.stop()
 
     def RegisterMessageCallback(self):
-        self.__RegisterMessageCallback(self.__serial, self.__fn)
+        self.__lib.RegisterMessageCallback(self.__serial, self.__fn)
 
     def GetNextMessage(self):
         """
 
         :return: Boolean (True if successful)
         """
-        res = self.__GetNextMessage(self.__serial, self.__messageQueue.msg_type, self.__messageQueue.msg_id,
-                                    self.__messageQueue.msg_data)
+        res = self.__lib.GetNextMessage(self.__serial, self.__messageQueue.msg_type, self.__messageQueue.msg_id,
+                                        self.__messageQueue.msg_data)
         return res
 
-    def GetHardwareInfoBlock(self):
+    def GetMessagePump(self):
+        """
+        Ring buffer of the last messages, with subscribe/unsubscribe, read and history.
+
+        :return: MessagePump
+        """
+        return self.__pump
+
+    def GetHardwareInfoBlock(self, refresh = False):
         """
 
+        :param refresh: Boolean. Queries the device instead of the hardware information cache
         :return: Dict
         """
         value = TLI_HardwareInformation()
-        self._error_check(self.__GetHardwareInfoBlock(self.__serial, value))
+        cached = None if refresh else hardware_cache.get(self.__hardwareKey, 'HardwareInfoBlock')
+        if cached is not None and len(cached) == 2 * sizeof(value):
+            value = TLI_HardwareInformation.from_buffer_copy(bytes.fromhex(cached))
+        elif not self._error_check(self.__lib.GetHardwareInfoBlock(self.__serial, value)):
+            hardware_cache.put(self.__hardwareKey, 'HardwareInfoBlock', bytes(value).hex())
         dict = {
             "Serial Number": value.serialNumber,
             "Model Number": value.modelNumber,
@@ -203,9 +385,9 @@ class TLKinesisPiezoDriver():
         return dict
 
     def SetZero(self):
-        return self._error_check(self.__SetZero(self.__serial))
+        return self._error_check(self.__lib.SetZero(self.__serial))
 
-    def SetPositionControlMode(self, mode):
+    def SetPositionControlMode(self, mode, force = False):
         """
 
         :param mode:
@@ -213,7 +395,217 @@ class TLKinesisPiezoDriver():
             2 => Closed loop
             3 => Open loop smoothed
             4 => Closed loop smoothed
-        :return:
+        :param force: Boolean. Sends the mode even if it is the current one
+        :return: Error Code
         """
         assert (mode == 1 or mode == 2 or mode == 3 or mode == 4)
-        return self._error_check(self.__SetPositionControlMode(self.__serial, mode))
+        if not self.__cache.request('PositionControlMode', mode, force): return 0
+        if self.__polling is not None: self.__polling.kick()
+        error = self._error_check(self.__lib.SetPositionControlMode(self.__serial, mode))
+        self.__cache.written('PositionControlMode', mode, not error)
+        return error
+
+    def SetPositionControlModeAsync(self, mode):
+        """
+        Non blocking SetPositionControlMode.
+
+        :param mode: 1 => Open loop, 2 => Closed loop, 3 => Open loop smoothed, 4 => Closed loop smoothed
+        :return: Future resolved with True when the device acknowledges the settings
+        """
+        if not self.__cache.changed('PositionControlMode', mode): #Nothing sent, nothing to acknowledge
+            future = Future()
+            future.set_running_or_notify_cancel()
+            future.set_result(True)
+            return future
+        future = self._settings_future()
+        if self.SetPositionControlMode(mode):
+            with self.__settingsLock:
+                if future in self.__settings: self.__settings.remove(future)
+            future.set_result(False)
+        return future
+
+    def GetPositionControlMode(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the settings cache
+        :return: int. 1 => Open loop, 2 => Closed loop, 3 => Open loop smoothed, 4 => Closed loop smoothed
+        """
+        if refresh or not self.__cache.known('PositionControlMode'):
+            return self.__cache.read('PositionControlMode', self.__lib.GetPositionControlMode(self.__serial))
+        return self.__cache.get('PositionControlMode')
+
+    def GetMaxOutputVoltage(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the settings cache
+        :return: int (in tenths of volt)
+        """
+        if refresh or not self.__cache.known('MaxOutputVoltage'):
+            return self.__cache.read('MaxOutputVoltage', self.__lib.GetMaxOutputVoltage(self.__serial))
+        return self.__cache.get('MaxOutputVoltage')
+
+    def SetMaxOutputVoltage(self, value, force = False):
+        """
+
+        :param value: int (in tenths of volt), 750, 1000 or 1500
+        :param force: Boolean. Sends the value even if it is the current one
+        :return: Error Code
+        """
+        if not self.__cache.request('MaxOutputVoltage', value, force): return 0
+        error = self._error_check(self.__lib.SetMaxOutputVoltage(self.__serial, value))
+        self.__cache.written('MaxOutputVoltage', value, not error)
+        return error
+
+    def _send_setting(self, key, value):
+        if key == 'PositionControlMode': self.SetPositionControlMode(value, force = True)
+        elif key == 'MaxOutputVoltage': self.SetMaxOutputVoltage(value, force = True)
+        else: raise ValueError(f'Unknown setting {key}.')
+
+    def GetSettings(self, read = False):
+        """
+
+        :param read: Boolean. Reads the control mode and the maximum output voltage from the device first
+        :return: Dict (setting => value), for ApplySettings or SaveProfile
+        """
+        if read:
+            self.GetPositionControlMode(refresh = True)
+            self.GetMaxOutputVoltage(refresh = True)
+        return self.__cache.snapshot()
+
+    def ApplySettings(self, settings, force = False):
+        """
+        Sends the settings the device does not have already.
+
+        :param settings: Dict (GetSettings)
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.__cache.apply(settings, self._send_setting, force)
+
+    def SaveProfile(self, name, path = None):
+        """
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :return: Dict. Settings saved
+        """
+        settings = self.GetSettings()
+        save_profile(name, settings, path)
+        return settings
+
+    def LoadProfile(self, name, path = None, force = False):
+        """
+        Applies a profile saved with SaveProfile, sending only the settings that differ.
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.ApplySettings(load_profile(name, path), force)
+
+    def GetOutputVoltage(self):
+        """
+
+        :return: int. Output voltage, [-32767, 32767] of the maximum output voltage
+        """
+        return self.__lib.GetOutputVoltage(self.__serial)
+
+    def SetOutputVoltage(self, value):
+        """
+        Open loop setpoint.
+
+        :param value: int. [-32767, 32767] of the maximum output voltage
+        :return: Error Code
+        """
+        return self._error_check(self.__lib.SetOutputVoltage(self.__serial, value))
+
+    def GetPosition(self):
+        """
+
+        :return: int. Position, [0, 32767] of the travel
+        """
+        return self.__lib.GetPosition(self.__serial)
+
+    def SetPosition(self, value):
+        """
+        Closed loop setpoint.
+
+        :param value: int. [0, 32767] of the travel
+        :return: Error Code
+        """
+        return self._error_check(self.__lib.SetPosition(self.__serial, value))
+
+    def GetLUTwaveParams(self):
+        """
+
+        :return: Dict
+        """
+        value = PZ_LUTWaveParameters()
+        self._error_check(self.__lib.GetLUTwaveParams(self.__serial, value))
+        return {name: getattr(value, name) for name, ctype in PZ_LUTWaveParameters._fields_}
+
+    def SetLUTwaveParams(self, cycleLength, LUTValueDelay = 1, numCycles = 1, mode = LUT_CONTINUOUS,
+                         preCycleDelay = 0, postCycleDelay = 0, outTriggerStart = 0, outTriggerDuration = 0,
+                         numOutTriggerRepeat = 0):
+        """
+
+        :param cycleLength: int. Number of samples played, [1, LUT_SIZE]
+        :param LUTValueDelay: int (in ms). Time on each sample
+        :param numCycles: int. Used in LUT_FIXED mode
+        :param mode: LUT_CONTINUOUS or LUT_FIXED (plus trigger flags)
+        :return: Error Code
+        """
+        assert 0 < cycleLength <= LUT_SIZE
+        value = PZ_LUTWaveParameters(mode, cycleLength, numCycles, LUTValueDelay, preCycleDelay, postCycleDelay,
+                                     outTriggerStart, outTriggerDuration, numOutTriggerRepeat)
+        return self._error_check(self.__lib.SetLUTwaveParams(self.__serial, value))
+
+    def SetLUTwaveSample(self, index, value):
+        """
+
+        :param index: int. [0, LUT_SIZE - 1]
+        :param value: int. Output voltage or position, as SetOutputVoltage and SetPosition
+        :return: Error Code
+        """
+        return self._error_check(self.__lib.SetLUTwaveSample(self.__serial, index, value))
+
+    def UploadLUTwave(self, samples, LUTValueDelay = 1, numCycles = 1, mode = LUT_CONTINUOUS):
+        """
+        Writes a whole waveform in the device look-up table and its parameters. StartLUTwave plays it.
+
+        :param samples: sequence of int (see Kinesis_Waveform), at most LUT_SIZE
+        :param LUTValueDelay: int (in ms). Time on each sample
+        :param numCycles: int. Used in LUT_FIXED mode
+        :param mode: LUT_CONTINUOUS or LUT_FIXED
+        :return: Error Code
+        """
+        assert 0 < len(samples) <= LUT_SIZE
+        function, serial = self.__lib.SetLUTwaveSample, self.__serial
+        for index, value in enumerate(samples):
+            error = function(serial, index, int(value))
+            if error: return self._error_check(error)
+        return self.SetLUTwaveParams(len(samples), LUTValueDelay, numCycles, mode)
+
+    def StartLUTwave(self):
+        return self._error_check(self.__lib.StartLUTwave(self.__serial))
+
+    def StopLUTwave(self):
+        return self._error_check(self.__lib.StopLUTwave(self.__serial))
+
+    def StreamSetpoints(self, points, spin = 0.001, late = 0.0005, skip_late = True):
+        """
+        Sends host computed setpoints at their times from a dedicated thread: SetPosition in
+        closed loop, SetOutputVoltage in open loop.
+
+        :param points: array (n, 2) of (t in s from now, setpoint)
+        :param spin: float (in s). Busy-wait before each deadline
+        :param late: float (in s). Dispatch error counted as a missed deadline
+        :param skip_late: Boolean. Drops a setpoint if the next one is already due
+        :return: SetpointStreamer, started (wait, stop, stats)
+        """
+        closed = self.GetPositionControlMode() in (2, 4)
+        function, serial = (self.__lib.SetPosition if closed else self.__lib.SetOutputVoltage), self.__serial
+        streamer = SetpointStreamer(lambda value: function(serial, value), points, spin, late, skip_late)
+        streamer.start()
+        return streamer
@@ -0,0 +1,160 @@
+"""
+Move-and-measure pipeline: step a KIM101 channel, read the KSG101, repeat.
+
+The strain gauge streams in the background (StartStreaming), so measuring a point is
+only waiting for `samples` readings taken after the settle criterion. The next move is
+sent as soon as they are in and the record goes to a writer thread, so writing the data
+of a point overlaps the motion to the next one.
+
+    >>> pipeline = MoveMeasurePipeline(my_motor, my_gauge, channel=1, settle_time=0.01)
+    >>> records = pipeline.run(numpy.arange(0, 1000, 10))
+    >>> pipeline.stats['Points/s'] #Compare with run_naive
+"""
+
+from Modules import Kinesis_Instrumentation
+
+import numpy
+import queue, threading, time
+
+RECORD_DTYPE = numpy.dtype([('target', 'i4'), ('position', 'i4'), ('reading', 'f8'), ('std', 'f8'),
+                            ('overrange', '?'), ('moved', 'f8'), ('settled', 'f8'), ('measured', 'f8')])
+
+class MoveMeasurePipeline():
+
+    def __init__(self, motor, gauge, channel = 1, settle_time = 0.0, samples = 10, rate = 1000.0,
+                 tolerance = None, settle_timeout = 1.0, sink = None, timeout = 5.0):
+        """
+
+        :param motor: TLKinesisInertialMotor
+        :param gauge: TLKinesisStrainGauge, display mode already set
+        :param channel: [1 - 4] KIM101 channel
+        :param settle_time: float (in s) waited after the move completed
+        :param samples: int. Readings averaged per point
+        :param rate: float (in Hz). Strain gauge sampling rate
+        :param tolerance: float. If given, also waits until the std of the last samples readings is below it
+        :param settle_timeout: float (in s). Longest wait for the tolerance
+        :param sink: callable(record) called from the writer thread for every point
+        :param timeout: float (in s). Longest wait for the readings of a point; the point gets NaN
+        readings if they do not come (or the streaming stopped)
+        """
+        self.motor = motor
+        self.gauge = gauge
+        self.channel = channel
+        self.settle_time = settle_time
+        self.samples = samples
+        self.rate = rate
+        self.tolerance = tolerance
+        self.settle_timeout = settle_timeout
+        self.sink = sink
+        self.timeout = timeout
+        self.stats = {}
+
+    def _writer(self, records, pending):
+        while True:
+            index = pending.get()
+            if index is None: return
+            if self.sink is not None: self.sink(records[index])
+
+    def _wait_samples(self, stream, after):
+        #Waits until samples readings taken after `after` are in the stream. None if the stream
+        #stopped or they did not come within timeout.
+        deadline = max(time.perf_counter(), after) + self.timeout
+        while True:
+            block = stream.latest(self.samples)
+            if len(block) == self.samples and block['timestamp'][0] >= after: return block
+            if not stream.running() or time.perf_counter() > deadline:
+                Kinesis_Instrumentation.timeout('MoveMeasurePipeline.run')
+                print('Timeout achieved. No reading for this point.')
+                return None
+            time.sleep(max(self.samples - numpy.count_nonzero(block['timestamp'] >= after), 1) / self.rate)
+
+    def run(self, targets):
+        """
+
+        :param targets: absolute positions of the channel
+        :return: numpy structured array, one record per target
+        """
+        targets = numpy.asarray(targets)
+        records = numpy.zeros(len(targets), dtype = RECORD_DTYPE)
+        pending = queue.Queue()
+        writer = threading.Thread(target = self._writer, args = (records, pending), name = 'Pipeline writer',
+                                  daemon = True)
+        writer.start()
+        stream = self.gauge.StartStreaming(self.rate, max(100 * self.samples, 10000))
+
+        begin = time.perf_counter()
+        future = self.motor.MoveAbsoluteAsync(self.channel, int(targets[0])) if len(targets) else None
+        moved = begin
+        missed = 0
+        try:
+            for index, target in enumerate(targets):
+                future.result()
+                settled = time.perf_counter() + self.settle_time
+                block = self._wait_samples(stream, settled)
+                while block is not None and self.tolerance is not None and block['reading'].std() > self.tolerance \
+                        and time.perf_counter() - settled < self.settle_timeout:
+                    newer = self._wait_samples(stream, block['timestamp'][-1])
+                    if newer is None: break
+                    block = newer
+                measured = time.perf_counter()
+                position = self.motor.GetCachedPositionAll()[self.channel - 1]
+                if index + 1 < len(targets): #Next move first, then bookkeeping
+                    future = self.motor.MoveAbsoluteAsync(self.channel, int(targets[index + 1]))
+                record = records[index]
+                record['target'] = target
+                record['position'] = position
+                if block is None:
+                    record['reading'] = record['std'] = numpy.nan
+                    missed += 1
+                else:
+                    record['reading'] = block['reading'].mean()
+                    record['std'] = block['reading'].std()
+                    record['overrange'] = block['overrange'].any()
+                record['moved'], record['settled'], record['measured'] = moved, settled, measured
+                moved = measured
+                pending.put(index)
+        finally:
+            self.gauge.StopStreaming()
+            pending.put(None)
+            writer.join()
+        self._stats(begin, len(targets), missed)
+        return records
+
+    def run_naive(self, targets):
+        """
+        Reference loop: blocking MoveAbsolute, sleep settle_time, samples GetReadingExt, write.
+
+        :param targets: absolute positions of the channel
+        :return: numpy structured array, one record per target
+        """
+        targets = numpy.asarray(targets)
+        records = numpy.zeros(len(targets), dtype = RECORD_DTYPE)
+        period = 1.0 / self.rate if self.rate else 0.0
+        begin = time.perf_counter()
+        for index, target in enumerate(targets):
+            record = records[index]
+            record['moved'] = time.perf_counter()
+            self.motor.MoveAbsolute(self.channel, int(target))
+            time.sleep(self.settle_time)
+            record['settled'] = time.perf_counter()
+            readings = []
+            overrange = False
+            for x in range(self.samples):
+                value, over = self.gauge.GetReadingExt(False)
+                readings.append(value)
+                overrange |= over.value
+                if period: time.sleep(period)
+            record['measured'] = time.perf_counter()
+            record['target'] = target
+            record['position'] = self.motor.GetCachedPositionAll()[self.channel - 1]
+            record['reading'] = numpy.mean(readings)
+            record['std'] = numpy.std(readings)
+            record['overrange'] = overrange
+            if self.sink is not None: self.sink(record)
+        self._stats(begin, len(targets))
+        return records
+
+    def _stats(self, begin, points, missed = 0):
+        elapsed = time.perf_counter() - begin
+        self.stats = {"Points": points, "Elapsed": elapsed, "Points/s": points / elapsed if elapsed else 0.0,
+                      "Missed": missed}
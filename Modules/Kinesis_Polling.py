@@ -0,0 +1,98 @@
+"""
+Adaptive polling of the K-Cube devices.
+
+The DLL polls a device at a fixed interval set by StartPolling. AdaptivePolling switches
+the device to a fast interval as soon as the driver starts a move, a settings change or
+an acquisition, and back to a slow interval once the driver has been idle for `hold`
+seconds (hysteresis: short gaps between moves keep the fast interval, the bus and the
+callback thread are quiet at rest).
+
+StartPolling is never called from the DLL callback thread: a small thread owned by
+AdaptivePolling applies the changes.
+"""
+
+import threading, time
+
+class AdaptivePolling():
+
+    def __init__(self, start_polling, busy, fast = 10, slow = 200, hold = 1.0):
+        """
+
+        :param start_polling: callable(interval in ms), as the driver's StartPolling
+        :param busy: callable returning True while the driver waits for the device
+        :param fast: int (in ms). Interval while busy
+        :param slow: int (in ms). Interval while idle
+        :param hold: float (in s). Idle time before going back to slow
+        """
+        assert 0 < fast <= slow
+        self.fast = fast
+        self.slow = slow
+        self.hold = hold
+        self.interval = None
+        self.switches = 0
+        self.__start_polling = start_polling
+        self.__busy = busy
+        self.__kick = threading.Event()
+        self.__stop = threading.Event()
+        self.__lastBusy = time.perf_counter()
+        self.__since = None
+        self.__fastTime = 0.0
+        self.__thread = None
+
+    def start(self):
+        self.__stop.clear()
+        self._set(self.slow)
+        self.__thread = threading.Thread(target = self._run, name = 'Adaptive polling', daemon = True)
+        self.__thread.start()
+
+    def stop(self, interval = None):
+        """
+
+        :param interval: int (in ms). Constant interval kept afterwards, slow if None
+        :return: None
+        """
+        self.__stop.set()
+        self.__kick.set()
+        thread = self.__thread
+        if thread is not None and thread is not threading.current_thread(): thread.join()
+        self._set(self.slow if interval is None else interval)
+
+    def kick(self):
+        """
+        Called by the driver when it starts waiting for the device: switches to fast now.
+
+        :return: None
+        """
+        self.__lastBusy = time.perf_counter()
+        if self.interval != self.fast: self.__kick.set()
+
+    def _set(self, interval):
+        now = time.perf_counter()
+        if self.interval == self.fast and self.__since is not None: self.__fastTime += now - self.__since
+        if interval != self.interval:
+            self.__start_polling(interval)
+            self.switches += 1
+        self.interval = interval
+        self.__since = now
+
+    def _run(self):
+        while True:
+            self.__kick.wait(self.hold / 4 if self.interval == self.fast else None)
+            self.__kick.clear()
+            if self.__stop.is_set(): return
+            now = time.perf_counter()
+            if self.__busy(): self.__lastBusy = now
+            if now - self.__lastBusy < self.hold:
+                if self.interval != self.fast: self._set(self.fast)
+            elif self.interval != self.slow:
+                self._set(self.slow)
+
+    def stats(self):
+        """
+
+        :return: Dict
+        """
+        fast = self.__fastTime
+        if self.interval == self.fast and self.__since is not None: fast += time.perf_counter() - self.__since
+        return {"Interval": self.interval, "Fast": self.fast, "Slow": self.slow, "Hold": self.hold,
+                "Switches": self.switches, "Time fast": fast}
@@ -0,0 +1,207 @@
+"""
+Append-only recording of positions, readings and messages in a memory-mapped file.
+
+A recording is a 4096 byte header (magic, record dtype, number of committed records,
+allocated capacity) followed by fixed size records. The file grows by chunks of
+preallocated records; each record is written in place through a numpy.memmap and the
+count in the header is updated after it, so a reader (even in another process, while
+the recording goes on) sees only complete records:
+
+    >>> recorder = record_positions(my_motor, 'scan.krec')
+    >>> ... #Scan
+    >>> recorder.close()
+    >>> data = open_recording('scan.krec') #numpy.memmap, no copy
+    >>> data['timestamp'], data['position'][:, 0]
+"""
+
+import numpy
+import ast, threading
+
+MAGIC = b'KREC'
+VERSION = 1
+HEADER_SIZE = 4096
+CHUNK = 65536 #Records allocated at once
+
+HEADER_DTYPE = numpy.dtype([('magic', 'S4'), ('version', 'u4'), ('header_size', 'u4'), ('itemsize', 'u4'),
+                            ('count', 'u8'), ('capacity', 'u8'), ('chunk', 'u8'),
+                            ('descr', f'S{HEADER_SIZE - 40}')])
+
+POSITION_DTYPE = numpy.dtype([('timestamp', 'f8'), ('position', 'i4', (4,))])
+READING_DTYPE = numpy.dtype([('timestamp', 'f8'), ('reading', 'i4'), ('overrange', '?')])
+MESSAGE_DTYPE = numpy.dtype([('timestamp', 'f8'), ('type', 'u4'), ('id', 'u4'), ('data', 'u4')])
+
+class Recorder():
+
+    def __init__(self, path, dtype, chunk = CHUNK):
+        """
+        Creates (overwrites) a recording.
+
+        :param path: str
+        :param dtype: numpy dtype of the records
+        :param chunk: int. Records allocated each time the file grows
+        """
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.chunk = chunk
+        self.count = 0
+        self.__lock = threading.Lock()
+        self.__detach = []
+        descr = repr(numpy.lib.format.dtype_to_descr(self.dtype)).encode()
+        if len(descr) > HEADER_DTYPE['descr'].itemsize: raise ValueError('Record dtype too long for the header.')
+        with open(path, 'wb') as f:
+            header = numpy.zeros((), HEADER_DTYPE)
+            header['magic'], header['version'], header['header_size'] = MAGIC, VERSION, HEADER_SIZE
+            header['itemsize'], header['chunk'], header['descr'] = self.dtype.itemsize, chunk, descr
+            f.write(header.tobytes())
+        self.__header = numpy.memmap(path, HEADER_DTYPE, 'r+', 0, ())
+        self.__data = None
+        self._grow(chunk)
+
+    def _grow(self, capacity):
+        if self.__data is not None:
+            self.__data.flush()
+            self.__data = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + capacity * self.dtype.itemsize)
+        self.__data = numpy.memmap(self.path, self.dtype, 'r+', HEADER_SIZE, (capacity,))
+        self.__header['capacity'] = capacity
+
+    def append(self, records):
+        """
+
+        :param records: record tuple, or structured array of records with the recorder dtype
+        :return: int. Number of records in the file
+        """
+        with self.__lock:
+            if self.__data is None: raise ValueError(f'{self.path} is closed.')
+            if isinstance(records, tuple):
+                if self.count == len(self.__data): self._grow(len(self.__data) + self.chunk)
+                self.__data[self.count] = records
+                self.count += 1
+            else:
+                n = len(records)
+                if self.count + n > len(self.__data):
+                    self._grow(-(-(self.count + n) // self.chunk) * self.chunk)
+                self.__data[self.count:self.count + n] = records
+                self.count += n
+            self.__header['count'] = self.count #After the records: readers see complete records only
+            return self.count
+
+    def attach(self, detach):
+        """
+
+        :param detach: callable() called by close, e.g. to unsubscribe the source
+        :return: None
+        """
+        self.__detach.append(detach)
+
+    def flush(self):
+        """
+        Writes the records and the count to disk.
+
+        :return: None
+        """
+        with self.__lock:
+            if self.__data is not None: self.__data.flush()
+            self.__header.flush()
+
+    def close(self, trim = True):
+        """
+
+        :param trim: Boolean. Frees the preallocated records not written
+        :return: None
+        """
+        for detach in self.__detach: detach()
+        self.__detach = []
+        with self.__lock:
+            if self.__data is None: return
+            self.__data.flush()
+            self.__data = None
+            if trim:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+                self.__header['capacity'] = self.count
+            self.__header.flush()
+            self.__header = None
+
+
+def read_header(path):
+    """
+
+    :param path: str
+    :return: Dict (dtype, count, capacity, chunk)
+    """
+    header = numpy.fromfile(path, HEADER_DTYPE, 1)
+    if not len(header) or header['magic'][0] != MAGIC or header['version'][0] != VERSION:
+        raise ValueError(f'{path} is not a Kinesis recording.')
+    header = header[0]
+    dtype = numpy.lib.format.descr_to_dtype(ast.literal_eval(header['descr'].decode()))
+    return {"dtype": dtype, "count": int(header['count']), "capacity": int(header['capacity']),
+            "chunk": int(header['chunk'])}
+
+def open_recording(path):
+    """
+    Records committed so far. Can be called while recording; call again to see the new ones.
+
+    :param path: str
+    :return: numpy.memmap (read only) of the records
+    """
+    header = read_header(path)
+    if not header["count"]: return numpy.zeros(0, header["dtype"])
+    return numpy.memmap(path, header["dtype"], 'r', HEADER_SIZE, (header["count"],))
+
+def record_messages(driver, path, chunk = CHUNK):
+    """
+    Records every message of a driver.
+
+    :param driver: TLKinesisInertialMotor, TLKinesisStrainGauge or TLKinesisPiezoDriver
+    :return: Recorder (close to stop)
+    """
+    recorder = Recorder(path, MESSAGE_DTYPE, chunk)
+    pump = driver.GetMessagePump()
+
+    def callback(msg_type, msg_id, data, timestamp):
+        recorder.append((timestamp, msg_type, msg_id, data))
+    pump.subscribe(callback)
+    recorder.attach(lambda: pump.unsubscribe(callback))
+    return recorder
+
+def record_positions(motor, path, chunk = CHUNK):
+    """
+    Records GetCurrentPositionAll on every message of the KIM101 (the DLL polling rate).
+
+    :param motor: TLKinesisInertialMotor
+    :return: Recorder (close to stop)
+    """
+    recorder = Recorder(path, POSITION_DTYPE, chunk)
+    pump = motor.GetMessagePump()
+
+    def callback(msg_type, msg_id, data, timestamp):
+        recorder.append((timestamp, motor.GetCurrentPositionAll()))
+    pump.subscribe(callback)
+    recorder.attach(lambda: pump.unsubscribe(callback))
+    return recorder
+
+def record_readings(gauge, path, rate = 1000.0, block = 100, clip = False, chunk = CHUNK):
+    """
+    Streams the KSG101 (StartStreaming) and records every sample, a block at a time.
+
+    :param gauge: TLKinesisStrainGauge, display mode already set
+    :param rate: float (in Hz)
+    :param block: int. Samples written at once
+    :return: Recorder (close to stop the streaming)
+    """
+    recorder = Recorder(path, READING_DTYPE, chunk)
+    stream = gauge.StartStreaming(rate, max(100 * block, 100000), clip)
+
+    def run():
+        for samples in stream.blocks(block):
+            recorder.append(samples)
+    thread = threading.Thread(target = run, name = 'Strain gauge recorder', daemon = True)
+    thread.start()
+
+    def detach():
+        gauge.StopStreaming()
+        thread.join()
+    recorder.attach(detach)
+    return recorder
@@ -0,0 +1,426 @@
+"""
+Capture of the DLL traffic and replay of it without the devices.
+
+Capture installs a call wrapper in Kinesis_Backend: every bound call (function, arguments,
+result, pointer arguments after the call, duration) and every LOGGERFUNC callback is
+appended to a binary trace with its time. The capture must be started before the drivers
+register their callbacks:
+
+    >>> capture = Capture('session.ktrace')
+    >>> my_motor = TLKinesisInertialMotor('97101411')
+    >>> ... #Session
+    >>> capture.close()
+
+replay() loads a trace and selects the 'replay' backend. The drivers opened afterwards
+(same serial numbers) get the recorded results and pointer values of each function in
+order; the messages are returned by GetNextMessage and the callbacks are fired at their
+recorded times divided by speed, and each call lasts its recorded duration. Each device has
+its own clock, started by its first call. The clock does not pass the next recorded command
+(Open, Move..., Set..., anything but Get..., Request..., Check...) before the program sends
+it, and is held back when a call comes later than recorded, so the replies never come
+before the requests:
+
+    >>> player = replay('session.ktrace', speed=10)
+    >>> my_motor = TLKinesisInertialMotor('97101411')
+    >>> ... #Same session, 10 times faster
+    >>> player.stats()
+
+Trace file: MAGIC, then frames of a 23 byte header (body length, kind, name id, time and
+duration in ns) and a Kinesis_Server encoded body. NAME frames give the name ids.
+"""
+
+from Modules.Kinesis_Backend import LOGGERFUNC
+from Modules.Kinesis_Server import encode, decode
+from Modules import Kinesis_Backend
+
+import ctypes
+import bisect, struct, threading, time
+
+MAGIC = b'KTRACE1\n'
+FRAME = struct.Struct('<IBHqq') #Body length, kind, name id, time (ns), duration (ns)
+NAME, CALL, CALLBACK = 1, 2, 3
+MESSAGE, COMMAND, QUERY = 'message', 'command', 'query'
+
+_QUERIES = ('Get', 'Request', 'Check', 'MessageQueueSize', 'PollingDuration') #Device functions that change nothing
+
+_BUFFERS = (ctypes._SimpleCData, ctypes.Structure, ctypes.Union, ctypes.Array)
+
+def _deref(arg):
+    #Pointer arguments may come as the ctypes object itself, byref(obj) or pointer(obj).
+    if hasattr(arg, '_obj'): return arg._obj
+    if hasattr(arg, 'contents'): return arg.contents
+    return arg
+
+def _buffer(arg):
+    #ctypes object behind a pointer argument, None for values and callbacks.
+    obj = _deref(arg)
+    return obj if isinstance(obj, _BUFFERS) and not isinstance(obj, ctypes._CFuncPtr) else None
+
+def _serial(function, args):
+    return args[0] if args and isinstance(args[0], bytes) and not function.startswith('TLI_') else b''
+
+def _kind(function):
+    prefix, name = function.split('_', 1)
+    if name == 'GetNextMessage': return MESSAGE
+    return QUERY if prefix == 'TLI' or name.startswith(_QUERIES) else COMMAND
+
+def _values(args, pointers):
+    #Arguments identifying a call (channel...): values only.
+    return tuple(None if pointer or x is None else x for x, pointer in zip(args, pointers))
+
+
+class Capture():
+
+    def __init__(self, path):
+        """
+        Starts capturing every DLL call to path.
+
+        :param path: str
+        """
+        self.path = path
+        self.calls = 0
+        self.callbacks = 0
+        self.__file = open(path, 'wb', buffering = 1 << 20)
+        self.__file.write(MAGIC)
+        self.__names = {}
+        self.__lock = threading.Condition()
+        self.__active = set() #Threads running a captured callback
+        self.__closing = False
+        self.__loggers = {} #(dllname, serial) -> LOGGERFUNC given to the DLL, kept alive
+        self.__start = time.perf_counter_ns()
+        Kinesis_Backend.add_call_wrapper(self._wrapper)
+
+    def _name(self, dllname, function):
+        #Called with the lock held.
+        key = (dllname, function)
+        index = self.__names.get(key)
+        if index is None:
+            index = self.__names[key] = len(self.__names)
+            body = encode(key)
+            self.__file.write(FRAME.pack(len(body), NAME, index, 0, 0) + body)
+        return index
+
+    def _write(self, kind, dllname, function, t, duration, value):
+        body = encode(value)
+        with self.__lock:
+            if self.__file.closed: return
+            index = self._name(dllname, function)
+            self.__file.write(FRAME.pack(len(body), kind, index, t, duration) + body)
+
+    def _wrapper(self, dllname, function, call, restype):
+        clock, start = time.perf_counter_ns, self.__start
+        register = function.endswith('_RegisterMessageCallback')
+
+        def captured(*args):
+            if register: args = args[:-1] + (self._logger(dllname, _serial(function, args), args[-1]),)
+            buffers = [_buffer(x) for x in args]
+            inputs = [bytes(x) if b is not None else (None if isinstance(x, ctypes._CFuncPtr) else x)
+                      for x, b in zip(args, buffers)]
+            t = clock()
+            result = call(*args)
+            duration = clock() - t
+            outputs = [bytes(b) if b is not None else None for b in buffers]
+            self.calls += 1
+            self._write(CALL, dllname, function, t - start, duration, (inputs, result, outputs))
+            return result
+        captured.__name__ = function
+        return captured
+
+    def _logger(self, dllname, serial, callback):
+        clock, start = time.perf_counter_ns, self.__start
+
+        def logged(p):
+            thread = threading.get_ident()
+            with self.__lock:
+                if self.__closing: return callback(p)
+                self.__active.add(thread)
+            t = clock()
+            try:
+                callback(p)
+            finally:
+                self.callbacks += 1
+                self._write(CALLBACK, dllname, 'callback', t - start, clock() - t, serial)
+                with self.__lock:
+                    self.__active.discard(thread)
+                    self.__lock.notify_all()
+        logger = self.__loggers[(dllname, serial)] = LOGGERFUNC(logged)
+        return logger
+
+    def close(self, timeout = 5.0):
+        """
+        Stops the capture. The drivers call the DLL directly again. The callbacks running
+        (the one that resolved the last future of the program, typically) are captured to the end.
+
+        :param timeout: float (in s). Wait for the callbacks running
+        :return: None
+        """
+        thread = threading.get_ident()
+        with self.__lock:
+            self.__closing = True
+            self.__lock.wait_for(lambda: not self.__active - {thread}, timeout)
+        Kinesis_Backend.remove_call_wrapper(self._wrapper)
+        with self.__lock:
+            if not self.__file.closed: self.__file.close()
+
+
+class Trace():
+    """
+    Content of a trace file.
+        calls: (dllname, function, serial) -> list of (t, duration, args, result, outputs), t in s
+        exact: (dllname, function, argument values) -> the same lists, per argument values
+        callbacks: (dllname, serial) -> list of (t, duration)
+    """
+    def __init__(self, path):
+        self.calls = {}
+        self.exact = {}
+        self.callbacks = {}
+        names = {}
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC): raise ValueError(f'{path} is not a Kinesis trace.')
+        offset = len(MAGIC)
+        while offset + FRAME.size <= len(data):
+            size, kind, index, t, duration = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            if offset + size > len(data): break #Truncated by a crash
+            value = decode(data, offset)[0]
+            offset += size
+            if kind == NAME:
+                names[index] = tuple(value)
+            elif kind == CALL:
+                dllname, function = names[index]
+                args, result, outputs = value
+                record = (t / 1e9, duration / 1e9, args, result, outputs)
+                self.calls.setdefault((dllname, function, _serial(function, args)), []).append(record)
+                values = _values(args, [x is not None for x in outputs])
+                self.exact.setdefault((dllname, function, values), []).append(record)
+            elif kind == CALLBACK:
+                self.callbacks.setdefault((names[index][0], value), []).append((t / 1e9, duration / 1e9))
+        for callbacks in self.callbacks.values(): callbacks.sort()
+
+    def duration(self):
+        """
+
+        :return: float (in s). Time of the last event
+        """
+        last = [x[-1][0] for x in list(self.calls.values()) + list(self.callbacks.values())]
+        return max(last, default = 0.0)
+
+
+class _Queue():
+    #Recorded calls of one function of one device.
+
+    def __init__(self, records, kind):
+        if kind == MESSAGE: records = [x for x in records if x[3]] #Only the calls that returned a message
+        self.records = records
+        self.times = [x[0] for x in records]
+        self.kind = kind
+        self.cursor = 0
+
+    def next(self, now):
+        """
+
+        :return: (record to replay or None if there is none yet, True if taken in order)
+        """
+        if not self.records: return None, False
+        if self.kind == MESSAGE: #In order, not before its time
+            if self.cursor >= len(self.records) or self.records[self.cursor][0] > now: return None, False
+            index = self.cursor
+        elif self.kind == COMMAND: #In order, the last one again once exhausted
+            index = min(self.cursor, len(self.records) - 1)
+        else: #In order, catching up with the clock if called less often than in the trace
+            index = min(max(self.cursor, bisect.bisect_right(self.times, now) - 1), len(self.records) - 1)
+        ordered = index == self.cursor and self.kind != MESSAGE #Messages are late by design
+        self.cursor = index + 1
+        return self.records[index], ordered
+
+
+class _Timeline():
+    #Clock and callbacks of one device (or of the TLI_ functions of one DLL).
+
+    def __init__(self, callbacks, commands):
+        self.callbacks = callbacks #Recorded (t, duration)
+        self.commands = commands #Recorded times of the commands
+        self.replayed = 0 #Commands replayed
+        self.start = None #perf_counter time of trace time 0
+        self.released = 0.0 #Messages drained by the callbacks fired so far are due (trace time)
+        self.callback = None
+        self.thread = None
+
+    def barrier(self):
+        #The clock waits for the program at the next command.
+        return self.commands[self.replayed] if self.replayed < len(self.commands) else float('inf')
+
+    def raw(self, speed):
+        return (time.perf_counter() - self.start) * speed
+
+    def now(self, speed):
+        return min(self.raw(speed), self.barrier())
+
+
+class Replay():
+
+    def __init__(self, trace, speed = 1.0, latency = True):
+        """
+
+        :param trace: Trace
+        :param speed: float. Time scale (2 => twice faster than recorded)
+        :param latency: Boolean. Calls last their recorded duration
+        """
+        self.trace = trace
+        self.speed = speed
+        self.latency = latency
+        self.counters = {"Calls": 0, "Unrecorded": 0, "Callbacks": 0, "Resyncs": 0}
+        self.lags = [] #Callback firing time - recorded time (in s)
+        self.delay = 0.0 #Time the clocks were held back for the program (in s)
+        self.__queues = {key: _Queue(records, _kind(key[1])) for key, records in trace.calls.items()}
+        self.__exact = {key: _Queue(records, _kind(key[1])) for key, records in trace.exact.items()}
+        self.__commands = {}
+        for (dllname, function, serial), records in trace.calls.items():
+            if _kind(function) == COMMAND: self.__commands.setdefault((dllname, serial), []).extend(x[0] for x in records)
+        for commands in self.__commands.values(): commands.sort()
+        self.__timelines = {} #(dllname, serial) -> _Timeline
+        self.__lock = threading.Condition()
+        self.__stop = False
+
+    def stop(self):
+        with self.__lock:
+            self.__stop = True
+            self.__lock.notify_all()
+        for timeline in list(self.__timelines.values()):
+            if timeline.thread is not None and timeline.thread is not threading.current_thread():
+                timeline.thread.join()
+
+    def finished(self):
+        """
+
+        :return: Boolean (True once every registered device fired its last callback)
+        """
+        threads = [x.thread for x in self.__timelines.values() if x.thread is not None]
+        return bool(threads) and not any(x.is_alive() for x in threads)
+
+    def _timeline(self, dllname, serial):
+        #Called with the lock held.
+        timeline = self.__timelines.get((dllname, serial))
+        if timeline is None:
+            timeline = self.__timelines[(dllname, serial)] = _Timeline(
+                self.trace.callbacks.get((dllname, serial), []), self.__commands.get((dllname, serial), []))
+        return timeline
+
+    def _fire(self, timeline, first):
+        speed = self.speed
+        for t, duration in timeline.callbacks[first:]:
+            with self.__lock:
+                while not self.__stop:
+                    if t > timeline.barrier(): #Waiting for a command of the program
+                        self.__lock.wait()
+                        continue
+                    delay = timeline.start + t / speed - time.perf_counter()
+                    if delay <= 0: break
+                    self.__lock.wait(delay)
+                if self.__stop: return
+                self.lags.append(timeline.raw(speed) - t)
+                timeline.released = t + duration
+            timeline.callback(None)
+            self.counters["Callbacks"] += 1
+
+    def call(self, dllname, function, restype, args):
+        """
+        Replays one call.
+
+        :return: the recorded result, pointer arguments filled with the recorded values
+        """
+        serial = _serial(function, args)
+        values = _values(args, [_buffer(x) is not None or isinstance(x, ctypes._CFuncPtr) for x in args])
+        queue = self.__exact.get((dllname, function, values)) or self.__queues.get((dllname, function, serial))
+        with self.__lock:
+            timeline = self._timeline(dllname, serial)
+            if timeline.start is None: #First call of the device: its clock starts at the recorded time
+                first = queue.records[queue.cursor][0] if queue is not None and queue.records else 0.0
+                timeline.start = time.perf_counter() - first / self.speed
+            if queue is None: record, ordered = None, False
+            elif queue.kind == MESSAGE: record, ordered = queue.next(max(timeline.now(self.speed), timeline.released))
+            else: record, ordered = queue.next(timeline.now(self.speed))
+            if ordered:
+                raw = timeline.raw(self.speed)
+                if record[0] < raw: #The program is late: the events after this call wait for it
+                    timeline.start += (raw - record[0]) / self.speed
+                    self.delay += (raw - record[0]) / self.speed
+                    self.counters["Resyncs"] += 1
+                if queue.kind == COMMAND:
+                    timeline.replayed += 1
+                    self.__lock.notify_all()
+            if function.endswith('_RegisterMessageCallback') and timeline.thread is None:
+                timeline.callback = args[-1]
+                first = bisect.bisect_left(timeline.callbacks, (timeline.now(self.speed),)) #Registered after them
+                timeline.thread = threading.Thread(target = self._fire, args = (timeline, first), daemon = True,
+                                                   name = f'Kinesis replay {serial.decode()}')
+                timeline.thread.start()
+        self.counters["Calls"] += 1
+        if record is None:
+            if queue is None: self.counters["Unrecorded"] += 1
+            return None if restype is None else False if restype is ctypes.c_bool else 0
+        t, duration, recorded, result, outputs = record
+        for arg, output in zip(args, outputs):
+            buffer = _buffer(arg) if output is not None else None
+            if buffer is not None:
+                ctypes.memmove(ctypes.addressof(buffer), output, min(len(output), ctypes.sizeof(buffer)))
+        if self.latency and duration > 0: time.sleep(duration / self.speed)
+        return result
+
+    def stats(self):
+        """
+
+        :return: Dict. Lags in s
+        """
+        result = dict(self.counters)
+        result["Trace duration"] = self.trace.duration()
+        result["Delay"] = self.delay
+        if self.lags:
+            lags = sorted(self.lags)
+            result.update({"Mean lag": sum(lags) / len(lags), "p99 lag": lags[int(0.99 * (len(lags) - 1))],
+                           "Max lag": lags[-1]})
+        return result
+
+
+class ReplayLibrary():
+    """
+    Library object returned by the 'replay' backend: every function replays the current trace.
+    """
+    def __init__(self, dllname):
+        self._name = dllname
+
+    def __repr__(self):
+        return f'<ReplayLibrary {self._name}>'
+
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        dllname = self._name
+
+        def function(*args):
+            if _current is None: raise RuntimeError('No trace loaded, call replay() first.')
+            return _current.call(dllname, name, function.restype, args)
+        function.__name__ = name
+        function.argtypes = None
+        function.restype = None
+        setattr(self, name, function)
+        return function
+
+
+_current = None
+
+def replay(path, speed = 1.0, latency = True):
+    """
+    Loads a trace and selects the 'replay' backend for the drivers opened afterwards.
+
+    :param path: str. File written by Capture
+    :param speed: float. Time scale (2 => twice faster than recorded)
+    :param latency: Boolean. Calls last their recorded duration
+    :return: Replay
+    """
+    global _current
+    if _current is not None: _current.stop()
+    _current = Replay(Trace(path), speed, latency)
+    Kinesis_Backend.register_backend('replay', ReplayLibrary)
+    Kinesis_Backend.set_backend('replay')
+    return _current
@@ -0,0 +1,185 @@
+"""
+Waypoint scans with the KIM101.
+
+The waypoints are reordered to shorten the total step travel (serpentine for grids,
+nearest neighbour followed by 2-opt for any other set of points), the channels of each
+waypoint are moved together with MoveAbsoluteAsync and the scan is a generator yielding
+(index, position, timestamp) as soon as each waypoint is reached.
+
+    >>> engine = ScanEngine(my_piezo, channels=(1, 2))
+    >>> grid = numpy.stack(numpy.meshgrid(range(0, 500, 50), range(0, 500, 50)), -1).reshape(-1, 2)
+    >>> for index, position, timestamp in engine.run(grid):
+    ...     acquire(index)
+"""
+
+from concurrent.futures import wait
+import numpy
+import time
+
+def path_length(points, order = None, start = None):
+    """
+    Total step travel (sum over channels of the steps moved).
+
+    :param points: array (n, channels)
+    :param order: visiting order, points order if None
+    :param start: starting position, first point if None
+    :return: int
+    """
+    route = points if order is None else points[order]
+    if start is not None: route = numpy.vstack([start, route])
+    return int(numpy.abs(numpy.diff(route, axis = 0)).sum())
+
+def is_grid(points):
+    """
+
+    :param points: array (n, channels)
+    :return: Boolean. True if points is the full product of its coordinates along each axis
+    """
+    sizes = [len(numpy.unique(points[:, x])) for x in range(points.shape[1])]
+    return int(numpy.prod(sizes)) == len(points) and len(numpy.unique(points, axis = 0)) == len(points)
+
+def serpentine(points):
+    """
+    Boustrophedon order of a grid: rows along the first axis, the order of the
+    remaining axes is reversed every row.
+
+    :param points: array (n, channels)
+    :return: array of indexes
+    """
+    order = numpy.argsort(points[:, 0], kind = 'stable')
+    if points.shape[1] == 1: return order
+    starts = numpy.unique(points[order, 0], return_index = True)[1]
+    rows = []
+    for x, row in enumerate(numpy.split(order, starts[1:])):
+        row = row[serpentine(points[row][:, 1:])]
+        rows.append(row if x % 2 == 0 else row[::-1])
+    return numpy.concatenate(rows)
+
+def nearest_neighbour(points, start = None):
+    """
+
+    :param points: array (n, channels)
+    :param start: position the scan starts from. First point if None
+    :return: array of indexes
+    """
+    n = len(points)
+    remaining = numpy.ones(n, dtype = bool)
+    order = numpy.empty(n, dtype = numpy.intp)
+    current = points[0] if start is None else numpy.asarray(start)
+    points = points.astype(numpy.int64)
+    for x in range(n):
+        distance = numpy.abs(points - current).sum(axis = 1)
+        distance[~remaining] = numpy.iinfo(numpy.int64).max
+        nearest = int(numpy.argmin(distance))
+        order[x] = nearest
+        remaining[nearest] = False
+        current = points[nearest]
+    return order
+
+def two_opt(points, order, start = None, max_passes = 20):
+    """
+    Reverses segments of the path while it gets shorter (open path, L1 distance).
+
+    :param points: array (n, channels)
+    :param order: initial array of indexes
+    :param start: position the scan starts from. The first point is kept first if None
+    :param max_passes: int
+    :return: array of indexes
+    """
+    order = numpy.array(order)
+    n = len(order)
+    if n < 3: return order
+    first = 1 if start is None else 0
+    for x in range(max_passes):
+        improved = False
+        route = points[order].astype(numpy.int64)
+        if start is not None: route = numpy.vstack([numpy.asarray(start, dtype = numpy.int64), route])
+        offset = 0 if start is None else 1
+        for i in range(first + offset, len(route) - 1):
+            before = route[i - 1]
+            #Reverse route[i:j+1] for every j > i
+            j = numpy.arange(i + 1, len(route))
+            removed = numpy.abs(route[i] - before).sum()
+            added = numpy.abs(route[j] - before).sum(axis = 1)
+            inner = j < len(route) - 1
+            after = route[numpy.minimum(j + 1, len(route) - 1)]
+            removed = removed + numpy.where(inner, numpy.abs(after - route[j]).sum(axis = 1), 0)
+            added = added + numpy.where(inner, numpy.abs(after - route[i]).sum(axis = 1), 0)
+            delta = added - removed
+            best = int(numpy.argmin(delta))
+            if delta[best] < 0:
+                route[i:j[best] + 1] = route[i:j[best] + 1][::-1].copy()
+                order[i - offset:j[best] + 1 - offset] = order[i - offset:j[best] + 1 - offset][::-1].copy()
+                improved = True
+        if not improved: break
+    return order
+
+
+class ScanEngine():
+
+    def __init__(self, motor, channels = (1, 2)):
+        """
+
+        :param motor: TLKinesisInertialMotor
+        :param channels: channels moved by the waypoint columns
+        """
+        self.motor = motor
+        self.channels = tuple(channels)
+        self.stats = {}
+
+    def order(self, waypoints, method = 'auto', start = None):
+        """
+
+        :param waypoints: array (n, len(channels))
+        :param method: 'auto', 'serpentine', 'nearest', '2-opt' or 'none'
+        :param start: position the scan starts from. Current position if None
+        :return: array of indexes
+        """
+        waypoints = numpy.asarray(waypoints)
+        if start is None: start = self._position()
+        if method == 'auto': method = 'serpentine' if is_grid(waypoints) else '2-opt'
+        if method == 'none': return numpy.arange(len(waypoints))
+        if method == 'serpentine':
+            order = serpentine(waypoints)
+            #Start from the corner of the grid closest to the current position.
+            candidates = [order, order[::-1]]
+            return min(candidates, key = lambda x: path_length(waypoints, x, start))
+        order = nearest_neighbour(waypoints, start)
+        if method == '2-opt': order = two_opt(waypoints, order, start)
+        return order
+
+    def _position(self):
+        position = self.motor.GetCachedPositionAll()
+        return numpy.array([position[channel - 1] for channel in self.channels])
+
+    def _move(self, point):
+        return [self.motor.MoveAbsoluteAsync(channel, int(value)) for channel, value in zip(self.channels, point)]
+
+    def run(self, waypoints, method = 'auto', prefetch = False):
+        """
+        Moves through the waypoints. The channels of a waypoint move at the same time.
+
+        :param waypoints: array (n, len(channels)) of absolute positions
+        :param method: ordering, see order
+        :param prefetch: Boolean. Sends the next waypoint before yielding the reached one,
+        for consumers that do not need the stage to stay still
+        :return: generator of (index in waypoints, reached position, timestamp)
+        """
+        waypoints = numpy.asarray(waypoints)
+        assert waypoints.ndim == 2 and waypoints.shape[1] == len(self.channels)
+        start = self._position()
+        order = self.order(waypoints, method, start)
+        self.stats = {"Points": len(order), "Travel": path_length(waypoints, order, start),
+                      "Unordered travel": path_length(waypoints, None, start), "Timeouts": 0}
+        begin = time.perf_counter()
+        futures = self._move(waypoints[order[0]]) if len(order) else []
+        for x, index in enumerate(order):
+            wait(futures)
+            timestamp = time.perf_counter()
+            position = self._position()
+            self.stats["Timeouts"] += int((position != waypoints[index]).any())
+            if x + 1 < len(order) and prefetch: futures = self._move(waypoints[order[x + 1]])
+            yield int(index), position, timestamp
+            if x + 1 < len(order) and not prefetch: futures = self._move(waypoints[order[x + 1]])
+        self.stats["Elapsed"] = time.perf_counter() - begin
+        self.stats["Points/s"] = len(order) / self.stats["Elapsed"] if self.stats["Elapsed"] else 0.0
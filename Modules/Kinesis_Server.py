@@ -0,0 +1,623 @@
+"""
+Local device server: one process owns the K-Cubes, the others use them through a socket.
+
+DeviceServer opens the drivers (or is given open ones) and serves their public methods.
+KinesisClient connects to it and device(serial) returns a proxy with the same method names
+as the driver:
+
+    #Process owning the devices
+    >>> server = DeviceServer(('127.0.0.1', 50100))
+    >>> server.Open('97101411', pollingTime=50)
+    >>> server.start()
+
+    #Any other process
+    >>> client = KinesisClient(('127.0.0.1', 50100))
+    >>> motor = client.device('97101411')
+    >>> motor.MoveAbsolute(1, 100)
+    >>> futures = [motor.submit('MoveAbsoluteAsync', x + 1, 0) for x in range(4)] #Pipelined
+    >>> client.subscribe('97101411', 'position', print)
+
+Frames are a 9 byte header (body length, request id, kind) followed by a tagged binary
+body (None, bool, int, float, str, bytes, tuple, list, dict and numpy arrays). Requests
+are pipelined: the client does not wait for a result before sending the next request and
+results are matched by request id. The requests of a connection to one device run in
+order; different devices run concurrently. Driver methods returning a Future (the
+*Async methods) answer when the future is done, without holding the device queue.
+
+Streams pushed by the server:
+    'messages': every message of the device (type, id, data, timestamp)
+    'position': (timestamp, GetCachedPositionAll()) on every message of a KIM101
+    'reading': blocks of StrainGaugeStream samples (STREAM_DTYPE array) of a KSG101
+"""
+
+from Modules.Kinesis_DeviceManager import DEVICE_TYPES
+
+from concurrent.futures import Future
+import ast, itertools, queue, socket, struct, threading
+import numpy
+
+HEADER = struct.Struct('<IIB') #Body length, request id, kind
+REQUEST, RESULT, ERROR, PUSH = 1, 2, 3, 4
+MAX_FRAME = 1 << 28
+PUSH_QUEUE_SIZE = 1024 #Pushed frames waiting to be sent per connection, newer ones dropped past it
+
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_SIZE = struct.Struct('<I')
+
+
+class RemoteError(Exception):
+    """
+    Exception raised by the server while running a request.
+    """
+
+
+def encode(value, out = None):
+    """
+
+    :param value: None, bool, int, float, str, bytes, tuple, list, dict, numpy array or scalar,
+    ctypes simple value. Other objects are sent as their repr
+    :param out: bytearray appended to
+    :return: bytearray
+    """
+    if out is None: out = bytearray()
+    if hasattr(value, '_type_') and hasattr(value, 'value') and not isinstance(value, numpy.ndarray):
+        value = value.value #ctypes c_bool, c_int...
+    if isinstance(value, numpy.generic): value = value.item()
+    if value is None: out += b'N'
+    elif value is True: out += b'T'
+    elif value is False: out += b'F'
+    elif isinstance(value, int) and -(1 << 63) <= value < (1 << 63): out += b'i' + _INT.pack(value)
+    elif isinstance(value, float): out += b'd' + _FLOAT.pack(value)
+    elif isinstance(value, str):
+        data = value.encode()
+        out += b's' + _SIZE.pack(len(data)) + data
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        out += b'b' + _SIZE.pack(len(data)) + data
+    elif isinstance(value, (tuple, list)):
+        out += (b't' if isinstance(value, tuple) else b'l') + _SIZE.pack(len(value))
+        for item in value: encode(item, out)
+    elif isinstance(value, dict):
+        out += b'm' + _SIZE.pack(len(value))
+        for key, item in value.items():
+            encode(key, out)
+            encode(item, out)
+    elif isinstance(value, numpy.ndarray):
+        value = numpy.ascontiguousarray(value)
+        out += b'a'
+        encode(repr(numpy.lib.format.dtype_to_descr(value.dtype)), out)
+        out += bytes([value.ndim]) + b''.join(_SIZE.pack(x) for x in value.shape)
+        data = value.tobytes()
+        out += _SIZE.pack(len(data)) + data
+    else:
+        encode(repr(value), out)
+    return out
+
+def decode(data, offset = 0):
+    """
+
+    :param data: bytes-like
+    :param offset: int
+    :return: (value, offset after the value)
+    """
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b'N': return None, offset
+    if tag == b'T': return True, offset
+    if tag == b'F': return False, offset
+    if tag == b'i': return _INT.unpack_from(data, offset)[0], offset + 8
+    if tag == b'd': return _FLOAT.unpack_from(data, offset)[0], offset + 8
+    if tag in (b's', b'b'):
+        size = _SIZE.unpack_from(data, offset)[0]
+        offset += 4
+        value = bytes(data[offset:offset + size])
+        return (value.decode() if tag == b's' else value), offset + size
+    if tag in (b't', b'l'):
+        size = _SIZE.unpack_from(data, offset)[0]
+        offset += 4
+        items = []
+        for x in range(size):
+            item, offset = decode(data, offset)
+            items.append(item)
+        return (tuple(items) if tag == b't' else items), offset
+    if tag == b'm':
+        size = _SIZE.unpack_from(data, offset)[0]
+        offset += 4
+        items = {}
+        for x in range(size):
+            key, offset = decode(data, offset)
+            items[key], offset = decode(data, offset)
+        return items, offset
+    if tag == b'a':
+        descr, offset = decode(data, offset)
+        dtype = numpy.lib.format.descr_to_dtype(ast.literal_eval(descr))
+        ndim = data[offset]
+        shape = tuple(_SIZE.unpack_from(data, offset + 1 + 4 * x)[0] for x in range(ndim))
+        offset += 1 + 4 * ndim
+        size = _SIZE.unpack_from(data, offset)[0]
+        offset += 4
+        return numpy.frombuffer(bytes(data[offset:offset + size]), dtype = dtype).reshape(shape), offset + size
+    raise ValueError(f'Unknown tag {tag!r}.')
+
+_MALFORMED = (ValueError, TypeError, IndexError, SyntaxError, struct.error) #Errors of a malformed frame
+
+def frame(request_id, kind, value):
+    """
+
+    :return: bytearray with the header and the encoded value
+    """
+    out = bytearray(HEADER.size)
+    encode(value, out)
+    HEADER.pack_into(out, 0, len(out) - HEADER.size, request_id, kind)
+    return out
+
+def _receive(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count: raise ConnectionError('Connection closed.')
+        received += count
+    return buffer
+
+def read_frame(sock):
+    """
+
+    :return: (request id, kind, value)
+    """
+    length, request_id, kind = HEADER.unpack(_receive(sock, HEADER.size))
+    if length > MAX_FRAME: raise ConnectionError(f'Frame of {length} bytes.')
+    return request_id, kind, decode(_receive(sock, length))[0]
+
+def _socket(address):
+    if isinstance(address, str): return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class _Connection():
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.dropped = 0
+        self.__results = queue.Queue()
+        self.__pushes = queue.Queue(PUSH_QUEUE_SIZE)
+        self.__wake = threading.Event()
+        self.__workers = {}
+        self.__subscriptions = {}
+        self.__closed = threading.Event()
+        threading.Thread(target = self._reader, name = 'Kinesis server reader', daemon = True).start()
+        threading.Thread(target = self._writer, name = 'Kinesis server writer', daemon = True).start()
+
+    def send(self, request_id, kind, value):
+        try:
+            data = frame(request_id, kind, value)
+        except Exception as e:
+            data = frame(request_id, ERROR, f'{type(e).__name__}: {e}')
+        self.__results.put(data)
+        self.__wake.set()
+
+    def push(self, subscription, value):
+        if self.__closed.is_set(): return
+        try:
+            self.__pushes.put_nowait(frame(subscription, PUSH, value))
+            self.__wake.set()
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        #Results first, then pushes, several frames per sendall.
+        while not self.__closed.is_set():
+            self.__wake.wait()
+            self.__wake.clear()
+            chunks = []
+            for source in (self.__results, self.__pushes):
+                while True:
+                    try:
+                        chunks.append(source.get_nowait())
+                    except queue.Empty:
+                        break
+            if not chunks: continue
+            try:
+                self.sock.sendall(b''.join(chunks))
+            except OSError:
+                self.close()
+
+    def _reader(self):
+        try:
+            while True:
+                request_id, kind, body = read_frame(self.sock)
+                if kind != REQUEST: continue
+                serial, method, args, kwargs = body
+                worker = self.__workers.get(serial)
+                if worker is None:
+                    worker = self.__workers[serial] = queue.Queue()
+                    threading.Thread(target = self._worker, args = (worker,), name = f'Kinesis server {serial}',
+                                     daemon = True).start()
+                worker.put((request_id, serial, method, args, kwargs))
+        except (OSError, ConnectionError) + _MALFORMED:
+            self.close()
+
+    def _worker(self, requests):
+        while True:
+            request = requests.get()
+            if request is None: return
+            request_id = request[0]
+            try:
+                result = self.server.execute(self, *request)
+            except Exception as e:
+                self.send(request_id, ERROR, f'{type(e).__name__}: {e}')
+                continue
+            if isinstance(result, Future):
+                result.add_done_callback(lambda future, request_id = request_id: self._done(request_id, future))
+            else:
+                self.send(request_id, RESULT, result)
+
+    def _done(self, request_id, future):
+        error = future.exception()
+        if error is None: self.send(request_id, RESULT, future.result())
+        else: self.send(request_id, ERROR, f'{type(error).__name__}: {error}')
+
+    def add_subscription(self, subscription, cancel):
+        self.__subscriptions[subscription] = cancel
+
+    def remove_subscription(self, subscription):
+        cancel = self.__subscriptions.pop(subscription, None)
+        if cancel is not None: cancel()
+        return cancel is not None
+
+    def close(self):
+        if self.__closed.is_set(): return
+        self.__closed.set()
+        self.__wake.set()
+        for subscription in list(self.__subscriptions): self.remove_subscription(subscription)
+        for worker in self.__workers.values(): worker.put(None)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.server.closed(self)
+
+
+class DeviceServer():
+
+    def __init__(self, address = ('127.0.0.1', 50100)):
+        """
+
+        :param address: (host, port) for TCP, str path for a unix socket. Port 0 picks a free port
+        """
+        self.devices = {}
+        self.requests = 0
+        self.__address = address
+        self.__sock = None
+        self.__thread = None
+        self.__connections = []
+        self.__streams = {} #serial => [StrainGaugeStream, subscribers]
+        self.__lock = threading.Lock()
+
+    def Add(self, serial, device):
+        """
+        Serves an already opened driver.
+
+        :param serial: str
+        :param device: TLKinesisInertialMotor, TLKinesisStrainGauge or TLKinesisPiezoDriver
+        :return: None
+        """
+        self.devices[serial] = device
+
+    def Open(self, serial, **kwargs):
+        """
+        Opens the driver given by the serial number prefix, unless it is already open.
+
+        :param serial: str
+        :param kwargs: driver constructor arguments (pollingTime, TIMEOUT...)
+        :return: str. Driver class name
+        """
+        with self.__lock:
+            device = self.devices.get(serial)
+            if device is None: device = self.devices[serial] = DEVICE_TYPES[int(serial[:2])](serial, **kwargs)
+        return type(device).__name__
+
+    def Devices(self):
+        """
+
+        :return: Dict serial => driver class name
+        """
+        return {serial: type(device).__name__ for serial, device in self.devices.items()}
+
+    def Stats(self):
+        """
+
+        :return: Dict
+        """
+        return {"Connections": len(self.__connections), "Requests": self.requests,
+                "Dropped pushes": sum(x.dropped for x in self.__connections)}
+
+    @property
+    def address(self):
+        return self.__sock.getsockname() if self.__sock is not None else self.__address
+
+    def start(self):
+        """
+        Listens in a background thread.
+
+        :return: address listened on
+        """
+        self.__sock = _socket(self.__address)
+        if not isinstance(self.__address, str): self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.bind(self.__address)
+        self.__sock.listen()
+        self.__thread = threading.Thread(target = self._accept, name = 'Kinesis server', daemon = True)
+        self.__thread.start()
+        return self.address
+
+    def stop(self):
+        sock, self.__sock = self.__sock, None
+        if sock is not None: sock.close()
+        for connection in list(self.__connections): connection.close()
+        for serial in list(self.__streams): self.devices[serial].StopStreaming()
+        self.__streams.clear()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.__thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _accept(self):
+        while self.__sock is not None:
+            try:
+                sock, address = self.__sock.accept()
+            except OSError:
+                return
+            if not isinstance(self.__address, str): sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__connections.append(_Connection(self, sock))
+
+    def closed(self, connection):
+        if connection in self.__connections: self.__connections.remove(connection)
+
+    def execute(self, connection, request_id, serial, method, args, kwargs):
+        """
+        Runs one request. Serial '' addresses the server itself (Open, Devices, Stats,
+        Subscribe, Unsubscribe).
+        """
+        with self.__lock:
+            self.requests += 1
+        if serial == '':
+            if method == 'Subscribe': return self._subscribe(connection, request_id, *args, **kwargs)
+            if method == 'Unsubscribe': return connection.remove_subscription(*args)
+            if method not in ('Open', 'Devices', 'Stats'): raise AttributeError(f'No server method {method}.')
+            return getattr(self, method)(*args, **kwargs)
+        device = self.devices.get(serial)
+        if device is None: raise KeyError(f'Device {serial} is not open on the server.')
+        if method.startswith('_'): raise AttributeError(f'{method} is private.')
+        return getattr(device, method)(*args, **kwargs)
+
+    def _subscribe(self, connection, subscription, serial, stream, interval = 0.0, rate = 1000.0, block = 100):
+        """
+
+        :param subscription: int. Request id of the Subscribe request, used as the push id
+        :param stream: 'messages', 'position' or 'reading'
+        :param interval: float (in s). Shortest time between two pushes of 'messages' and 'position'
+        :param rate: float (in Hz). Sampling rate of 'reading'
+        :param block: int. Samples per push of 'reading'
+        :return: int. Subscription id
+        """
+        device = self.devices[serial]
+        if stream == 'reading': return self._subscribe_reading(connection, subscription, serial, rate, block)
+        if stream not in ('messages', 'position'): raise ValueError(f'Unknown stream {stream}.')
+        if stream == 'position' and not hasattr(device, 'GetCachedPositionAll'):
+            raise ValueError(f'No position stream for {serial}.')
+        pump = device.GetMessagePump()
+        last = [0.0]
+
+        def callback(msg_type, msg_id, data, timestamp):
+            if interval and timestamp - last[0] < interval: return
+            last[0] = timestamp
+            if stream == 'messages': connection.push(subscription, (msg_type, msg_id, data, timestamp))
+            else: connection.push(subscription, (timestamp, device.GetCachedPositionAll())) #No DLL call
+        pump.subscribe(callback)
+        connection.add_subscription(subscription, lambda: pump.unsubscribe(callback))
+        return subscription
+
+    def _subscribe_reading(self, connection, subscription, serial, rate, block):
+        with self.__lock:
+            entry = self.__streams.get(serial)
+            if entry is None: entry = self.__streams[serial] = [self.devices[serial].StartStreaming(rate), 0]
+            entry[1] += 1
+        stream = entry[0]
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set() and stream.running():
+                for samples in stream.blocks(block, timeout = 0.1):
+                    if stop.is_set(): return
+                    connection.push(subscription, samples)
+
+        def cancel():
+            stop.set()
+            with self.__lock:
+                entry[1] -= 1
+                if entry[1] == 0 and self.__streams.get(serial) is entry:
+                    del self.__streams[serial]
+                    self.devices[serial].StopStreaming()
+        threading.Thread(target = run, name = f'Kinesis server stream {serial}', daemon = True).start()
+        connection.add_subscription(subscription, cancel)
+        return subscription
+
+
+class DeviceProxy():
+    """
+    Driver served by a DeviceServer. Methods have the driver names and block until the result
+    is back; submit sends without waiting.
+    """
+
+    def __init__(self, client, serial):
+        self._client = client
+        self._serial = serial
+
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        client, serial = self._client, self._serial
+
+        def method(*args, **kwargs):
+            return client.call(serial, name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+    def submit(self, name, *args, **kwargs):
+        """
+
+        :return: Future of the result
+        """
+        return self._client.submit(self._serial, name, *args, **kwargs)
+
+    def subscribe(self, stream, callback, **params):
+        return self._client.subscribe(self._serial, stream, callback, **params)
+
+
+class KinesisClient():
+
+    def __init__(self, address = ('127.0.0.1', 50100), timeout = None):
+        """
+
+        :param address: address of the DeviceServer
+        :param timeout: float (in s). Default timeout of call
+        """
+        self.timeout = timeout
+        self.__sock = _socket(address)
+        self.__sock.connect(address)
+        self.__ids = itertools.count(1)
+        self.__pending = {}
+        self.__pendingLock = threading.Lock()
+        self.__lost = None #Error that closed the connection
+        self.__subscriptions = {}
+        self.__sendLock = threading.Lock()
+        self.__closed = False
+        self.__thread = threading.Thread(target = self._reader, name = 'Kinesis client', daemon = True)
+        self.__thread.start()
+
+    def _reader(self):
+        try:
+            while True:
+                request_id, kind, value = read_frame(self.__sock)
+                if kind == PUSH:
+                    callback = self.__subscriptions.get(request_id)
+                    if callback is not None:
+                        try:
+                            callback(value)
+                        except Exception as e: #The reader must go on for the other requests
+                            print(f'Error in the callback of subscription {request_id}: {type(e).__name__}: {e}')
+                    continue
+                with self.__pendingLock:
+                    future = self.__pending.pop(request_id, None)
+                if future is None: continue
+                if kind == RESULT: future.set_result(value)
+                else: future.set_exception(RemoteError(value))
+        except (OSError, ConnectionError) + _MALFORMED as e:
+            with self.__pendingLock:
+                self.__lost = ConnectionError(f'Connection lost: {e}')
+                pending, self.__pending = self.__pending, {}
+            for future in pending.values():
+                if not future.done(): future.set_exception(self.__lost)
+
+    def _send(self, serial, method, args, kwargs, request_id = None):
+        if request_id is None: request_id = next(self.__ids)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.__pendingLock:
+            if self.__lost is not None:
+                future.set_exception(self.__lost)
+                return future
+            self.__pending[request_id] = future
+        data = frame(request_id, REQUEST, (serial, method, args, kwargs))
+        with self.__sendLock:
+            self.__sock.sendall(data)
+        return future
+
+    def submit(self, serial, method, *args, **kwargs):
+        """
+        Sends a request without waiting for the result (pipelining).
+
+        :param serial: str. '' for the server methods
+        :param method: str. Driver method name
+        :return: Future of the result
+        """
+        return self._send(serial, method, args, kwargs)
+
+    def call(self, serial, method, *args, **kwargs):
+        return self._send(serial, method, args, kwargs).result(self.timeout)
+
+    def device(self, serial):
+        """
+
+        :param serial: str
+        :return: DeviceProxy
+        """
+        return DeviceProxy(self, serial)
+
+    def Open(self, serial, **kwargs):
+        """
+        Opens the device on the server, if not yet open.
+
+        :return: DeviceProxy
+        """
+        self.call('', 'Open', serial, **kwargs)
+        return self.device(serial)
+
+    def Devices(self):
+        return self.call('', 'Devices')
+
+    def Stats(self):
+        return self.call('', 'Stats')
+
+    def subscribe(self, serial, stream, callback, **params):
+        """
+
+        :param serial: str
+        :param stream: 'messages', 'position' or 'reading'
+        :param callback: callable(value) called from the client thread for every push
+        :param params: interval, rate, block (see DeviceServer._subscribe)
+        :return: int. Subscription id
+        """
+        subscription = next(self.__ids)
+        self.__subscriptions[subscription] = callback
+        try:
+            return self._send('', 'Subscribe', (serial, stream), params, subscription).result(self.timeout)
+        except Exception:
+            self.__subscriptions.pop(subscription, None)
+            raise
+
+    def unsubscribe(self, subscription):
+        self.__subscriptions.pop(subscription, None)
+        return self.call('', 'Unsubscribe', subscription)
+
+    def close(self):
+        if self.__closed: return
+        self.__closed = True
+        try:
+            self.__sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__sock.close()
+        self.__thread.join()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Serves K-Cube devices to local clients.')
+    parser.add_argument('serials', nargs = '*')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 50100)
+    parser.add_argument('--polling', type = int, default = 100)
+    args = parser.parse_args()
+    server = DeviceServer((args.host, args.port))
+    for serial in args.serials: server.Open(serial, pollingTime = args.polling)
+    print(f'Serving {list(server.devices)} on {args.host}:{args.port}.')
+    server.serve_forever()
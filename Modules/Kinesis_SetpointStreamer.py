@@ -0,0 +1,129 @@
+"""
+Setpoints sent against absolute deadlines, for host computed trajectories.
+
+Each setpoint has a time t (in s from the start); the streamer thread sleeps until `spin`
+seconds before start + t and busy-waits the rest, so the dispatch error is the spin loop
+resolution instead of the sleep jitter. Deadlines are absolute: a late setpoint does not
+shift the following ones. With skip_late, a setpoint whose successor is already due is
+dropped to catch up.
+
+    >>> t = numpy.arange(0, 1, 0.001)
+    >>> points = numpy.column_stack([t, 16384 + 8000 * numpy.sin(2 * numpy.pi * 5 * t)])
+    >>> streamer = my_piezo.StreamSetpoints(points)
+    >>> streamer.wait()
+    >>> streamer.stats()
+"""
+
+import numpy
+import os, threading, time
+
+class SetpointStreamer():
+
+    def __init__(self, write, points, spin = 0.001, late = 0.0005, skip_late = True, lead = 0.01):
+        """
+
+        :param write: callable(value) returning an error code (0 if sent)
+        :param points: array (n, 2) of (t in s, value), t non decreasing
+        :param spin: float (in s). Busy-wait before each deadline
+        :param late: float (in s). Dispatch error above which a deadline counts as missed
+        :param skip_late: Boolean. Drops a setpoint if the next one is already due
+        :param lead: float (in s). Delay between start and t = 0
+        """
+        points = numpy.asarray(points, dtype = float)
+        assert points.ndim == 2 and points.shape[1] == 2
+        self.times = points[:, 0].copy()
+        self.values = numpy.rint(points[:, 1]).astype(int).tolist()
+        assert len(self.times) == 0 or (numpy.diff(self.times) >= 0).all()
+        self.spin = spin
+        self.late = late
+        self.skip_late = skip_late
+        self.lead = lead
+        self.errors = numpy.full(len(self.times), numpy.nan) #Dispatch time - deadline (in s), NaN if skipped
+        self.failed = 0 #Setpoints the device refused
+        self.index = 0
+        self.__write = write
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__start = None
+
+    def start(self):
+        if self.running(): return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target = self._run, name = 'Setpoint streamer', daemon = True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None and self.__thread is not threading.current_thread(): self.__thread.join()
+
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def wait(self, timeout = None):
+        """
+
+        :param timeout: float (in s)
+        :return: Boolean (True if every setpoint was handled)
+        """
+        if self.__thread is not None: self.__thread.join(timeout)
+        return not self.running()
+
+    def _run(self):
+        timer = _TimerResolution()
+        try:
+            self._stream()
+        finally:
+            timer.restore()
+
+    def _stream(self):
+        clock, sleep = time.perf_counter, time.sleep
+        times, values, errors = self.times, self.values, self.errors
+        write, spin, stop = self.__write, self.spin, self.__stop
+        count = len(times)
+        start = self.__start = clock() + self.lead
+        index = 0
+        while index < count and not stop.is_set():
+            deadline = start + times[index]
+            remaining = deadline - clock()
+            if remaining > spin: sleep(remaining - spin)
+            now = clock()
+            while now < deadline: now = clock()
+            if self.skip_late and index + 1 < count and now >= start + times[index + 1]:
+                index += 1 #Next one already due
+                self.index = index
+                continue
+            if write(values[index]): self.failed += 1
+            errors[index] = now - deadline
+            index += 1
+            self.index = index
+
+    def stats(self):
+        """
+
+        :return: Dict. Jitter values in s
+        """
+        sent = self.errors[~numpy.isnan(self.errors)]
+        result = {"Setpoints": len(self.times), "Sent": len(sent), "Skipped": self.index - len(sent),
+                  "Missed": int((sent > self.late).sum()), "Failed": self.failed}
+        if len(sent):
+            result.update({"Mean error": float(sent.mean()), "Jitter": float(sent.std()),
+                           "p50 error": float(numpy.percentile(sent, 50)),
+                           "p99 error": float(numpy.percentile(sent, 99)), "Max error": float(sent.max())})
+        return result
+
+
+class _TimerResolution():
+    #1 ms scheduler resolution on Windows while streaming (time.sleep rounds to 15.6 ms otherwise).
+
+    def __init__(self):
+        self.__winmm = None
+        if os.name != 'nt': return
+        try:
+            import ctypes
+            self.__winmm = ctypes.WinDLL('winmm')
+            self.__winmm.timeBeginPeriod(1)
+        except (OSError, AttributeError):
+            self.__winmm = None
+
+    def restore(self):
+        if self.__winmm is not None: self.__winmm.timeEndPeriod(1)
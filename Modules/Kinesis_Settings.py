@@ -0,0 +1,276 @@
+"""
+Settings cache of the K-Cube drivers, settings profiles and on-disk hardware information.
+
+SettingsCache keeps, for one device, the value of each setting known to be on the device
+and the value last asked for. The setters skip a value the device already has (unless
+force); a value that could not be sent, or that the device lost (Reconnect calls
+invalidate), stays dirty until flush sends it again. Settings are named after the DLL
+functions, with the channel after a slash: 'DriveOPParameters/1', 'DisplayMode',
+'HubAnalogOutput', 'PositionControlMode', 'MaxOutputVoltage'.
+
+    >>> my_motor.SaveProfile('fast') #GetSettings() stored in profiles.json
+    >>> my_motor.LoadProfile('fast') #Only the settings that differ are sent
+
+HardwareInfoCache keeps what never changes for a device (GetHardwareInfoBlock,
+GetMaximumTravel, GetForceCalib), so the drivers query it once. It is saved to
+hardware_info.json in the KINESIS_CACHE directory, if set, and then not queried again after a
+restart. Only the real devices are saved, by serial number: the simulated ones (simulated
+or replay backend, SIMULATION=True) are kept in memory under their own keys (hardware_key),
+so they never give their values to the real device with the same serial number.
+
+Profiles are saved to profiles.json in the KINESIS_CACHE directory, ~/.kinesis if not set.
+"""
+
+from Modules.Kinesis_Backend import get_backend
+
+import json, os, threading
+
+CACHE_DIR = os.environ.get('KINESIS_CACHE') or None #Hardware information saved to disk only if set
+PROFILE_DIR = CACHE_DIR or os.path.join(os.path.expanduser('~'), '.kinesis')
+
+_UNKNOWN = object()
+
+def _normalize(value):
+    #Values as stored in JSON: lists instead of tuples, python numbers.
+    if isinstance(value, (tuple, list)): return [_normalize(x) for x in value]
+    if hasattr(value, 'item'): return value.item()
+    return value
+
+def _serial(serial):
+    return serial.decode() if isinstance(serial, bytes) else str(serial)
+
+def hardware_key(serial, simulation = False):
+    """
+    Key of a device in the hardware information cache.
+
+    :param serial: str or bytes
+    :param simulation: Boolean. Device simulated by the DLL (TLI_InitializeSimulations)
+    :return: str. The serial number for a real device, prefixed with the backend otherwise
+    """
+    backend = get_backend()
+    if backend == 'native' and not simulation: return _serial(serial)
+    return f'{backend}{"-simulation" if simulation else ""}:{_serial(serial)}'
+
+def _read_json(path):
+    if not path or not os.path.exists(path): return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    #Atomic: readers never see a partial file.
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent = 1, sort_keys = True)
+    os.replace(tmp, path)
+
+
+class SettingsCache():
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.__device = {} #Values known to be on the device
+        self.__wanted = {} #Values last asked for
+        self.__lock = threading.Lock()
+
+    def get(self, key, default = None):
+        """
+
+        :param key: str
+        :return: value on the device, default if unknown
+        """
+        return self.__device.get(key, default)
+
+    def known(self, key):
+        return key in self.__device
+
+    def changed(self, key, value):
+        """
+
+        :return: Boolean (True if the device does not have value)
+        """
+        return self.__device.get(key, _UNKNOWN) != _normalize(value)
+
+    def read(self, key, value):
+        """
+        Records a value read from the device.
+
+        :return: value
+        """
+        with self.__lock:
+            self.__device[key] = _normalize(value)
+        return value
+
+    def request(self, key, value, force = False):
+        """
+        Records value as wanted.
+
+        :param force: Boolean. Sends the value even if the device has it
+        :return: Boolean (True if it must be sent)
+        """
+        value = _normalize(value)
+        with self.__lock:
+            self.__wanted[key] = value
+            if force or self.__device.get(key, _UNKNOWN) != value: return True
+            self.skipped += 1
+            return False
+
+    def written(self, key, value, done):
+        """
+
+        :param done: Boolean (True if the device accepted value)
+        :return: None
+        """
+        with self.__lock:
+            self.sent += 1
+            if done: self.__device[key] = _normalize(value)
+            else: self.__device.pop(key, None)
+
+    def invalidate(self):
+        """
+        Forgets the device values (device reset or reconnected): every wanted value becomes dirty.
+
+        :return: None
+        """
+        with self.__lock:
+            self.__device.clear()
+
+    def dirty(self):
+        """
+
+        :return: Dict of the wanted values the device does not have
+        """
+        with self.__lock:
+            return {key: value for key, value in self.__wanted.items()
+                    if self.__device.get(key, _UNKNOWN) != value}
+
+    def snapshot(self):
+        """
+
+        :return: Dict of every setting known, the wanted value if it was set
+        """
+        with self.__lock:
+            return {**self.__device, **self.__wanted}
+
+    def apply(self, settings, send, force = False):
+        """
+
+        :param settings: Dict (snapshot)
+        :param send: callable(key, value) sending one setting with force
+        :param force: Boolean. Sends the values the device already has too
+        :return: int. Number of settings sent
+        """
+        count = 0
+        for key, value in settings.items():
+            if not force and not self.changed(key, value):
+                with self.__lock:
+                    self.__wanted[key] = _normalize(value)
+                    self.skipped += 1
+                continue
+            send(key, value)
+            count += 1
+        return count
+
+    def flush(self, send):
+        """
+        Sends the dirty values.
+
+        :return: int. Number of settings sent
+        """
+        return self.apply(self.dirty(), send, force = True)
+
+
+class HardwareInfoCache():
+
+    def __init__(self, path):
+        """
+
+        :param path: str. JSON file, None to keep the values in memory only. Only the real
+        devices (keys without prefix, see hardware_key) are saved
+        """
+        self.path = path
+        self.__data = None
+        self.__lock = threading.Lock()
+
+    def _load(self):
+        if self.__data is None:
+            try:
+                self.__data = _read_json(self.path)
+            except (OSError, ValueError): #Unreadable: rebuilt from the devices
+                self.__data = {}
+        return self.__data
+
+    def get(self, serial, key):
+        """
+
+        :param serial: str or bytes. hardware_key of the device
+        :param key: str, e.g. 'HardwareInfoBlock'
+        :return: value, None if not cached
+        """
+        with self.__lock:
+            return self._load().get(_serial(serial), {}).get(key)
+
+    def put(self, serial, key, value):
+        with self.__lock:
+            data = self._load()
+            serial = _serial(serial)
+            data.setdefault(serial, {})[key] = _normalize(value)
+            if self.path and ':' not in serial:
+                try:
+                    self._save(data)
+                except OSError as error:
+                    print(f'Hardware information not saved: {error}')
+
+    def _save(self, data):
+        _write_json(self.path, {serial: values for serial, values in data.items() if ':' not in serial})
+
+    def forget(self, serial = None):
+        """
+
+        :param serial: str or bytes, every device if None
+        :return: None
+        """
+        with self.__lock:
+            data = self._load()
+            if serial is None: data.clear()
+            else: data.pop(_serial(serial), None)
+            if self.path and os.path.exists(self.path): self._save(data)
+
+
+hardware_cache = HardwareInfoCache(os.path.join(CACHE_DIR, 'hardware_info.json') if CACHE_DIR else None)
+
+_profiles_lock = threading.Lock()
+
+def _profiles_path(path):
+    return os.path.join(PROFILE_DIR, 'profiles.json') if path is None else path
+
+def save_profile(name, settings, path = None):
+    """
+
+    :param name: str
+    :param settings: Dict (GetSettings)
+    :param path: str. JSON file, profiles.json of KINESIS_CACHE if None
+    :return: None
+    """
+    path = _profiles_path(path)
+    with _profiles_lock:
+        profiles = _read_json(path)
+        profiles[name] = {key: _normalize(value) for key, value in settings.items()}
+        _write_json(path, profiles)
+
+def load_profile(name, path = None):
+    """
+
+    :return: Dict
+    """
+    profiles = _read_json(_profiles_path(path))
+    if name not in profiles: raise KeyError(f'No profile {name!r}.')
+    return profiles[name]
+
+def list_profiles(path = None):
+    """
+
+    :return: list of the profile names
+    """
+    return sorted(_read_json(_profiles_path(path)))
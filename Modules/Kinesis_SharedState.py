@@ -0,0 +1,229 @@
+"""
+Latest device state in shared memory, for readers that must not touch the DLL.
+
+StatePublisher owns a multiprocessing.shared_memory block with one slot per device. On
+every message of a device (so at the polling rate, when the DLL refreshes its own cache)
+it writes the positions and status bits of a KIM101, or the reading and status bits of a
+KSG101, into the slot. The KIM101 positions come from the driver's position table; only
+the channels moving are read from the DLL. Any number of StateReader, in any local
+process, read the slots with plain memory loads:
+
+    #Process owning the devices
+    >>> publisher = StatePublisher('kinesis', {'97101411': my_motor, '59500001': my_gauge})
+
+    #Any other process
+    >>> reader = StateReader('kinesis')
+    >>> reader.positions('97101411')
+    >>> reader.read('59500001')['reading']
+
+Each slot is protected by a seqlock: the writer makes the sequence odd, writes, makes it
+even again; a reader copies the slot and retries if the sequence was odd or changed
+(TimeoutError if the slot stays odd, e.g. the publisher died while writing). Writers never
+wait for readers. The ordering relies on the stores of the writer being seen in order, as
+on x86.
+"""
+
+from multiprocessing import shared_memory
+import numpy
+import struct, threading, time
+
+MAGIC = b'KSST'
+VERSION = 1
+
+HEADER_DTYPE = numpy.dtype([('magic', 'S4'), ('version', 'u4'), ('slots', 'u4'), ('slot_size', 'u4')], align = True)
+
+SLOT_DTYPE = numpy.dtype([('sequence', 'u8'), #Odd while the slot is written
+                          ('serial', 'S16'),
+                          ('timestamp', 'f8'), #perf_counter time of the last update
+                          ('updates', 'u8'),
+                          ('position', 'i4', (4,)),
+                          ('status', 'u4', (4,)),
+                          ('reading', 'i4'),
+                          ('overrange', '?'),
+                          ('display_mode', 'i1')], align = True)
+
+_SEQUENCE = struct.Struct('<Q')
+_POSITION = struct.Struct('<4i')
+_READING = struct.Struct('<i')
+_UPDATES_OFFSET = SLOT_DTYPE.fields['updates'][1]
+_POSITION_OFFSET = SLOT_DTYPE.fields['position'][1]
+_READING_OFFSET = SLOT_DTYPE.fields['reading'][1]
+_OVERRANGE_OFFSET = SLOT_DTYPE.fields['overrange'][1]
+
+_MOVING = 0x00000030 #Status bits: moving forward (CW) or reverse (CCW)
+
+_attachLock = threading.Lock()
+
+def _attach(name):
+    #Readers must not unlink the block when they exit (resource tracker of Python < 3.13).
+    try:
+        return shared_memory.SharedMemory(name, track = False)
+    except TypeError:
+        pass
+    from multiprocessing import resource_tracker
+    with _attachLock:
+        register, resource_tracker.register = resource_tracker.register, lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class StatePublisher():
+
+    def __init__(self, name, devices, publish = True):
+        """
+
+        :param name: str. Name of the shared memory block
+        :param devices: Dict serial => TLKinesisInertialMotor, TLKinesisStrainGauge or TLKinesisPiezoDriver
+        :param publish: Boolean. Subscribes to the messages of the devices. If False, call Publish
+        """
+        self.name = name
+        self.devices = dict(devices)
+        size = HEADER_DTYPE.itemsize + SLOT_DTYPE.itemsize * len(self.devices)
+        self.__shm = shared_memory.SharedMemory(name, create = True, size = size)
+        header = numpy.ndarray((), HEADER_DTYPE, self.__shm.buf, 0)
+        header['magic'], header['version'] = MAGIC, VERSION
+        header['slots'], header['slot_size'] = len(self.devices), SLOT_DTYPE.itemsize
+        self.__slots = numpy.ndarray(len(self.devices), SLOT_DTYPE, self.__shm.buf, HEADER_DTYPE.itemsize)
+        self.__slots[:] = 0
+        self.__index = {}
+        self.__locks = {}
+        self.__callbacks = {}
+        for index, serial in enumerate(self.devices):
+            self.__slots[index]['serial'] = serial.encode()
+            self.__index[serial] = index
+            self.__locks[serial] = threading.Lock()
+        for serial in self.devices:
+            self.Publish(serial)
+            if publish: self._subscribe(serial)
+
+    def _subscribe(self, serial):
+        def callback(msg_type, msg_id, data, timestamp):
+            self.Publish(serial)
+        self.devices[serial].GetMessagePump().subscribe(callback)
+        self.__callbacks[serial] = callback
+
+    def Publish(self, serial):
+        """
+        Reads the device state (driver position table, DLL cache) and writes it in the slot.
+
+        :param serial: str
+        :return: None
+        """
+        device = self.devices[serial]
+        if hasattr(device, 'GetCachedPositionAll'):
+            status = [device.GetStatusBits(x + 1) for x in range(4)]
+            position = device.GetCachedPositionAll() #Updated by the move messages
+            for x in range(4):
+                if status[x] & _MOVING: position[x] = device.GetCurrentPosition(x + 1)
+            reading = None
+        else:
+            position = None
+            status = [device.GetStatusBits(1), 0, 0, 0]
+            reading = device.GetReadingExt(False, wait = False) if hasattr(device, 'GetReadingExt') else None
+        slot = self.__slots[self.__index[serial]]
+        with self.__locks[serial]: #One writer per slot
+            slot['sequence'] += 1
+            if position is not None: slot['position'] = position
+            slot['status'] = status
+            if reading is not None:
+                slot['reading'] = reading[0]
+                slot['overrange'] = reading[1].value
+                slot['display_mode'] = device.GetDisplayMode() or 0
+            slot['timestamp'] = time.perf_counter()
+            slot['updates'] += 1
+            slot['sequence'] += 1
+
+    def close(self):
+        """
+        Stops publishing and removes the block. Readers keep their mapping until they close.
+
+        :return: None
+        """
+        for serial, callback in self.__callbacks.items():
+            self.devices[serial].GetMessagePump().unsubscribe(callback)
+        self.__callbacks = {}
+        self.__slots = None
+        self.__shm.close()
+        self.__shm.unlink()
+
+
+class StateReader():
+
+    def __init__(self, name, timeout = 1.0):
+        """
+
+        :param name: str. Name given to the StatePublisher
+        :param timeout: float (in s). Longest time a slot can stay inconsistent before a read fails
+        """
+        self.__shm = _attach(name)
+        header = numpy.ndarray((), HEADER_DTYPE, self.__shm.buf, 0)
+        if bytes(header['magic']) != MAGIC or header['version'] != VERSION or header['slot_size'] != SLOT_DTYPE.itemsize:
+            self.__shm.close()
+            raise ValueError(f'{name} is not a Kinesis state block.')
+        self.__buffer = self.__shm.buf
+        self.__offsets = {}
+        for index in range(int(header['slots'])):
+            offset = HEADER_DTYPE.itemsize + index * SLOT_DTYPE.itemsize
+            serial = bytes(self.__buffer[offset + SLOT_DTYPE.fields['serial'][1]:][:16]).rstrip(b'\0').decode()
+            self.__offsets[serial] = offset
+        self.timeout = timeout
+        self.retries = 0
+
+    def serials(self):
+        return list(self.__offsets)
+
+    def _copy(self, serial):
+        #Consistent bytes of the slot.
+        offset = self.__offsets[serial]
+        buffer = self.__buffer
+        end = offset + SLOT_DTYPE.itemsize
+        deadline = None
+        while True:
+            before = _SEQUENCE.unpack_from(buffer, offset)[0]
+            if not before & 1:
+                data = buffer[offset:end].tobytes()
+                if _SEQUENCE.unpack_from(buffer, offset)[0] == before: return data
+            self.retries += 1
+            if deadline is None: deadline = time.perf_counter() + self.timeout
+            elif time.perf_counter() > deadline:
+                raise TimeoutError(f'Slot of {serial} inconsistent for {self.timeout} s (publisher stopped while writing?).')
+            time.sleep(0) #Lets the writer finish
+
+    def read(self, serial):
+        """
+
+        :param serial: str
+        :return: numpy record (SLOT_DTYPE), consistent copy of the slot
+        """
+        return numpy.frombuffer(self._copy(serial), SLOT_DTYPE)[0]
+
+    def positions(self, serial):
+        """
+
+        :param serial: str
+        :return: tuple of the 4 KIM101 positions
+        """
+        return _POSITION.unpack_from(self._copy(serial), _POSITION_OFFSET)
+
+    def reading(self, serial):
+        """
+
+        :param serial: str
+        :return: (reading, overrange) of a KSG101
+        """
+        data = self._copy(serial)
+        return _READING.unpack_from(data, _READING_OFFSET)[0], bool(data[_OVERRANGE_OFFSET])
+
+    def updates(self, serial):
+        """
+
+        :param serial: str
+        :return: int. Number of updates of the slot, changes when there is something new to read
+        """
+        return _SEQUENCE.unpack_from(self.__buffer, self.__offsets[serial] + _UPDATES_OFFSET)[0]
+
+    def close(self):
+        self.__buffer = None
+        self.__shm.close()
@@ -0,0 +1,701 @@
+"""
+Pure python stand-in for the ThorLabs Kinesis DLLs.
+
+SimulatedLibrary exposes the TLI_, KIM_, SG_ and PCC_ entry points used by the drivers
+with the same calling convention as the ctypes library (pointer arguments are filled
+in place, callbacks are invoked from a library owned thread). Every opened device runs
+a service thread that mimics the DLL polling loop:
+
+    * positions/readings seen by the Get functions are the values cached at the last poll;
+    * each poll queues a status message and calls the registered LOGGERFUNC;
+    * KIM moves follow a trapezoidal profile set by the step rate and step acceleration
+      of SetDriveOPParameters and a Moved message is queued by the poll that sees them done;
+    * settings (display mode, control mode...) are acknowledged after settings_latency.
+
+Devices are kept in a SimulatedBench, keyed by serial number. The product prefix of the
+serial number gives the device family (97 = KIM, 59 = KSG, 29 = KPZ).
+"""
+
+from Modules.ErrorEnum import FTDI_COM_ERROR
+from Modules.MessageEnum import MESSAGE_TYPE, GENERIC_DEVICE_MSG, GENERIC_MOTOR_MSG
+
+from collections import deque
+import heapq, math, random, time
+import threading
+
+FT_OK = FTDI_COM_ERROR.FT_OK.value
+FT_DeviceNotFound = FTDI_COM_ERROR.FT_DeviceNotFound.value
+FT_DeviceNotOpened = FTDI_COM_ERROR.FT_DeviceNotOpened.value
+TL_ALREADY_OPEN = FTDI_COM_ERROR.TL_ALREADY_OPEN.value
+TL_INVALID_CHANNEL = FTDI_COM_ERROR.TL_INVALID_CHANNEL.value
+
+STATUS_UPDATE = (MESSAGE_TYPE.GenericDevice.value, GENERIC_DEVICE_MSG.SettingsUpdated.value)
+SETTINGS_DONE = (MESSAGE_TYPE.GenericDevice.value, GENERIC_DEVICE_MSG.SettingsDone.value)
+MOVED = (MESSAGE_TYPE.GenericMotor.value, GENERIC_MOTOR_MSG.Moved.value)
+STOPPED = (MESSAGE_TYPE.GenericMotor.value, GENERIC_MOTOR_MSG.Stopped.value)
+
+MAX_QUEUE_SIZE = 1000 #Oldest messages are overwritten past this size, as in the DLL.
+
+STATUS_MOVING_CW = 0x00000010
+STATUS_MOVING_CCW = 0x00000020
+STATUS_ENABLED = 0x80000000
+
+def _deref(arg):
+    #Pointer arguments may come as the ctypes object itself, byref(obj) or pointer(obj).
+    if hasattr(arg, '_obj'): return arg._obj
+    if hasattr(arg, 'contents'): return arg.contents
+    return arg
+
+
+class SimulatedDevice():
+    """
+    Common part of every simulated K-Cube: connection, polling loop and message queue.
+    """
+    prefix = ''
+    model = b''
+    device_type = 0
+    channels = 1
+    functions = ('CheckConnection', 'Open', 'Close', 'Enable', 'GetStatusBits', 'RequestStatusBits',
+                 'MessageQueueSize', 'GetFirmwareVersion', 'PollingDuration', 'StartPolling', 'StopPolling',
+                 'RegisterMessageCallback', 'GetNextMessage', 'GetHardwareInfoBlock')
+
+    def __init__(self, serial, firmware=0x00010003, command_latency=0.0, settings_latency=0.01):
+        self.serial = serial
+        self.firmware = firmware
+        self.command_latency = command_latency
+        self.settings_latency = settings_latency
+        self.connected = True
+        self.opened = False
+        self.polling = 0
+        self.callback = None
+        self.random = random.Random(serial)
+        self.stats = {'commands': 0, 'polls': 0, 'messages': 0, 'dropped': 0, 'callbacks': 0,
+                      'callback_time': 0.0}
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._queue = deque(maxlen=MAX_QUEUE_SIZE)
+        self._deferred = []
+        self._next_poll = None
+        self._thread = None
+        self._closing = False
+
+    def _command(self):
+        #Every call going to the device pays the USB round trip.
+        self.stats['commands'] += 1
+        if self.command_latency: time.sleep(self.command_latency)
+
+    def post(self, msg_type, msg_id, data=0):
+        """
+        Queues a message and calls the registered callback, as the DLL does.
+        """
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen: self.stats['dropped'] += 1
+            self._queue.append((msg_type, msg_id, data))
+            self.stats['messages'] += 1
+            callback = self.callback
+        if callback is not None:
+            start = time.perf_counter()
+            callback(None)
+            self.stats['callbacks'] += 1
+            self.stats['callback_time'] += time.perf_counter() - start
+
+    def post_later(self, delay, msg_type, msg_id, data=0):
+        with self._cond:
+            heapq.heappush(self._deferred, (time.perf_counter() + delay, msg_type, msg_id, data))
+            self._cond.notify()
+
+    def poll(self, now):
+        """
+        Refreshes the values cached by the library. Returns the messages to post.
+
+        :param now: perf_counter time of the poll
+        :return: list of (type, id, data)
+        """
+        return [STATUS_UPDATE + (0,)]
+
+    def _service(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closing: return
+                    now = time.perf_counter()
+                    deadlines = [self._deferred[0][0]] if self._deferred else []
+                    if self.polling:
+                        if self._next_poll is None: self._next_poll = now + self.polling / 1000
+                        deadlines.append(self._next_poll)
+                    due = min(deadlines) if deadlines else None
+                    if due is not None and due <= now: break
+                    self._cond.wait(None if due is None else due - now)
+                messages = []
+                while self._deferred and self._deferred[0][0] <= now:
+                    messages.append(heapq.heappop(self._deferred)[1:])
+                polled = self.polling and self._next_poll <= now
+                if polled:
+                    self._next_poll += self.polling / 1000
+                    if self._next_poll <= now: self._next_poll = now + self.polling / 1000
+                    self.stats['polls'] += 1
+                    messages += self.poll(now)
+            for msg in messages:
+                self.post(*msg)
+
+    def unplug(self):
+        """
+        USB cable pulled or power lost: the library loses the device, which forgets its settings.
+        """
+        self.Close()
+        self.connected = False
+        self.power_on()
+
+    def plug(self):
+        self.connected = True
+
+    def power_on(self):
+        #Settings kept by the device only while powered.
+        pass
+
+    def CheckConnection(self):
+        return self.connected
+
+    def Open(self):
+        with self._cond:
+            if not self.connected: return FT_DeviceNotFound
+            if self.opened: return TL_ALREADY_OPEN
+            self.opened = True
+            self._closing = False
+            self._thread = threading.Thread(target=self._service, name=f'Kinesis simulator {self.serial}',
+                                            daemon=True)
+            self._thread.start()
+        self._command()
+        return FT_OK
+
+    def Close(self):
+        with self._cond:
+            self.opened = False
+            self.polling = 0
+            self.callback = None
+            self._closing = True
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread(): thread.join()
+
+    def Enable(self):
+        self._command()
+        return FT_OK
+
+    def GetStatusBits(self, channel=1):
+        return STATUS_ENABLED
+
+    def RequestStatusBits(self):
+        self._command()
+        return FT_OK
+
+    def MessageQueueSize(self):
+        return len(self._queue)
+
+    def GetFirmwareVersion(self):
+        return self.firmware
+
+    def PollingDuration(self):
+        return self.polling
+
+    def StartPolling(self, milliseconds):
+        with self._cond:
+            self.polling = int(milliseconds)
+            self._next_poll = None
+            self._cond.notify()
+        return True
+
+    def StopPolling(self):
+        with self._cond:
+            self.polling = 0
+            self._cond.notify()
+
+    def RegisterMessageCallback(self, callback):
+        self.callback = callback
+
+    def GetNextMessage(self, msg_type, msg_id, msg_data):
+        try:
+            values = self._queue.popleft()
+        except IndexError:
+            return False
+        for arg, value in zip((msg_type, msg_id, msg_data), values):
+            _deref(arg).value = value
+        return True
+
+    def GetHardwareInfoBlock(self, info):
+        self._command()
+        info = _deref(info)
+        info.serialNumber = int(self.serial)
+        info.modelNumber = self.model
+        info.type = self.device_type
+        info.firmwareVersion = self.firmware
+        info.notes = b'Simulated ' + self.model
+        info.hardwareVersion = 1
+        info.modificationState = 0
+        info.numChannels = self.channels
+        return FT_OK
+
+
+class _Move():
+    """
+    Trapezoidal step profile (triangular when the step rate is not reached).
+    """
+    def __init__(self, start, target, t0, step_rate, step_acc):
+        self.start = start
+        self.target = target
+        self.t0 = t0
+        self.distance = abs(target - start)
+        self.direction = 1 if target >= start else -1
+        self.v = max(step_rate, 1)
+        self.a = max(step_acc, 1)
+        if self.distance <= self.v ** 2 / self.a: #Never reaches the step rate
+            self.t_acc = math.sqrt(self.distance / self.a)
+            self.duration = 2 * self.t_acc
+            self.v = self.a * self.t_acc
+        else:
+            self.t_acc = self.v / self.a
+            self.duration = self.distance / self.v + self.t_acc
+        self.t_end = t0 + self.duration
+
+    def position(self, now):
+        t = now - self.t0
+        if t >= self.duration: return self.target
+        if t <= 0: return self.start
+        if t < self.t_acc:
+            travelled = 0.5 * self.a * t ** 2
+        elif t > self.duration - self.t_acc:
+            travelled = self.distance - 0.5 * self.a * (self.duration - t) ** 2
+        else:
+            travelled = 0.5 * self.a * self.t_acc ** 2 + self.v * (t - self.t_acc)
+        return self.start + self.direction * int(travelled)
+
+
+class SimulatedInertialMotor(SimulatedDevice):
+    """
+    KIM101: four inertial piezo channels driven in open loop steps.
+    """
+    prefix = '97'
+    model = b'KIM101'
+    device_type = 97
+    channels = 4
+    functions = SimulatedDevice.functions + (
+        'EnableChannel', 'MoveAbsolute', 'MoveRelative', 'RequestCurrentPosition', 'GetCurrentPosition',
+        'GetDriveOPParameters', 'SetDriveOPParameters')
+
+    def __init__(self, serial, voltage=110, step_rate=500, step_acc=1000, **kwargs):
+        super().__init__(serial, **kwargs)
+        self.default_drive = [voltage, step_rate, step_acc]
+        self.drive = [list(self.default_drive) for x in range(self.channels)]
+        self.position = [0] * self.channels
+        self.moves = [None] * self.channels
+        self.cached_position = [0] * self.channels
+        self.cached_status = [STATUS_ENABLED] * self.channels
+
+    def power_on(self):
+        self.drive = [list(self.default_drive) for x in range(self.channels)]
+        self.moves = [None] * self.channels
+
+    def true_position(self, index, now):
+        move = self.moves[index]
+        return self.position[index] if move is None else move.position(now)
+
+    def _status(self, index):
+        move = self.moves[index]
+        if move is None: return STATUS_ENABLED
+        return STATUS_ENABLED | (STATUS_MOVING_CW if move.direction > 0 else STATUS_MOVING_CCW)
+
+    def _refresh(self, index, now):
+        self.cached_position[index] = self.true_position(index, now)
+        self.cached_status[index] = self._status(index)
+
+    def poll(self, now):
+        messages = []
+        for index, move in enumerate(self.moves):
+            if move is not None and now >= move.t_end:
+                self.position[index] = move.target
+                self.moves[index] = None
+                messages.append(MOVED + (index + 1,))
+            self._refresh(index, now)
+        return messages + super().poll(now)
+
+    def EnableChannel(self, channel):
+        self._command()
+        return FT_OK if 1 <= channel <= self.channels else TL_INVALID_CHANNEL
+
+    def MoveAbsolute(self, channel, value):
+        if not 1 <= channel <= self.channels: return TL_INVALID_CHANNEL
+        self._command()
+        index = channel - 1
+        with self._lock:
+            now = time.perf_counter()
+            start = self.true_position(index, now)
+            voltage, step_rate, step_acc = self.drive[index]
+            self.position[index] = start
+            self.moves[index] = _Move(start, int(value), now, step_rate, step_acc)
+        return FT_OK
+
+    def MoveRelative(self, channel, step):
+        if not 1 <= channel <= self.channels: return TL_INVALID_CHANNEL
+        with self._lock:
+            move = self.moves[channel - 1]
+            target = self.position[channel - 1] if move is None else move.target
+        return self.MoveAbsolute(channel, target + int(step))
+
+    def GetStatusBits(self, channel=1):
+        if not 1 <= channel <= self.channels: return 0
+        return self.cached_status[channel - 1]
+
+    def RequestStatusBits(self):
+        self._command()
+        with self._lock:
+            for index in range(self.channels): self.cached_status[index] = self._status(index)
+        return FT_OK
+
+    def RequestCurrentPosition(self, channel):
+        if not 1 <= channel <= self.channels: return TL_INVALID_CHANNEL
+        self._command()
+        with self._lock:
+            self._refresh(channel - 1, time.perf_counter())
+        return FT_OK
+
+    def GetCurrentPosition(self, channel):
+        if not 1 <= channel <= self.channels: return 0
+        return self.cached_position[channel - 1]
+
+    def GetDriveOPParameters(self, channel, voltage, step_rate, step_acc):
+        if not 1 <= channel <= self.channels: return TL_INVALID_CHANNEL
+        self._command()
+        for arg, value in zip((voltage, step_rate, step_acc), self.drive[channel - 1]):
+            _deref(arg).value = value
+        return FT_OK
+
+    def SetDriveOPParameters(self, channel, voltage, step_rate, step_acc):
+        if not 1 <= channel <= self.channels: return TL_INVALID_CHANNEL
+        self._command()
+        self.drive[channel - 1] = [int(voltage), int(step_rate), int(step_acc)]
+        return FT_OK
+
+
+class SimulatedStrainGauge(SimulatedDevice):
+    """
+    KSG101: strain gauge reader. The measured signal is signal(t), a fraction of the full scale.
+    """
+    prefix = '59'
+    model = b'KSG101'
+    device_type = 59
+    channels = 1
+    functions = SimulatedDevice.functions + (
+        'SetZero', 'SetDisplayMode', 'GetReadingExt', 'GetMaximumTravel', 'GetForceCalib',
+        'GetHubAnalogOutput', 'SetHubAnalogOutput')
+
+    FULL_SCALE = 32767
+    GAIN = {1: 1.0, 2: 0.8, 3: 0.6} #Reading gain of position, voltage and force modes
+
+    def __init__(self, serial, max_travel=2000, force_calib=30000, sample_period=0.001, noise=0.001,
+                 signal=None, **kwargs):
+        super().__init__(serial, **kwargs)
+        self.max_travel = max_travel
+        self.force_calib = force_calib
+        self.sample_period = sample_period
+        self.noise = noise
+        self.signal = signal if signal is not None else (lambda t: 0.5 * math.sin(math.pi * t))
+        self.display_mode = 1
+        self.hub_analog_output = 1
+        self.zero = 0.0
+        self.t0 = time.perf_counter()
+
+    def power_on(self):
+        self.display_mode = 1
+
+    def value(self, now):
+        #The gauge holds each sample for sample_period.
+        t = now - self.t0
+        if self.sample_period: t -= t % self.sample_period
+        return self.signal(t) - self.zero
+
+    def SetZero(self):
+        self._command()
+        self.zero = self.signal(time.perf_counter() - self.t0)
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+    def SetDisplayMode(self, mode):
+        self._command()
+        self.display_mode = int(mode)
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+    def GetReadingExt(self, clip, overrange):
+        reading = self.value(time.perf_counter()) * self.GAIN.get(self.display_mode, 1.0)
+        reading = int((reading + self.random.gauss(0, self.noise)) * self.FULL_SCALE)
+        over = abs(reading) > self.FULL_SCALE
+        if over and clip: reading = self.FULL_SCALE if reading > 0 else -self.FULL_SCALE
+        _deref(overrange).value = over
+        return reading
+
+    def GetMaximumTravel(self):
+        self._command()
+        return self.max_travel
+
+    def GetForceCalib(self):
+        self._command()
+        return self.force_calib
+
+    def GetHubAnalogOutput(self):
+        self._command()
+        return self.hub_analog_output
+
+    def SetHubAnalogOutput(self, mode):
+        self._command()
+        self.hub_analog_output = int(mode)
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+
+class SimulatedPiezo(SimulatedDevice):
+    """
+    KPZ101: single channel piezo driver with the output look-up table.
+    """
+    prefix = '29'
+    model = b'KPZ101'
+    device_type = 29
+    channels = 1
+    functions = SimulatedDevice.functions + ('SetZero', 'SetPositionControlMode', 'GetPositionControlMode',
+                                             'GetMaxOutputVoltage', 'SetMaxOutputVoltage', 'GetOutputVoltage',
+                                             'SetOutputVoltage', 'GetPosition', 'SetPosition', 'GetLUTwaveParams',
+                                             'SetLUTwaveParams', 'SetLUTwaveSample', 'StartLUTwave', 'StopLUTwave')
+    LUT_SIZE = 7000
+    LUT_FIELDS = ('mode', 'cycleLength', 'numCycles', 'LUTValueDelay', 'preCycleDelay', 'postCycleDelay',
+                  'outTriggerStart', 'outTriggerDuration', 'numOutTriggerRepeat')
+
+    def __init__(self, serial, max_voltage=750, **kwargs):
+        super().__init__(serial, **kwargs)
+        self.control_mode = 1
+        self.max_voltage = max_voltage #In tenths of volt
+        self.setpoint = 0
+        self.lut = [0] * self.LUT_SIZE
+        self.lut_params = dict.fromkeys(self.LUT_FIELDS, 0)
+        self.lut_params.update(mode=1, cycleLength=1, numCycles=1, LUTValueDelay=1)
+        self.lut_start = None
+        self.lut_writes = 0
+
+    def power_on(self):
+        self.control_mode = 1
+        self.lut_start = None
+
+    def output(self, now):
+        """
+        Setpoint at time now: the table sample being played, or the last SetOutputVoltage/SetPosition.
+        """
+        if self.lut_start is None: return self.setpoint
+        params = self.lut_params
+        length = max(params['cycleLength'], 1)
+        step = int((now - self.lut_start) * 1000 / max(params['LUTValueDelay'], 1))
+        if params['mode'] & 2 and step >= length * params['numCycles']: #Fixed number of cycles done
+            self.setpoint = self.lut[length - 1]
+            self.lut_start = None
+            return self.setpoint
+        return self.lut[step % length]
+
+    def SetZero(self):
+        self._command()
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+    def SetPositionControlMode(self, mode):
+        self._command()
+        self.control_mode = int(mode)
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+    def GetPositionControlMode(self):
+        return self.control_mode
+
+    def GetMaxOutputVoltage(self):
+        return self.max_voltage
+
+    def SetMaxOutputVoltage(self, value):
+        self._command()
+        self.max_voltage = int(value)
+        self.post_later(self.settings_latency, *SETTINGS_DONE)
+        return FT_OK
+
+    def GetOutputVoltage(self):
+        return self.output(time.perf_counter()) if self.control_mode in (1, 3) else 0
+
+    def SetOutputVoltage(self, value):
+        self._command()
+        self.lut_start = None
+        self.setpoint = max(-32767, min(32767, int(value)))
+        return FT_OK
+
+    def GetPosition(self):
+        return self.output(time.perf_counter()) if self.control_mode in (2, 4) else 0
+
+    def SetPosition(self, value):
+        self._command()
+        self.lut_start = None
+        self.setpoint = max(0, min(32767, int(value)))
+        return FT_OK
+
+    def GetLUTwaveParams(self, params):
+        params = _deref(params)
+        for name in self.LUT_FIELDS: setattr(params, name, self.lut_params[name])
+        return FT_OK
+
+    def SetLUTwaveParams(self, params):
+        self._command()
+        params = _deref(params)
+        if not 0 < params.cycleLength <= self.LUT_SIZE: return FTDI_COM_ERROR.FT_InvalidParameter.value
+        self.lut_params = {name: getattr(params, name) for name in self.LUT_FIELDS}
+        return FT_OK
+
+    def SetLUTwaveSample(self, index, value):
+        self._command()
+        if not 0 <= index < self.LUT_SIZE: return FTDI_COM_ERROR.FT_InvalidParameter.value
+        self.lut[index] = int(value) - 65536 if int(value) > 32767 else int(value) #WORD holding a short
+        self.lut_writes += 1
+        return FT_OK
+
+    def StartLUTwave(self):
+        self._command()
+        self.lut_start = time.perf_counter()
+        return FT_OK
+
+    def StopLUTwave(self):
+        self._command()
+        self.setpoint = self.output(time.perf_counter())
+        self.lut_start = None
+        return FT_OK
+
+
+class SimulatedBench():
+    """
+    The set of simulated devices visible to every SimulatedLibrary.
+    """
+    families = {x.prefix: x for x in (SimulatedInertialMotor, SimulatedStrainGauge, SimulatedPiezo)}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.devices = {}
+        self.device_list = []
+
+    def add_device(self, serial, **kwargs):
+        """
+
+        :param serial: str. First two digits give the family (97, 59 or 29)
+        :param kwargs: timing model parameters of the device class
+        :return: SimulatedDevice
+        """
+        serial = serial.decode() if isinstance(serial, bytes) else str(serial)
+        family = self.families.get(serial[:2])
+        if family is None: raise ValueError(f'No simulated device with prefix {serial[:2]}.')
+        with self._lock:
+            device = self.devices.get(serial)
+            if device is None:
+                device = self.devices[serial] = family(serial, **kwargs)
+        return device
+
+    def get_device(self, serial):
+        serial = serial.decode() if isinstance(serial, bytes) else str(serial)
+        return self.devices.get(serial)
+
+    def remove_device(self, serial):
+        device = self.devices.pop(serial.decode() if isinstance(serial, bytes) else str(serial), None)
+        if device is not None: device.Close()
+
+    def reset(self):
+        for serial in list(self.devices): self.remove_device(serial)
+        self.device_list = []
+
+    def build_device_list(self):
+        with self._lock:
+            self.device_list = sorted(serial for serial, device in self.devices.items() if device.connected)
+        return FT_OK
+
+
+bench = SimulatedBench()
+
+
+class _SimulatedFunction():
+    """
+    Callable standing for a DLL export. argtypes and restype are accepted and ignored.
+    """
+    def __init__(self, name, call):
+        self.__name__ = name
+        self.argtypes = None
+        self.restype = None
+        self._call = call
+
+    def __call__(self, *args):
+        return self._call(*args)
+
+    def __repr__(self):
+        return f'<SimulatedFunction {self.__name__}>'
+
+
+class SimulatedLibrary():
+    """
+    Library object returned by the 'simulated' backend for one of the ThorLabs DLLs.
+    """
+    _prefixes = {
+        'InertialMotor': ('KIM', SimulatedInertialMotor),
+        'StrainGauge': ('SG', SimulatedStrainGauge),
+        'Piezo': ('PCC', SimulatedPiezo)
+    }
+
+    def __init__(self, dllname, bench=bench):
+        self._name = dllname
+        self._bench = bench
+        self._prefix, self._family = None, None
+        for key, value in self._prefixes.items():
+            if f'.{key}.' in dllname: self._prefix, self._family = value
+
+    def __repr__(self):
+        return f'<SimulatedLibrary {self._name}>'
+
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        call = None
+        if name.startswith('TLI_'):
+            call = getattr(self, '_' + name, None)
+        elif self._prefix is not None and name.startswith(self._prefix + '_'):
+            function = name[len(self._prefix) + 1:]
+            if function in self._family.functions: call = self._device_function(function)
+        if call is None: raise AttributeError(f'function {name!r} not found')
+        func = _SimulatedFunction(name, call)
+        setattr(self, name, func)
+        return func
+
+    def _device_function(self, function):
+        def call(serial, *args):
+            device = self._bench.get_device(serial)
+            if function == 'Open' and device is None and serial[:2].decode() == self._family.prefix:
+                device = self._bench.add_device(serial)
+            if device is None or not isinstance(device, self._family):
+                return False if function == 'CheckConnection' else FT_DeviceNotFound
+            if function not in ('Open', 'CheckConnection') and not device.opened:
+                return False if function in ('StartPolling', 'GetNextMessage') else FT_DeviceNotOpened
+            return getattr(device, function)(*args)
+        return call
+
+    def _TLI_InitializeSimulations(self):
+        return None
+
+    def _TLI_UninitializeSimulations(self):
+        return None
+
+    def _TLI_BuildDeviceList(self):
+        return self._bench.build_device_list()
+
+    def _TLI_GetDeviceListSize(self):
+        return len(self._bench.device_list)
+
+    def _TLI_GetDeviceListExt(self, buffer, size):
+        return self._TLI_GetDeviceListByTypeExt(buffer, size, None)
+
+    def _TLI_GetDeviceListByTypeExt(self, buffer, size, typeID):
+        serials = [x for x in self._bench.device_list if typeID is None or x[:2] == str(typeID)]
+        _deref(buffer).value = ','.join(serials).encode()[:size - 1]
+        return FT_OK
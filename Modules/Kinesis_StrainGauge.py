@@ -1,16 +1,21 @@
-from ctypes import cdll, POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
-    c_ulong, c_bool, WINFUNCTYPE, Structure
+from ctypes import POINTER, c_uint, c_char, c_byte, c_char_p, c_void_p, c_ushort, c_short, c_int, c_long, \
+    c_ulong, c_bool, Structure, sizeof
 
 from Modules.ErrorEnum import FTDI_COM_ERROR
-
-import os, time
+from Modules.Kinesis_Backend import LOGGERFUNC, function_table
+from Modules.Kinesis_MessagePump import MessagePump
+from Modules.Kinesis_Polling import AdaptivePolling
+from Modules.Kinesis_Watchdog import ConnectionWatchdog, wait_message
+from Modules.Kinesis_Settings import SettingsCache, hardware_cache, hardware_key, save_profile, load_profile
+from Modules import Kinesis_Instrumentation
+from Modules.Kinesis_StrainGaugeStream import StrainGaugeStream
+from Modules.Kinesis_OnlineStats import ReadingStatistics
+
+from concurrent.futures import Future, wait
+import numpy
+import time
 import threading
 
-def _buildFunction(call, args, result):
-    call.argtypes = args
-    call.restype = result
-    return call
-
 def c_str_array(strings):
     arr = (c_char_p * len(strings))()
     arr[:] = strings
@@ -27,6 +32,12 @@ class TLI_HardwareInformation(Structure):
                 ("modificationState", c_ushort),
                 ("numChannels", c_short)]
 
+DISPLAY_MODES = {
+    'position': 1,
+    'voltage': 2,
+    'force': 3
+}
+
 
 
 class MessageQueue():
@@ -39,7 +50,33 @@ class MessageQueue():
         return [self.msg_type.value, self.msg_id.value, self.msg_data.value]
 
 
-LOGGERFUNC = WINFUNCTYPE(None, c_void_p)
+_ALREADY_OPEN = FTDI_COM_ERROR.TL_ALREADY_OPEN.value
+
+_PROTOTYPES = {
+    'InitializeSimulations': ('TLI_InitializeSimulations', None, c_void_p),
+    'BuildDeviceList': ('TLI_BuildDeviceList', None, c_short),
+    'GetDeviceListSize': ('TLI_GetDeviceListSize', None, c_short),
+    'CheckConnection': ('SG_CheckConnection', [c_char_p], c_bool),
+    'Open': ('SG_Open', [c_char_p], c_short),
+    'Close': ('SG_Close', [c_char_p], None),
+    'Enable': ('SG_Enable', [c_char_p], c_short),
+    'GetStatusBits': ('SG_GetStatusBits', [c_char_p, c_ushort], c_ulong),
+    'MessageQueueSize': ('SG_MessageQueueSize', [c_char_p], c_int),
+    'GetFirmwareVersion': ('SG_GetFirmwareVersion', [c_char_p], c_ulong),
+    'PollingDuration': ('SG_PollingDuration', [c_char_p], c_long),
+    'StartPolling': ('SG_StartPolling', [c_char_p, c_int], c_bool),
+    'StopPolling': ('SG_StopPolling', [c_char_p], None),
+    'RegisterMessageCallback': ('SG_RegisterMessageCallback', [c_char_p, LOGGERFUNC], None),
+    'GetNextMessage': ('SG_GetNextMessage', [c_char_p, POINTER(c_ulong), POINTER(c_ulong), POINTER(c_ulong)], c_bool),
+    'GetHardwareInfoBlock': ('SG_GetHardwareInfoBlock', [c_char_p, POINTER(TLI_HardwareInformation)], c_short),
+    'SetZero': ('SG_SetZero', [c_char_p], c_short),
+    'SetDisplayMode': ('SG_SetDisplayMode', [c_char_p, c_uint], c_short),
+    'GetReadingExt': ('SG_GetReadingExt', [c_char_p, c_bool, POINTER(c_bool)], c_int),
+    'GetMaximumTravel': ('SG_GetMaximumTravel', [c_char_p], c_ulong),
+    'GetForceCalib': ('SG_GetForceCalib', [c_char_p], c_int),
+    'GetHubAnalogOutput': ('SG_GetHubAnalogOutput', [c_char_p], c_uint),
+    'SetHubAnalogOutput': ('SG_SetHubAnalogOutput', [c_char_p, c_uint], c_short)
+}
 
 class TLKinesisStrainGauge():
 
@@ -48,87 +85,135 @@ class TLKinesisStrainGauge():
         return val
 
     def _initialize_library(self):
+        self.__lib = function_table("Thorlabs.MotionControl.KCube.StrainGauge.dll", _PROTOTYPES)
 
-        libname = os.path.dirname(__file__)
-        libname = os.path.join(libname, "../dlls/Thorlabs.MotionControl.KCube.StrainGauge.dll")
-        _library = cdll.LoadLibrary(libname)
-
-        self.__InitializeSimulations = _buildFunction(_library.TLI_InitializeSimulations, None, c_void_p)
-        self.__BuildDeviceList = _buildFunction(_library.TLI_BuildDeviceList, None, c_short)
-        self.__GetDeviceListSize = _buildFunction(_library.TLI_GetDeviceListSize, None, c_short)
-        self.__CheckConnection = _buildFunction(_library.SG_CheckConnection, [c_char_p], c_bool)
-        self.__Open = _buildFunction(_library.SG_Open, [c_char_p], c_short)
-        self.__Close = _buildFunction(_library.SG_Close, [c_char_p], None)
-        self.__Enable = _buildFunction(_library.SG_Enable, [c_char_p], c_short)
-        self.__GetStatusBits = _buildFunction(_library.SG_GetStatusBits, [c_char_p, c_ushort], c_ulong)
-        self.__MessageQueueSize = _buildFunction(_library.SG_MessageQueueSize, [c_char_p], c_int)
-        self.__GetFirmwareVersion = _buildFunction(_library.SG_GetFirmwareVersion, [c_char_p], c_ulong)
-        self.__PollingDuration = _buildFunction(_library.SG_PollingDuration, [c_char_p], c_long)
-        self.__StartPolling = _buildFunction(_library.SG_StartPolling, [c_char_p, c_int], c_bool)
-        self.__StopPolling = _buildFunction(_library.SG_StopPolling, [c_char_p], None)
-        self.__RegisterMessageCallback = _buildFunction(_library.SG_RegisterMessageCallback, [c_char_p, LOGGERFUNC], None)
-        self.__GetNextMessage = _buildFunction(_library.SG_GetNextMessage, [c_char_p, POINTER(c_ulong), POINTER(c_ulong),
-                                                                             POINTER(c_ulong)], c_bool)
-        self.__GetHardwareInfoBlock = _buildFunction(_library.SG_GetHardwareInfoBlock, [c_char_p,
-                                                                                        POINTER(TLI_HardwareInformation)], c_short)
-
-        self.__SetZero = _buildFunction(_library.SG_SetZero, [c_char_p], c_short)
-        self.__SetDisplayMode = _buildFunction(_library.SG_SetDisplayMode, [c_char_p, c_uint], c_short)
-        self.__GetReadingExt = _buildFunction(_library.SG_GetReadingExt, [c_char_p, c_bool, POINTER(c_bool)], c_int)
-        self.__GetMaximumTravel = _buildFunction(_library.SG_GetMaximumTravel, [c_char_p], c_ulong)
-        self.__GetForceCalib = _buildFunction(_library.SG_GetForceCalib, [c_char_p], c_int)
-        self.__GetHubAnalogOutput = _buildFunction(_library.SG_GetHubAnalogOutput, [c_char_p], c_uint)
-        self.__SetHubAnalogOutput = _buildFunction(_library.SG_SetHubAnalogOutput, [c_char_p, c_uint], c_short)
-
-
-    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False):
+    def __init__(self, serialno, pollingTime = 150, TIMEOUT = 5.0, SIMULATION = False, BUILD_DEVICE_LIST = True,
+                 WAIT_READY = True):
+        self.__start = start = time.perf_counter()
         self._initialize_library()
         self.__serial = serialno.encode()
+        self.__hardwareKey = hardware_key(serialno, SIMULATION) #Simulated devices are not saved to disk
         self.__fn = LOGGERFUNC(self._callback)
-        self.__eventHandler = threading.Event()
+        self.__eventHandler = threading.Event() #Cleared while a display mode change is not acknowledged
+        self.__eventHandler.set()
+        self.__ready = Future()
+        self.__ready.set_running_or_notify_cancel()
+        self.__isReady = False
+        self.__settings = [] #Futures waiting for the settings to be done
+        self.__settingsLock = threading.Lock()
+        self.__polling = None
+        self.__pollingTime = pollingTime #Last interval sent
+        self.__watchdog = None
         self.__timeout = TIMEOUT
+        self.__startup = {}
+        self.__messageQueue = MessageQueue()
+        self.__pump = MessagePump(self._next_message, self._message)
+        self.__stream = None
+        self.__cache = SettingsCache() #Display mode and hub analog output, restored by Reconnect
         if SIMULATION: self.InitializeSimulations()
-        self.BuildDeviceList()
+        if BUILD_DEVICE_LIST: self.BuildDeviceList()
+        self.__startup['Library'] = time.perf_counter() - start
         self.OpenConnection()
-        self.StartPolling(pollingTime)
-        time.sleep(0.5)
-        self.__messageQueue = MessageQueue()
+        self.__startup['Open'] = time.perf_counter() - start - self.__startup['Library']
         self.RegisterMessageCallback()
+        self.StartPolling(pollingTime)
+        if WAIT_READY:
+            self.WaitReady()
+            self._device_ready()
+
+    def _device_ready(self):
+        with self.__settingsLock:
+            if self.__isReady: return
+            total = time.perf_counter() - self.__start
+            self.__startup['Ready'] = total - self.__startup['Open'] - self.__startup['Library']
+            self.__startup['Total'] = total
+            self.__isReady = True
+        self.__ready.set_result(True)
 
     def _callback(self, p):
-        res = self.GetNextMessage()
-        #print(res, self.__messageQueue.get_status())
-        if self.__messageQueue.get_status() == [0, 2, 0]: #Settings properly done
-            print('OK')
+        self.__pump.drain()
+
+    def _next_message(self, msg_type, msg_id, msg_data):
+        return self.__lib.GetNextMessage(self.__serial, msg_type, msg_id, msg_data)
+
+    def _message(self, msg_type, msg_id, data, timestamp):
+        if not self.__isReady: self._device_ready()
+        if msg_type == 0 and msg_id == 2 and data == 0: #Settings properly done
             self.__eventHandler.set()
+            if self.__settings: self._settings_done()
+
+    def _settings_done(self):
+        with self.__settingsLock:
+            futures, self.__settings = self.__settings, []
+        for future in futures:
+            future.set_result(True)
+
+    def _settings_future(self):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.__settingsLock:
+            self.__settings.append(future)
+        return future
+
+    def _busy(self):
+        waiting = not self.__eventHandler.is_set()
+        return waiting or bool(self.__settings) or (self.__stream is not None and self.__stream.running())
+
+    def WaitReady(self, timeout = None):
+        """
+        Waits for the first message sent by the device after StartPolling.
+
+        :param timeout: float (in s). Defaults to TIMEOUT
+        :return: Boolean (True if the device is ready)
+        """
+        done, pending = wait([self.__ready], self.__timeout if timeout is None else timeout)
+        if pending:
+            Kinesis_Instrumentation.timeout('TLKinesisStrainGauge.WaitReady')
+            print('Timeout achieved. Device did not answer after polling started.')
+            return False
+        return True
+
+    def GetReadyFuture(self):
+        """
+
+        :return: Future resolved by the first message sent by the device after StartPolling
+        """
+        return self.__ready
+
+    def StartupTime(self):
+        """
+
+        :return: Dict (in s) with the time spent in each step of the constructor
+        """
+        return dict(self.__startup)
 
     def InitializeSimulations(self):
         """
 
         :return:
         """
-        return self.__InitializeSimulations()
+        return self.__lib.InitializeSimulations()
 
     def BuildDeviceList(self):
         """
 
         :return: Error Code
         """
-        return self._error_check(self.__BuildDeviceList())
+        return self._error_check(self.__lib.BuildDeviceList())
 
     def GetDeviceListSize(self):
         """
 
         :return: int16
         """
-        return self.__GetDeviceListSize()
+        return self.__lib.GetDeviceListSize()
 
     def CheckConnection(self):
         """
 
         :return: Boolean
         """
-        return self.__CheckConnection(self.__serial)
+        return self.__lib.CheckConnection(self.__serial)
 
     def OpenConnection(self):
         """
@@ -136,7 +221,7 @@ class TLKinesisStrainGauge():
         :return:
         Error Code
         """
-        return self._error_check(self.__Open(self.__serial))
+        return self._error_check(self.__lib.Open(self.__serial))
 
     def GetStatusBits(self, channel: int):
         """
@@ -144,28 +229,28 @@ class TLKinesisStrainGauge():
         :param channel: [1 - 4] for KIM101
         :return: DWORD (c_ulong)
         """
-        return self.__GetStatusBits(self.__serial, channel)
+        return self.__lib.GetStatusBits(self.__serial, channel)
 
     def MessageQueueSize(self):
         """
 
         :return: int
         """
-        return self.__MessageQueueSize(self.__serial)
+        return self.__lib.MessageQueueSize(self.__serial)
 
     def GetFirmwareVersion(self):
         """
 
         :return: DWORD (c_ulong)
         """
-        return self.__GetFirmwareVersion(self.__serial)
+        return self.__lib.GetFirmwareVersion(self.__serial)
 
     def PollingDuration(self):
         """
 
         :return: int64 (in ms)
         """
-        return self.__PollingDuration(self.__serial)
+        return self.__lib.PollingDuration(self.__serial)
 
     def StartPolling(self, time: int):
         """
@@ -173,27 +258,107 @@ class TLKinesisStrainGauge():
         :param time: int (in ms)
         :return: Boolean (True if successful)
         """
-        return self.__StartPolling(self.__serial, time)
+        self.__pollingTime = time
+        return self.__lib.StartPolling(self.__serial, time)
+
+    def SetAdaptivePolling(self, fast = 10, slow = 200, hold = 1.0):
+        """
+        Polls every fast ms while settings are pending or streaming and every slow ms once idle for hold s.
+
+        :param fast: int (in ms)
+        :param slow: int (in ms)
+        :param hold: float (in s)
+        :return: AdaptivePolling
+        """
+        self.StopAdaptivePolling()
+        self.__polling = AdaptivePolling(self.StartPolling, self._busy, fast, slow, hold)
+        self.__polling.start()
+        return self.__polling
+
+    def StopAdaptivePolling(self, time = None):
+        """
+
+        :param time: int (in ms). Constant polling interval afterwards, slow interval if None
+        :return: None
+        """
+        polling, self.__polling = self.__polling, None
+        if polling is not None: polling.stop(time)
+
+    def GetMessageRate(self, window = 1.0):
+        """
+
+        :param window: float (in s)
+        :return: float. Messages per second received from the device during the last window
+        """
+        return self.__pump.rate(window)
+
+    def Reconnect(self, timeout = None):
+        """
+        Opens the device again after it was lost and restores the message callback, the polling
+        and the settings (display mode, hub analog output).
+
+        :param timeout: float (in s). Wait for the first message, defaults to TIMEOUT
+        :return: Boolean (True once the device answers again)
+        """
+        count = self.__pump.count
+        self.__lib.BuildDeviceList()
+        if self.__lib.Open(self.__serial) not in (0, _ALREADY_OPEN): return False
+        self.RegisterMessageCallback()
+        self.StartPolling(self.__pollingTime)
+        self.__cache.invalidate()
+        self.__cache.flush(self._send_setting)
+        return wait_message(self.__pump, count, self.__timeout if timeout is None else timeout)
+
+    def StartWatchdog(self, interval = 0.25, silence = 2.0, on_incident = None):
+        """
+        Reconnects the device automatically when it is lost.
+
+        :param interval: float (in s). Time between checks
+        :param silence: float (in s). Time without message meaning the device is lost
+        :param on_incident: callable(Dict) called after each reconnection
+        :return: ConnectionWatchdog
+        """
+        self.StopWatchdog()
+        self.__watchdog = ConnectionWatchdog(self, interval, silence, on_incident = on_incident)
+        self.__watchdog.start()
+        return self.__watchdog
+
+    def StopWatchdog(self):
+        watchdog, self.__watchdog = self.__watchdog, None
+        if watchdog is not None: watchdog.stop()
 
     def RegisterMessageCallback(self):
-        self.__RegisterMessageCallback(self.__serial, self.__fn)
+        self.__lib.RegisterMessageCallback(self.__serial, self.__fn)
 
     def GetNextMessage(self):
         """
 
         :return: Boolean (True if successful)
         """
-        res = self.__GetNextMessage(self.__serial, self.__messageQueue.msg_type, self.__messageQueue.msg_id,
-                                    self.__messageQueue.msg_data)
+        res = self.__lib.GetNextMessage(self.__serial, self.__messageQueue.msg_type, self.__messageQueue.msg_id,
+                                        self.__messageQueue.msg_data)
         return res
 
-    def GetHardwareInfoBlock(self):
+    def GetMessagePump(self):
+        """
+        Ring buffer of the last messages, with subscribe/unsubscribe, read and history.
+
+        :return: MessagePump
         """
+        return self.__pump
 
+    def GetHardwareInfoBlock(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the hardware information cache
         :return: Dict
         """
         value = TLI_HardwareInformation()
-        self._error_check(self.__GetHardwareInfoBlock(self.__serial, value))
+        cached = None if refresh else hardware_cache.get(self.__hardwareKey, 'HardwareInfoBlock')
+        if cached is not None and len(cached) == 2 * sizeof(value):
+            value = TLI_HardwareInformation.from_buffer_copy(bytes.fromhex(cached))
+        elif not self._error_check(self.__lib.GetHardwareInfoBlock(self.__serial, value)):
+            hardware_cache.put(self.__hardwareKey, 'HardwareInfoBlock', bytes(value).hex())
         dict = {
             "Serial Number": value.serialNumber,
             "Model Number": value.modelNumber,
@@ -208,37 +373,242 @@ class TLKinesisStrainGauge():
         return dict
 
     def SetZero(self):
-        return self._error_check(self.__SetZero(self.__serial))
+        return self._error_check(self.__lib.SetZero(self.__serial))
 
-    def SetDisplayMode(self, mode):
+    def SetDisplayMode(self, mode, force = False):
         """
 
         :param mode:
             1 => Position
             2 => Voltage
             3 => Force
-        :return:
+        :param force: Boolean. Sends the mode even if it is the current one
+        :return: Error Code
         """
-        self.__eventHandler.clear()
         assert (mode == 1 or mode == 2 or mode == 3)
-        return self._error_check(self.__SetDisplayMode(self.__serial, mode))
+        if not self.__cache.request('DisplayMode', mode, force): return 0
+        self.__eventHandler.clear()
+        if self.__polling is not None: self.__polling.kick()
+        error = self._error_check(self.__lib.SetDisplayMode(self.__serial, mode))
+        self.__cache.written('DisplayMode', mode, not error)
+        if error: self.__eventHandler.set() #Nothing to acknowledge
+        return error
 
-    def GetReadingExt(self, clip):
+    def GetDisplayMode(self):
+        """
+
+        :return: int. Last display mode sent, None if unknown
+        """
+        return self.__cache.get('DisplayMode')
+
+    def SetDisplayModeAsync(self, mode):
+        """
+        Non blocking SetDisplayMode.
+
+        :param mode: 1 => Position, 2 => Voltage, 3 => Force
+        :return: Future resolved with True when the device acknowledges the settings
+        """
+        if not self.__cache.changed('DisplayMode', mode):
+            future = Future()
+            future.set_running_or_notify_cancel()
+            with self.__settingsLock:
+                if not self.__eventHandler.is_set(): #Acknowledgement still pending
+                    self.__settings.append(future)
+                    return future
+            future.set_result(True)
+            return future
+        future = self._settings_future()
+        if self.SetDisplayMode(mode):
+            with self.__settingsLock:
+                if future in self.__settings: self.__settings.remove(future)
+            future.set_result(False)
+        return future
+
+    def GetReadingExt(self, clip, wait = True):
+        """
+
+        :param clip: Boolean
+        :param wait: Boolean. Waits until the last settings are done
+        :return: (int, c_bool overrange)
+        """
         overrange = c_bool(1)
-        if not self.__eventHandler.wait(self.__timeout): #Must wait until the settings is properly done
+        if wait and not self.__eventHandler.wait(self.__timeout): #Must wait until the settings is properly done
+            Kinesis_Instrumentation.timeout('TLKinesisStrainGauge.GetReadingExt')
             print('Timeout achieved. Updating position to the current position.')
-        response = self.__GetReadingExt(self.__serial, clip, overrange)
+        response = self.__lib.GetReadingExt(self.__serial, clip, overrange)
         return (response, overrange)
 
-    def GetMaximumTravel(self):
-        return self.__GetMaximumTravel(self.__serial)
+    def ReadQuantities(self, quantities = ('position', 'voltage', 'force'), samples = 1, cycles = 1, clip = False):
+        """
+        Reads several quantities per cycle with as few display mode changes as possible: the
+        quantities are read in groups of samples readings, starting with the current mode and
+        going back and forth, so the last group of a cycle is the first one of the next.
+
+        :param quantities: names ('position', 'voltage', 'force') or display modes
+        :param samples: int or Dict quantity => int. Readings averaged per quantity and cycle
+        :param cycles: int
+        :param clip: Boolean
+        :return: numpy structured array, one record per cycle with timestamp, each quantity
+        and its overrange flag
+        """
+        names = {mode: name for name, mode in DISPLAY_MODES.items()}
+        modes = [DISPLAY_MODES[x] if x in DISPLAY_MODES else x for x in quantities]
+        if not isinstance(samples, dict): samples = {mode: samples for mode in modes}
+        samples = {DISPLAY_MODES[x] if x in DISPLAY_MODES else x: n for x, n in samples.items()}
+        current = self.__cache.get('DisplayMode')
+        if current in modes: #Start with the current mode
+            modes.remove(current)
+            modes.insert(0, current)
+        dtype = [('timestamp', 'f8')] + [field for mode in modes for field in
+                                         ((names[mode], 'f8'), (names[mode] + '_overrange', '?'))]
+        records = numpy.zeros(cycles, dtype = dtype)
+        for cycle in range(cycles):
+            record = records[cycle]
+            for mode in (modes if cycle % 2 == 0 else modes[::-1]):
+                self.SetDisplayMode(mode)
+                total, overrange = 0, False
+                for x in range(samples[mode]):
+                    value, over = self.GetReadingExt(clip)
+                    total += value
+                    overrange |= over.value
+                record[names[mode]] = total / samples[mode]
+                record[names[mode] + '_overrange'] = overrange
+            record['timestamp'] = time.perf_counter()
+        return records
+
+    def StartStreaming(self, rate = 1000.0, size = 100000, clip = False):
+        """
+        Samples GetReadingExt in a background thread. Waits for the last settings once, not per sample.
+
+        :param rate: float (in Hz). As fast as possible if None
+        :param size: int. Number of samples kept in the ring buffer
+        :param clip: Boolean
+        :return: StrainGaugeStream (latest, blocks, stats)
+        """
+        self.StopStreaming()
+        if not self.__eventHandler.wait(self.__timeout):
+            Kinesis_Instrumentation.timeout('TLKinesisStrainGauge.StartStreaming')
+            print('Timeout achieved. Streaming with the current settings.')
+        serial = self.__serial
+        function = self.__lib.GetReadingExt
+        self.__stream = StrainGaugeStream(lambda overrange: function(serial, clip, overrange), rate, size)
+        self.__stream.start()
+        if self.__polling is not None: self.__polling.kick()
+        return self.__stream
+
+    def StartStatistics(self, rate = 1000.0, window = 10000, factor = 100, mode = 'mean', clip = False, sink = None):
+        """
+        Streams the readings into running statistics and a decimated trace, in constant memory.
+
+        :param rate: float (in Hz). Sampling rate
+        :param window: int. Samples of the windowed statistics
+        :param factor: int. Decimation factor of the trace
+        :param mode: 'mean' (block average) or 'cic'
+        :param clip: Boolean
+        :param sink: callable(timestamps, readings) called with every decimated chunk
+        :return: ReadingStatistics (summary, trace). StopStreaming ends it
+        """
+        stream = self.StartStreaming(rate, max(10 * window, 100000), clip)
+        return ReadingStatistics(stream, window, factor, mode, sink = sink)
+
+    def StopStreaming(self):
+        """
 
-    def GetForceCalib(self):
-        return self.__GetForceCalib(self.__serial)
+        :return: StrainGaugeStream or None
+        """
+        if self.__stream is not None: self.__stream.stop()
+        return self.__stream
 
-    def GetHubAnalogOutput(self):
-        return self.__GetHubAnalogOutput(self.__serial)
+    def GetMaximumTravel(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the hardware information cache
+        :return: int (in 100 nm)
+        """
+        value = None if refresh else hardware_cache.get(self.__hardwareKey, 'MaximumTravel')
+        if value is None:
+            value = self.__lib.GetMaximumTravel(self.__serial)
+            if value: hardware_cache.put(self.__hardwareKey, 'MaximumTravel', value) #0 if the device did not answer
+        return value
 
-    def SetHubAnalogOutput(self, mode):
+    def GetForceCalib(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the hardware information cache
+        :return: int
+        """
+        value = None if refresh else hardware_cache.get(self.__hardwareKey, 'ForceCalib')
+        if value is None:
+            value = self.__lib.GetForceCalib(self.__serial)
+            if value: hardware_cache.put(self.__hardwareKey, 'ForceCalib', value)
+        return value
+
+    def GetHubAnalogOutput(self, refresh = False):
+        """
+
+        :param refresh: Boolean. Queries the device instead of the settings cache
+        :return: int
+        """
+        if refresh or not self.__cache.known('HubAnalogOutput'):
+            return self.__cache.read('HubAnalogOutput', self.__lib.GetHubAnalogOutput(self.__serial))
+        return self.__cache.get('HubAnalogOutput')
+
+    def SetHubAnalogOutput(self, mode, force = False):
+        """
+
+        :param mode: 1 or 2
+        :param force: Boolean. Sends the mode even if it is the current one
+        :return: Error Code
+        """
         assert (mode == 1 or mode == 2)
-        return self._error_check(self.__SetHubAnalogOutput(self.__serial, mode))
\ No newline at end of file
+        if not self.__cache.request('HubAnalogOutput', mode, force): return 0
+        error = self._error_check(self.__lib.SetHubAnalogOutput(self.__serial, mode))
+        self.__cache.written('HubAnalogOutput', mode, not error)
+        return error
+
+    def _send_setting(self, key, value):
+        if key == 'DisplayMode': self.SetDisplayMode(value, force = True)
+        elif key == 'HubAnalogOutput': self.SetHubAnalogOutput(value, force = True)
+        else: raise ValueError(f'Unknown setting {key}.')
+
+    def GetSettings(self, read = False):
+        """
+
+        :param read: Boolean. Reads the hub analog output from the device first (the display mode
+        cannot be read)
+        :return: Dict (setting => value), for ApplySettings or SaveProfile
+        """
+        if read: self.GetHubAnalogOutput(refresh = True)
+        return self.__cache.snapshot()
+
+    def ApplySettings(self, settings, force = False):
+        """
+        Sends the settings the device does not have already.
+
+        :param settings: Dict (GetSettings)
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.__cache.apply(settings, self._send_setting, force)
+
+    def SaveProfile(self, name, path = None):
+        """
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :return: Dict. Settings saved
+        """
+        settings = self.GetSettings()
+        save_profile(name, settings, path)
+        return settings
+
+    def LoadProfile(self, name, path = None, force = False):
+        """
+        Applies a profile saved with SaveProfile, sending only the settings that differ.
+
+        :param name: str
+        :param path: str. Profile file, profiles.json of KINESIS_CACHE (~/.kinesis) if None
+        :param force: Boolean. Sends all of them
+        :return: int. Number of settings sent
+        """
+        return self.ApplySettings(load_profile(name, path), force)
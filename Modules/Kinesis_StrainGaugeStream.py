@@ -0,0 +1,120 @@
+"""
+Background acquisition of strain gauge readings into a NumPy ring buffer.
+
+The ring is written twice (slot i and i + size), so the latest N samples and every
+block handed to consumers are contiguous views of the buffer, never copies.
+Views stay valid until the sampler wraps around them (size samples later).
+"""
+
+from ctypes import c_bool
+
+import numpy
+import threading, time
+
+STREAM_DTYPE = numpy.dtype([('timestamp', 'f8'), ('reading', 'i4'), ('overrange', '?')])
+
+class StrainGaugeStream():
+
+    def __init__(self, read, rate = 1000.0, size = 100000):
+        """
+
+        :param read: callable(overrange) returning the reading and filling the c_bool overrange
+        :param rate: float (in Hz). Samples as fast as possible if None
+        :param size: int. Number of samples kept
+        """
+        self.rate = rate
+        self.size = size
+        self.buffer = numpy.zeros(2 * size, dtype = STREAM_DTYPE)
+        self.count = 0 #Samples acquired since start
+        self.missed = 0 #Times the sampler fell more than one period behind
+        self.__read = read
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__start = None
+        self.__end = None
+
+    def start(self):
+        if self.running(): return
+        self.__stop.clear()
+        self.__end = None
+        self.__thread = threading.Thread(target = self._run, name = 'Strain gauge stream', daemon = True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None: self.__thread.join()
+
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def _run(self):
+        read = self.__read
+        buffer = self.buffer
+        size = self.size
+        overrange = c_bool(False)
+        period = 1.0 / self.rate if self.rate else 0.0
+        clock = time.perf_counter
+        self.__start = deadline = clock()
+        while not self.__stop.is_set():
+            value = read(overrange)
+            now = clock()
+            index = self.count % size
+            buffer[index] = buffer[index + size] = (now, value, overrange.value)
+            self.count += 1
+            if period:
+                deadline += period
+                delay = deadline - clock()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -period:
+                    self.missed += 1
+                    deadline = clock()
+        self.__end = clock()
+
+    def latest(self, n):
+        """
+
+        :param n: int
+        :return: structured array view (timestamp, reading, overrange) of the last n samples, oldest first
+        """
+        count = self.count
+        n = min(n, count, self.size)
+        index = count % self.size + self.size
+        return self.buffer[index - n:index]
+
+    def blocks(self, block_size, timeout = None):
+        """
+        Yields consecutive blocks of new samples until the stream stops.
+
+        :param block_size: int (<= size)
+        :param timeout: float (in s). Stops when no block arrives in this time
+        :return: generator of structured array views of block_size samples
+        """
+        assert 0 < block_size <= self.size
+        cursor = self.count
+        waited = 0.0
+        while True:
+            available = self.count - cursor
+            if available > self.size - block_size: #Consumer too slow, oldest samples overwritten
+                cursor = self.count - (self.size - block_size)
+                available = self.count - cursor
+            if available < block_size:
+                if not self.running() or (timeout is not None and waited > timeout): return
+                delay = (block_size - available) / self.rate if self.rate else 0.001
+                time.sleep(delay)
+                waited += delay
+                continue
+            waited = 0.0
+            index = cursor % self.size
+            yield self.buffer[index:index + block_size]
+            cursor += block_size
+
+    def stats(self):
+        """
+
+        :return: Dict
+        """
+        if self.__start is None: return {"Samples": 0, "Missed": 0, "Rate": 0.0}
+        elapsed = (self.__end or time.perf_counter()) - self.__start
+        return {"Samples": self.count, "Missed": self.missed,
+                "Rate": self.count / elapsed if elapsed > 0 else 0.0}
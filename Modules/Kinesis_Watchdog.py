@@ -0,0 +1,149 @@
+"""
+Connection watchdog of the K-Cube drivers.
+
+A thread checks the device every interval: CheckConnection, and the number of messages
+received (polling sends one status message per interval, so no message for `silence` s
+means the device is gone even if the DLL still lists it). When the device is lost it calls
+the driver's Reconnect (open again, callback, polling, cached settings) until it answers,
+retrying every `retry` s (doubled up to 0.5 s), and records the incident:
+
+    >>> watchdog = my_motor.StartWatchdog(on_incident=print)
+    >>> ... #Unplug and plug the cube
+    >>> watchdog.incidents()
+    [{'Reason': 'Connection lost', 'Downtime': 1.52, 'Detection': 0.21, 'Recovery': 1.31, 'Attempts': 6, ...}]
+
+Downtime is counted from the last message received before the incident to the first one
+after the reconnection.
+"""
+
+import threading, time
+
+def wait_message(pump, count, timeout):
+    """
+    Waits for a message after count messages were received.
+
+    :param pump: MessagePump
+    :param count: int. pump.count before
+    :param timeout: float (in s)
+    :return: Boolean (True if a message came)
+    """
+    deadline = time.perf_counter() + timeout
+    while pump.count == count:
+        if time.perf_counter() > deadline: return False
+        time.sleep(0.005)
+    return True
+
+def last_message_time(pump):
+    """
+
+    :return: float. perf_counter time of the last message, None if none
+    """
+    count = pump.count
+    return pump.buffer[(count - 1) % pump.size].timestamp if count else None
+
+
+class ConnectionWatchdog():
+
+    def __init__(self, driver, interval = 0.25, silence = 2.0, retry = 0.1, on_incident = None):
+        """
+
+        :param driver: TLKinesisInertialMotor, TLKinesisStrainGauge or TLKinesisPiezoDriver
+        :param interval: float (in s). Time between checks
+        :param silence: float (in s). Time without message meaning the device is lost, None to only
+        use CheckConnection. Must be longer than the polling interval
+        :param retry: float (in s). First delay between reconnection attempts, doubled up to 0.5 s
+        :param on_incident: callable(Dict) called after each reconnection
+        """
+        self.driver = driver
+        self.interval = interval
+        self.silence = silence
+        self.retry = retry
+        self.on_incident = on_incident
+        self.__pump = driver.GetMessagePump()
+        self.__incidents = []
+        self.__recovering = None #Incident in progress
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.running(): return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target = self._run, name = 'Kinesis watchdog', daemon = True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None and self.__thread is not threading.current_thread(): self.__thread.join()
+
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def check(self):
+        """
+
+        :return: str. Reason the device is considered lost, None if it is fine
+        """
+        if not self.driver.CheckConnection(): return 'Connection lost'
+        if self.silence is not None:
+            last = last_message_time(self.__pump)
+            if last is not None and time.perf_counter() - last > self.silence: return 'No message'
+        return None
+
+    def _run(self):
+        while not self.__stop.wait(self.interval):
+            reason = self.check()
+            if reason is not None: self._recover(reason)
+
+    def _recover(self, reason):
+        detected = time.perf_counter()
+        last = last_message_time(self.__pump)
+        incident = {"Reason": reason, "Attempts": 0, "Restored": False}
+        with self.__lock:
+            self.__recovering = incident
+        print(f'Device lost ({reason}). Reconnecting.')
+        delay, restored = self.retry, None
+        while not self.__stop.is_set():
+            incident["Attempts"] += 1
+            if self.driver.Reconnect():
+                restored = last_message_time(self.__pump)
+                break
+            if self.__stop.wait(delay): break
+            delay = min(2 * delay, 0.5)
+        now = time.perf_counter()
+        lost = last if last is not None else detected
+        incident.update({"Restored": restored is not None, "Detection": detected - lost,
+                         "Recovery": (restored if restored is not None else now) - detected,
+                         "Downtime": (restored if restored is not None else now) - lost,
+                         "Time": time.time() - (now - lost)})
+        with self.__lock:
+            self.__recovering = None
+            self.__incidents.append(incident)
+        if incident["Restored"]: print(f'Device back after {incident["Downtime"]:.3f} s.')
+        if self.on_incident is not None: self.on_incident(dict(incident))
+
+    def recovering(self):
+        """
+
+        :return: Boolean (True while the device is being reconnected)
+        """
+        return self.__recovering is not None
+
+    def incidents(self):
+        """
+
+        :return: list of Dict, in s (Time is the epoch time the device was lost)
+        """
+        with self.__lock:
+            return [dict(x) for x in self.__incidents]
+
+    def stats(self):
+        """
+
+        :return: Dict. Times in s
+        """
+        incidents = self.incidents()
+        downtimes = [x["Downtime"] for x in incidents]
+        return {"Incidents": len(incidents), "Failed": sum(not x["Restored"] for x in incidents),
+                "Total downtime": sum(downtimes), "Max downtime": max(downtimes, default = 0.0),
+                "Recovering": self.recovering()}
@@ -0,0 +1,86 @@
+"""
+Waveforms for the KPZ101 look-up table.
+
+The generators return float arrays in fraction of full scale (0 to 1, or -1 to 1 for
+bipolar voltages); to_counts converts them to the device units of SetOutputVoltage,
+SetPosition and SetLUTwaveSample.
+
+    >>> wave = Kinesis_Waveform.sine(1000, low=0.2, high=0.8)
+    >>> my_piezo.UploadLUTwave(Kinesis_Waveform.to_counts(wave), LUTValueDelay=1)
+    >>> my_piezo.StartLUTwave() #1 Hz scan played by the device
+"""
+
+from Modules.Kinesis_PiezoDriver import LUT_SIZE, MAX_SETPOINT
+
+import numpy
+
+def _phase(samples, cycles, phase):
+    #Phase in cycles of each sample, cycles periods over the table.
+    return numpy.arange(samples) * cycles / samples + phase
+
+def sine(samples, low = 0.0, high = 1.0, cycles = 1, phase = 0.0):
+    """
+
+    :param samples: int. Table length
+    :param low: float. Minimum, fraction of full scale
+    :param high: float. Maximum, fraction of full scale
+    :param cycles: int. Periods in the table
+    :param phase: float (in cycles)
+    :return: float array
+    """
+    return low + (high - low) * (1 - numpy.cos(2 * numpy.pi * _phase(samples, cycles, phase))) / 2
+
+def triangle(samples, low = 0.0, high = 1.0, cycles = 1, phase = 0.0, symmetry = 0.5):
+    """
+
+    :param symmetry: float (0 to 1). Fraction of the period going up, 1 => sawtooth
+    :return: float array, starts at low
+    """
+    x = numpy.mod(_phase(samples, cycles, phase), 1.0)
+    if symmetry >= 1: y = x
+    elif symmetry <= 0: y = 1 - x
+    else: y = numpy.where(x < symmetry, x / symmetry, (1 - x) / (1 - symmetry))
+    return low + (high - low) * y
+
+def sawtooth(samples, low = 0.0, high = 1.0, cycles = 1, phase = 0.0):
+    return triangle(samples, low, high, cycles, phase, symmetry = 1.0)
+
+def arbitrary(values, samples = None, times = None):
+    """
+    Resamples any waveform on the table (linear interpolation over one period).
+
+    :param values: sequence of floats, fraction of full scale
+    :param samples: int. Table length, len(values) if None
+    :param times: sequence of increasing times of values over [0, 1), evenly spaced if None
+    :return: float array
+    """
+    values = numpy.asarray(values, dtype = float)
+    if samples is None: samples = len(values)
+    if times is None: times = numpy.arange(len(values)) / len(values)
+    times = numpy.asarray(times, dtype = float)
+    #Periodic: the last point goes back to the first one.
+    return numpy.interp(numpy.arange(samples) / samples, numpy.append(times, 1.0), numpy.append(values, values[0]))
+
+def samples_for(period, delay = 1, maximum = LUT_SIZE):
+    """
+
+    :param period: float (in s). Waveform period
+    :param delay: int (in ms). LUTValueDelay
+    :param maximum: int. Table size
+    :return: int. Table length giving period with delay
+    """
+    samples = int(round(period * 1000 / delay))
+    if not 0 < samples <= maximum: raise ValueError(f'{period} s needs {samples} samples of {delay} ms.')
+    return samples
+
+def to_counts(waveform, bipolar = False):
+    """
+
+    :param waveform: float array, fraction of full scale
+    :param bipolar: Boolean. Allows negative output voltages (-1 to 1)
+    :return: int array in [0, MAX_SETPOINT] ([-MAX_SETPOINT, MAX_SETPOINT] if bipolar)
+    """
+    low = -1.0 if bipolar else 0.0
+    counts = numpy.rint(numpy.clip(waveform, low, 1.0) * MAX_SETPOINT).astype(numpy.int32)
+    if len(counts) > LUT_SIZE: raise ValueError(f'{len(counts)} samples, the table has {LUT_SIZE}.')
+    return counts
@@ -0,0 +1,26 @@
+from enum import Enum, unique
+
+@unique
+class MESSAGE_TYPE(Enum):
+    #Message type (first value returned by GetNextMessage).
+    GenericDevice = 0x00
+    GenericPiezo = 0x01
+    GenericMotor = 0x02
+    GenericDCMotor = 0x03
+    GenericSimpleMotor = 0x04
+
+@unique
+class GENERIC_DEVICE_MSG(Enum):
+    #Message id for the GenericDevice type.
+    SettingsInitialized = 0x00
+    SettingsUpdated = 0x01
+    SettingsDone = 0x02 #Answer to a settings request (e.g. SetDisplayMode)
+    Close = 0x03
+
+@unique
+class GENERIC_MOTOR_MSG(Enum):
+    #Message id for the GenericMotor type. Data is the channel.
+    Homed = 0x00
+    Moved = 0x01
+    Stopped = 0x02
+    LimitUpdated = 0x03
@@ -1,4 +1,27 @@
 from Modules import Kinesis_PiezoDriver
 
 my_piezo = Kinesis_PiezoDriver.TLKinesisPiezoDriver('29000001', pollingTime=100, TIMEOUT=5.0, SIMULATION = True)
-print(my_piezo.CheckConnection())
\ No newline at end of file
+print(my_piezo.CheckConnection())
+
+"""
+Setpoints and periodic scans from the device look-up table: a 0.2 s sine between 10 % and 90 % of the
+maximum voltage, played by the KPZ101 until StopLUTwave.
+"""
+from Modules import Kinesis_Waveform
+
+my_piezo.SetOutputVoltage(16384)
+print(my_piezo.GetOutputVoltage())
+wave = Kinesis_Waveform.sine(Kinesis_Waveform.samples_for(0.2, delay=1), low=0.1, high=0.9)
+my_piezo.UploadLUTwave(Kinesis_Waveform.to_counts(wave), LUTValueDelay=1)
+my_piezo.StartLUTwave()
+my_piezo.StopLUTwave()
+
+"""
+Host computed trajectory at 1 kHz, sent against absolute deadlines.
+"""
+import numpy
+
+t = numpy.arange(0, 0.5, 0.001)
+streamer = my_piezo.StreamSetpoints(numpy.column_stack([t, 16384 + 8000 * numpy.sin(2 * numpy.pi * 5 * t)]))
+streamer.wait()
+print(streamer.stats())
@@ -0,0 +1,32 @@
+from Modules import Kinesis_InertialMotor, Kinesis_Replay
+import os, tempfile
+
+"""
+Captures a session with the inertial motor to a trace, then replays the trace without the device,
+10 times faster, and checks that the same session gives the same results.
+The capture must be started before the controller is opened.
+"""
+path = os.path.join(tempfile.gettempdir(), 'session.ktrace')
+
+def session():
+    my_piezo = Kinesis_InertialMotor.TLKinesisInertialMotor('97101311', pollingTime=100, TIMEOUT=1.5)
+    moves = [my_piezo.MoveAbsoluteAsync(x+1, 100 * (x+1)) for x in range(4)]
+    results = [move.result(timeout=15) for move in moves]
+    moves = [my_piezo.MoveAbsoluteAsync(x+1, 0) for x in range(4)] #Ends on the futures of the last moves
+    results += [move.result(timeout=15) for move in moves]
+    return results, my_piezo.GetCurrentPositionAll()
+
+capture = Kinesis_Replay.Capture(path)
+recorded = session()
+capture.close()
+print(f'{capture.calls} calls and {capture.callbacks} callbacks captured')
+
+"""
+Same session on the 'replay' backend.
+"""
+player = Kinesis_Replay.replay(path, speed=10)
+replayed = session()
+print(player.stats())
+print(recorded)
+print(replayed)
+assert replayed == recorded
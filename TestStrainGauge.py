@@ -26,3 +26,17 @@ print(voltage)
 my_piezo.SetDisplayMode(3)
 force = my_piezo.GetReadingExt(False)
 print(force)
+
+records = my_piezo.ReadQuantities(('position', 'voltage', 'force'), samples=1, cycles=3)
+print(records)
+
+
+"""
+Long runs: running and windowed statistics plus a trace decimated by 100, in constant memory.
+"""
+import time
+
+stats = my_piezo.StartStatistics(rate=1000, window=10000, factor=100)
+time.sleep(1)
+my_piezo.StopStreaming()
+print(stats.summary())
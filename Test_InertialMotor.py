@@ -30,3 +30,20 @@ my_piezo.SetDriveOPParameters(1, 112, 500, 1000)
 [my_piezo.MoveAbsolute(x+1, 0) for x in range(4)]
 my_piezo.UpdatePosition()
 
+
+"""
+Non blocking moves return a Future per channel. The four channels move at the same time.
+"""
+moves = [my_piezo.MoveRelativeAsync(x+1, val) for x in range(4)]
+print([move.result() for move in moves])
+moves = [my_piezo.MoveAbsoluteAsync(x+1, 0) for x in range(4)]
+print([move.result() for move in moves])
+
+
+"""
+Bursts of small relative steps (joystick). Jog returns at once, the steps sent while the channel moves
+are merged into a single move.
+"""
+[my_piezo.Jog(1, 5) for x in range(50)]
+my_piezo.GetJogQueue().Flush()
+print(my_piezo.GetJogQueue().stats)
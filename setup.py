@@ -10,5 +10,6 @@ setup(
     data_files=[('dlls', [
         'dlls/Thorlabs.MotionControl.DeviceManager.dll',
         'dlls/Thorlabs.MotionControl.KCube.InertialMotor.dll'])],
+    install_requires=['numpy'],
     python_requires='>=3.8.5',
 )
\ No newline at end of file